@@ -1,107 +1,89 @@
-import ijson
+"""
+Builds the msgpack barrels from the PDF and HTML inverted indexes.
+
+Both inverted indexes are JSON arrays with one posting list per lexicon word,
+in word id order. They are streamed side by side, the posting lists of a word
+are merged (PDF first) and encoded to msgpack exactly once. The encoded size
+decides when a barrel is full and the encoded bytes are what ends up in the
+barrel, so no JSON barrels and no barrel_format_converter.py pass are needed
+any more. barrels_index.json plus barrels_manifest.json (size and sha256 of
+every barrel) are written at the end of the same pass. The build runs in one
+process: streaming the inverted indexes with ijson is nearly all of its time,
+and that cannot be split across processes.
+
+With --layout, the words of every barrel come from a layout made by
+barrel_planner.py instead of the sequential cut.
+
+Usage:
+    python Barrels.py [--barrel-size-mb 45] [--layout barrel_layout.json]
+    python Barrels.py --verify
+"""
+
+import argparse
 import json
 import os
+import sys
 
-# === Input files ===
-pdf_index_file = r"..\Inverted Index\JsonBatches\inverted_index_dropped_keys_json.json"
-html_index_file = r"..\Inverted Index\inverted_index_dropped_keys.json"
-current_lexicon_file = r"..\Lexicon\lexicons_ids.json"
-
-# === Output directory ===
-parent_barrels_folder = "..\\Barrels"
-os.makedirs(parent_barrels_folder, exist_ok=True)
-new_lexicon_file = os.path.join(parent_barrels_folder, "barrels_index.json")
-
-# === Barrel size limit (approximate in MB) ===
-BARREL_SIZE_MB = 45
-BARREL_SIZE_BYTES = BARREL_SIZE_MB * 1024 * 1024
-
-# ================== FUNCTIONS ==================
-def estimate_size_in_bytes(obj):
-    return len(json.dumps(obj).encode('utf-8'))
-
-# ================== LOAD CURRENT LEXICON ==================
-with open(current_lexicon_file, 'r', encoding='utf-8') as f:
-    old_lexicon = json.load(f)
-
-# Sort words by wordid to match inverted index order
-words_sorted = sorted(old_lexicon.items(), key=lambda x: x[1])  # (word, wordid)
-
-# ================== OPEN STREAMS ==================
-pdf_f = open(pdf_index_file, 'rb')
-html_f = open(html_index_file, 'rb')
-pdf_stream = ijson.items(pdf_f, 'item')
-html_stream = ijson.items(html_f, 'item')
-
-# ================== INITIALIZE ==================
-current_barrel = []
-current_barrel_size = 0
-barrel_number = 0
-new_lexicon = {}
-
-# ================== PROCESS ==================
-try:
-    for word, wordid in words_sorted:
-        # Get postings from both indexes
-        try:
-            pdf_obj = next(pdf_stream)
-        except StopIteration:
-            pdf_obj = []
-
-        try:
-            html_obj = next(html_stream)
-        except StopIteration:
-            html_obj = []
-
-        # Merge postings (PDF first)
-        merged_postings = pdf_obj + html_obj
-
-        # Record offset inside barrel
-        offset_in_barrel = len(current_barrel)
-        new_lexicon[word] = [barrel_number, offset_in_barrel]
-
-        # Estimate size of this word
-        word_size = estimate_size_in_bytes(merged_postings)
-
-        # Check if adding this word exceeds barrel size
-        if current_barrel_size + word_size >= BARREL_SIZE_BYTES:
-            # Write current barrel to disk
-            barrel_file_path = os.path.join(parent_barrels_folder, f"{barrel_number}.json")
-            with open(barrel_file_path, 'w', encoding='utf-8') as bf:
-                json.dump(current_barrel, bf, separators=(',', ':'))
-            print(
-                f"Written {barrel_number}.json with {len(current_barrel)} words (~{current_barrel_size / 1024 / 1024:.2f} MB)")
-
-            # Start a new barrel
-            barrel_number += 1
-            current_barrel = []
-            current_barrel_size = 0
-            offset_in_barrel = 0  # reset offset in new barrel
-            new_lexicon[word] = [barrel_number, offset_in_barrel]
-
-        # Add the word to the current barrel
-        current_barrel.append(merged_postings)
-        current_barrel_size += word_size
-
-
-        # Print the wordid just appended
-        print(f"Appended wordid {wordid} to {barrel_number}.json")
-
-finally:
-    pdf_f.close()
-    html_f.close()
-
-
-# Write the last barrel if it has any words
-if current_barrel:
-    barrel_file_path = os.path.join(parent_barrels_folder, f"{barrel_number}.json")
-    with open(barrel_file_path, 'w', encoding='utf-8') as bf:
-        json.dump(current_barrel, bf)
-    print(f"Written final {barrel_number}.json with {len(current_barrel)} words (~{current_barrel_size/1024/1024:.2f} MB)")
-
-# Write new lexicon to disk
-with open(new_lexicon_file, 'w', encoding='utf-8') as lf:
-    json.dump(new_lexicon, lf, indent=2, ensure_ascii=False)
-
-print(f"New lexicon saved to {new_lexicon_file}")
-print(f"Total barrels created: {barrel_number + 1}")
+import ijson
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from barrel_writer import BARREL_SIZE_MB, BarrelWriter, PlannedBarrelWriter, verify_barrels
+
+PDF_INDEX_FILE = os.path.join("..", "Inverted Index", "JsonBatches", "inverted_index_dropped_keys_json.json")
+HTML_INDEX_FILE = os.path.join("..", "Inverted Index", "inverted_index_dropped_keys.json")
+LEXICON_FILE = os.path.join("..", "Lexicon", "lexicons_ids.json")
+BARRELS_DIR = os.path.join("..", "Barrels")
+
+
+def merged_postings(words_sorted, pdf_index_file, html_index_file):
+    """Yield (word, postings) in word id order, PDF postings before HTML postings."""
+    with open(pdf_index_file, 'rb') as pdf_f, open(html_index_file, 'rb') as html_f:
+        pdf_stream = ijson.items(pdf_f, 'item', use_float=True)
+        html_stream = ijson.items(html_f, 'item', use_float=True)
+        for word, _ in words_sorted:
+            yield word, next(pdf_stream, []) + next(html_stream, [])
+
+
+def build_barrels(barrel_size_mb=BARREL_SIZE_MB, layout_file=None):
+    with open(LEXICON_FILE, 'r', encoding='utf-8') as f:
+        lexicon = json.load(f)
+    # Sort words by word id to match the inverted index order
+    words_sorted = sorted(lexicon.items(), key=lambda x: x[1])
+    del lexicon
+
+    if layout_file:
+        with open(layout_file, 'r', encoding='utf-8') as f:
+            layout = json.load(f)
+        writer = PlannedBarrelWriter(BARRELS_DIR, layout, barrel_size_mb=barrel_size_mb)
+    else:
+        writer = BarrelWriter(BARRELS_DIR, barrel_size_mb)
+    for word, postings in tqdm(merged_postings(words_sorted, PDF_INDEX_FILE, HTML_INDEX_FILE),
+                               total=len(words_sorted), desc="Writing barrels", unit="words"):
+        writer.add(word, postings)
+    barrel_count = writer.close()
+
+    print(f"Total barrels created: {barrel_count}")
+    print(f"Barrels index saved to {writer.index_path}")
+    print(f"Checksums saved to {writer.manifest_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build msgpack barrels from the inverted indexes.")
+    parser.add_argument("--barrel-size-mb", type=float, default=BARREL_SIZE_MB)
+    parser.add_argument("--layout", default=None, help="barrel layout from barrel_planner.py")
+    parser.add_argument("--verify", action="store_true", help="check the barrels against their manifest")
+    args = parser.parse_args()
+
+    if args.verify:
+        broken = verify_barrels(BARRELS_DIR)
+        if broken:
+            print(f"{len(broken)} barrels do not match the manifest: {', '.join(broken)}")
+            sys.exit(1)
+        print("All barrels match the manifest")
+        return
+    build_barrels(args.barrel_size_mb, args.layout)
+
+
+if __name__ == "__main__":
+    main()
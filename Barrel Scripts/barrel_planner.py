@@ -0,0 +1,192 @@
+"""
+Plans which words go into which barrel.
+
+Barrels.py cuts barrels in word id order at a fixed size, so a query-hot word
+with a huge posting list shares a 45 MB barrel with thousands of rare words,
+and every lookup of it loads the whole mixed barrel. This planner:
+
+1. Measures the encoded size and posting count of every word from the current
+   barrels.
+2. Estimates how often every word is queried: from a query log (one query per
+   line, optionally followed by a tab and a count), tokenized like the search
+   does; without a log the number of postings is used as the proxy.
+3. Gives a word its own barrel when that saves bytes: a lookup of it then reads
+   only its own postings, and the other words of its barrel no longer drag its
+   postings along. Words larger than --large-mb always get their own barrel.
+4. Packs all remaining (cold) words densely, in word id order, at the barrel size.
+
+The cost of a layout is the expected number of barrel bytes read per query
+(every barrel touched by a query is read once). It is reported for the current
+and the planned layout, replaying the query log when one is given.
+
+The layout is a JSON file {"barrel_size_bytes": ..., "barrels": [[word, ...], ...]}
+that Barrels.py --layout builds.
+
+Usage:
+    python barrel_planner.py [--query-log queries.txt] [--max-dedicated 512] [--out layout.json]
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+
+import msgpack
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from barrel_writer import BARREL_SIZE_MB
+from tokenizer import query_tokens
+
+BARRELS_DIR = os.path.join("..", "Barrels")
+LEXICON_FILE = os.path.join("..", "Lexicon", "lexicons_ids.json")
+LAYOUT_FILE = os.path.join("..", "Barrels", "barrel_layout.json")
+
+
+# ------------------ Inputs ------------------
+def measure_words(barrels_dir):
+    """{word: (encoded_bytes, postings)} read from the barrels, plus the current word -> barrel map."""
+    with open(os.path.join(barrels_dir, "barrels_index.json"), 'r', encoding='utf-8') as f:
+        barrels_index = json.load(f)
+    by_barrel = {}
+    for word, (barrel_id, offset) in barrels_index.items():
+        by_barrel.setdefault(barrel_id, {})[offset] = word
+
+    stats = {}
+    for barrel_id in tqdm(sorted(by_barrel), desc="Measuring barrels"):
+        words = by_barrel[barrel_id]
+        with open(os.path.join(barrels_dir, f"{barrel_id}.msgpack"), 'rb') as f:
+            unpacker = msgpack.Unpacker(f, raw=False, max_buffer_size=0)
+            length = unpacker.read_array_header()
+            start = unpacker.tell()
+            for offset in range(length):
+                postings = unpacker.unpack()
+                end = unpacker.tell()
+                if offset in words:
+                    stats[words[offset]] = (end - start, len(postings))
+                start = end
+    current = {word: barrel_id for word, (barrel_id, _) in barrels_index.items()}
+    return stats, current
+
+
+def read_query_log(path, known_words):
+    """[(set_of_words, count)] of the logged queries, words outside the index dropped."""
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            text, _, count = line.rstrip("\n").partition("\t")
+            words = {word for word in query_tokens(text) if word in known_words}
+            if words:
+                queries.append((words, int(count) if count.strip() else 1))
+    return queries
+
+
+def query_rates(stats, queries):
+    """Expected number of lookups of every word per query."""
+    if queries:
+        total = sum(count for _, count in queries)
+        lookups = Counter()
+        for words, count in queries:
+            for word in words:
+                lookups[word] += count
+        return {word: lookups[word] / total for word in stats}
+    # No log: one lookup per query, spread over the words like their posting counts
+    total = sum(postings for _, postings in stats.values())
+    return {word: postings / total for word, (_, postings) in stats.items()}
+
+
+# ------------------ Planning ------------------
+def pack_sequential(words, stats, barrel_size_bytes):
+    """Cut words (in the given order) into barrels like BarrelWriter does."""
+    barrels, current, size = [], [], 0
+    for word in words:
+        word_size = stats[word][0]
+        if current and size + word_size >= barrel_size_bytes:
+            barrels.append(current)
+            current, size = [], 0
+        current.append(word)
+        size += word_size
+    if current:
+        barrels.append(current)
+    return barrels
+
+
+def plan_layout(stats, rates, lexicon, barrel_size_bytes, max_dedicated, large_bytes):
+    if not stats:
+        # No words measured, nothing to plan
+        return [], 0, 0
+    words_by_id = sorted(stats, key=lexicon.get)
+    sequential = pack_sequential(words_by_id, stats, barrel_size_bytes)
+    # Average barrel a word shares today: its size and how often it is read per query
+    shared_bytes = sum(size for size, _ in stats.values()) / len(sequential)
+    shared_rate = sum(rates.values()) / len(sequential)
+
+    # Dedicating a word saves its own lookups the rest of the barrel, and saves
+    # the other words of the barrel reading its postings
+    def saving(word):
+        size, rate = stats[word][0], rates[word]
+        return rate * (shared_bytes - size) + size * (shared_rate - rate)
+
+    large = [word for word in words_by_id if stats[word][0] >= large_bytes]
+    candidates = sorted((word for word in words_by_id if stats[word][0] < large_bytes), key=saving, reverse=True)
+    hot = [word for word in candidates[:max(0, max_dedicated - len(large))] if saving(word) > 0]
+
+    dedicated = set(large) | set(hot)
+    cold = [word for word in words_by_id if word not in dedicated]
+    barrels = pack_sequential(cold, stats, barrel_size_bytes)
+    barrels.extend([word] for word in words_by_id if word in dedicated)
+    return barrels, len(large), len(hot)
+
+
+# ------------------ Cost ------------------
+def layout_cost(barrel_of, stats, rates, queries):
+    """Expected barrel bytes read per query for a word -> barrel assignment."""
+    barrel_bytes = Counter()
+    for word, barrel in barrel_of.items():
+        if word in stats:
+            barrel_bytes[barrel] += stats[word][0]
+    if queries:
+        total_queries = sum(count for _, count in queries)
+        read = sum(count * sum(barrel_bytes[barrel] for barrel in {barrel_of[word] for word in words})
+                   for words, count in queries)
+        return read / total_queries
+    return sum(rates[word] * barrel_bytes[barrel_of[word]] for word in stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan a barrel layout with dedicated barrels for hot and large words.")
+    parser.add_argument("--barrels-dir", default=BARRELS_DIR, help="current barrels, used to measure posting sizes")
+    parser.add_argument("--query-log", default=None, help="one query per line, optionally '<query>\\t<count>'")
+    parser.add_argument("--barrel-size-mb", type=float, default=BARREL_SIZE_MB)
+    parser.add_argument("--large-mb", type=float, default=BARREL_SIZE_MB / 4,
+                        help="words with larger posting lists always get their own barrel")
+    parser.add_argument("--max-dedicated", type=int, default=512, help="upper bound on single-word barrels")
+    parser.add_argument("--out", default=LAYOUT_FILE)
+    args = parser.parse_args()
+
+    with open(LEXICON_FILE, 'r', encoding='utf-8') as f:
+        lexicon = json.load(f)
+    stats, current = measure_words(args.barrels_dir)
+    queries = read_query_log(args.query_log, stats) if args.query_log else []
+    rates = query_rates(stats, queries)
+
+    barrel_size_bytes = int(args.barrel_size_mb * 1024 * 1024)
+    barrels, large, hot = plan_layout(stats, rates, lexicon, barrel_size_bytes,
+                                      args.max_dedicated, int(args.large_mb * 1024 * 1024))
+    planned = {word: barrel for barrel, words in enumerate(barrels) for word in words}
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump({"barrel_size_bytes": barrel_size_bytes, "barrels": barrels}, f, ensure_ascii=False)
+
+    source = f"{sum(count for _, count in queries)} logged queries" if queries else "posting counts"
+    before = layout_cost(current, stats, rates, queries)
+    after = layout_cost(planned, stats, rates, queries)
+    print(f"Planned {len(barrels)} barrels: {large} large and {hot} hot words in their own barrel")
+    print(f"Expected bytes read per query ({source}): "
+          f"{before / 1024:,.1f} KB -> {after / 1024:,.1f} KB")
+    print(f"Layout saved to {args.out}, build it with: python Barrels.py --layout {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,21 @@
 import os
-from bs4 import BeautifulSoup
+import sys
 from multiprocessing import Pool, cpu_count
 from tqdm import tqdm
 import re
 import json
+from collections import Counter, defaultdict
+from urllib.parse import urlparse
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from binary_forward_index import HTML_ZONES, MAX_POSITIONS, ForwardIndexWriter
+from doc_ids import doc_number
+from html_extractor import extract_text, extract_zones
+from shards import chunk_ranges, iter_run, shard_path, write_json_object, write_manifest, write_shard
+from shared_tables import StringList, StringTable, lexicon_tables, url_table
+from tokenizer import html_tokens
+
+CHUNK_SIZE = 250    # files per worker task, one shard file per chunk
 
 def init_worker(index_to_url_arg, lexicon_arg):
     # Initializes our global variables for each worker process
@@ -20,47 +32,120 @@ def process_file(file_path):
     url_tokens = set(re.findall(r'\w+', url.lower()))
     with open(file_path, 'r', encoding='utf-8') as f:
         file_content = f.read()
-    soup = BeautifulSoup(file_content, 'html.parser')
-    text = re.sub(r'\n', ' ', soup.get_text())
-    text = re.sub(r'(?<!\d)[^\w\s]|[^\w\s](?!\d)', ' ', text)
-    text = re.sub(r"\s+", " ", text).strip()
-    text = text.lower()
-    tokens = text.split(' ')
     words = set()
-    for word in tokens:
-        word = re.sub(r",", "", word)
-        if word in lexicon:
-            words.add(lexicon[word])
+    for word in html_tokens(extract_text(file_content)):
+        word_id = lexicon.get(word.replace(",", ""))
+        if word_id is not None:
+            words.add(word_id)
     
     for word in url_tokens:
         if word == 'www' or word == 'http' or word == 'https':
             continue
         
-        if word in lexicon:
-            words.add(lexicon[word])
+        word_id = lexicon.get(word)
+        if word_id is not None:
+            words.add(word_id)
     
     return words, file_path
 
+def process_page(file_path):
+    """
+    Forward index row of a page together with the hits of its words, counted
+    like inverted_index.process_file_for_word does (except the anchor text
+    counts, which come from the other pages):
+    (word ids, doc length, HTML_ZONES counts of every word flattened, positions of every word)
+    """
+    file_id = os.path.basename(file_path).split('.')[0]
+    url = index_to_url[file_id]
+    with open(file_path, 'r', encoding='utf-8') as f:
+        zones = extract_zones(f.read())
+    tokens = list(html_tokens(zones.text))
+
+    # Same word selection as process_file: the page's tokens without commas and the URL's words
+    words = {}
+    for token in set(tokens):
+        word = token.replace(",", "")
+        word_id = lexicon.get(word)
+        if word_id is not None:
+            words[word] = word_id
+    for word in set(re.findall(r'\w+', url.lower())):
+        if word in ('www', 'http', 'https'):
+            continue
+        word_id = lexicon.get(word)
+        if word_id is not None:
+            words[word] = word_id
+
+    tokens_counter = Counter(tokens)
+    positions_map = defaultdict(list)
+    for i, tok in enumerate(tokens):
+        if len(positions_map[tok]) < MAX_POSITIONS:
+            positions_map[tok].append(i)
+    title_counter = Counter(html_tokens(zones.title)) if zones.title else Counter()
+    meta_counter = Counter(html_tokens(zones.meta_description)) if zones.meta_description else Counter()
+    headings_counter = Counter(tok for heading in zones.headings for tok in html_tokens(heading))
+    url_path = urlparse(url).path
+    domain = urlparse(url).netloc
+
+    word_ids, counts, positions = [], [], []
+    for word, word_id in sorted(words.items(), key=lambda item: item[1]):
+        word_ids.append(word_id)
+        counts.extend((title_counter[word], meta_counter[word], headings_counter[word], tokens_counter[word],
+                       1 if word in domain else 0, 1 if word in url_path else 0))
+        positions.append(positions_map.get(word, []))
+    return word_ids, len(tokens), counts, positions
+
+
+def init_chunk_worker(index_to_url_arg, lexicon_arg, shard_dir_arg):
+    global shard_dir
+    init_worker(index_to_url_arg, lexicon_arg)
+    shard_dir = shard_dir_arg
+
+def process_chunk(task):
+    # The worker writes the forward index rows of its chunk to a shard itself,
+    # the parent only receives the shard's manifest entry. The rows with their
+    # hits for the binary forward index go to a second shard.
+    first_file, file_paths = task
+    rows, records = [], []
+    for file_path in file_paths:
+        file_id = os.path.basename(file_path).split('.')[0]
+        word_ids, doc_length, counts, positions = process_page(file_path)
+        rows.append((file_id, word_ids))
+        records.append((doc_number("H" + file_id), [doc_length, word_ids, counts, positions]))
+    shard = write_shard(shard_path(shard_dir, first_file), rows)
+    shard["records"] = write_shard(shard_path(os.path.join(shard_dir, "records"), first_file), records)["path"]
+    return shard
+
 def main():
     html_files_path = "../Data/Files/raw/"
     ind_to_url_path = "../Data/ind_to_url.json"
     lexicon_path = "../Lexicon/lexicons_ids.json"
+    shard_dir = "../Forward Index/Shards"
+    os.makedirs(os.path.join(shard_dir, "records"), exist_ok=True)
+
+    # Memory-mapped tables: workers receive their paths and share the pages
+    # instead of unpickling their own copy of both dicts
+    index_to_url = StringList(url_table(ind_to_url_path))
+    lexicon = StringTable(lexicon_tables(lexicon_path)[0])
 
-    with open(ind_to_url_path, 'r', encoding='utf-8') as f:
-        index_to_url = json.load(f)
+    html_files = sorted(os.path.join(html_files_path, f) for f in os.listdir(html_files_path) if f.endswith('.html'))
+    tasks = [(first, html_files[first:end]) for first, end in chunk_ranges(0, len(html_files), CHUNK_SIZE)]
+    with Pool(cpu_count(), initializer=init_chunk_worker, initargs=(index_to_url, lexicon, shard_dir)) as pool:
+        shards = list(tqdm(pool.imap(process_chunk, tasks), total=len(tasks), unit="chunks"))
+    write_manifest(os.path.join(shard_dir, "shards_manifest.json"), shards)
 
-    with open(lexicon_path, 'r', encoding='utf-8') as f:
-        lexicon = json.load(f)
+    # Stream the shards into the final JSON, never holding the whole forward index
+    write_json_object("../Forward Index/forward_index_html_files.json", [shard["path"] for shard in shards])
 
-    forward_index = {}
-    html_files = [os.path.join(html_files_path, f) for f in os.listdir(html_files_path) if f.endswith('.html')]
-    with Pool(cpu_count(), initializer=init_worker, initargs=(index_to_url, lexicon)) as pool:
-        for words, file_path in tqdm(pool.imap_unordered(process_file, html_files), total=len(html_files)):
-            file_id = os.path.basename(file_path).split('.')[0]
-            forward_index[file_id] = list(words)
+    # Binary forward index with the counts and positions, see util_scripts/binary_forward_index.py
+    writer = ForwardIndexWriter("../Forward Index/forward_index_html.bin", HTML_ZONES)
+    for shard in tqdm(shards, desc="Writing binary forward index", unit="chunks"):
+        for number, (doc_length, word_ids, counts, positions) in iter_run(shard["records"]):
+            writer.add(number, doc_length, word_ids, counts, positions)
+    writer.close()
 
-    with open("../Forward Index/forward_index_html_files.json", 'w', encoding='utf-8') as f:
-        json.dump(forward_index, f, indent=2, ensure_ascii=False)
+    for shard in shards:
+        os.remove(shard["path"])
+        os.remove(shard["records"])
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+Builds the binary forward index of the CORD-19 papers (forward_index_pdf.bin,
+see util_scripts/binary_forward_index.py): for every paper its lexicon words
+with the section group counts and the first positions, counted exactly like
+JSONinvertedIndex.process_json_file does.
+
+The HTML pages get theirs from forward_index.py.
+"""
+
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Inverted Index Scripts"))
+from binary_forward_index import PAPER_ZONES, ForwardIndexWriter
+from doc_ids import doc_number
+from shards import chunk_ranges, iter_run, shard_path, write_manifest, write_shard
+from shared_tables import StringTable, lexicon_tables
+
+from JSONinvertedIndex import process_json_file
+
+CHUNK_SIZE = 250    # papers per worker task, one shard file per chunk
+
+
+def init_worker(lexicon_arg, shard_dir_arg):
+    global lexicon, shard_dir
+    lexicon = lexicon_arg
+    shard_dir = shard_dir_arg
+
+
+def process_paper(file_path):
+    """(word ids, doc length, PAPER_ZONES counts of every word flattened, positions of every word)"""
+    hitlists = process_json_file((file_path, None))
+    hits = sorted((lexicon[word], entry) for word, entry in hitlists.items() if word in lexicon)
+    word_ids, counts, positions = [], [], []
+    doc_length = 0
+    for word_id, (_, word_positions, (group1, group2, group3, total, length)) in hits:
+        word_ids.append(word_id)
+        counts.extend((group1, group2, group3, total))
+        positions.append(word_positions)
+        doc_length = length
+    return word_ids, doc_length, counts, positions
+
+
+def process_chunk(task):
+    first_file, file_paths = task
+    records = []
+    for file_path in file_paths:
+        number = doc_number("P" + os.path.basename(file_path).replace(".json", ""))
+        word_ids, doc_length, counts, positions = process_paper(file_path)
+        records.append((number, [doc_length, word_ids, counts, positions]))
+    return write_shard(shard_path(shard_dir, first_file), records)
+
+
+def main():
+    json_files_dir = os.path.join("..", "Data", "Cord 19", "document_parses", "pdf_json")
+    lexicon_path = os.path.join("..", "Lexicon", "lexicons_ids.json")
+    shard_dir = os.path.join("..", "Forward Index", "Shards", "papers")
+    os.makedirs(shard_dir, exist_ok=True)
+
+    lexicon = StringTable(lexicon_tables(lexicon_path)[0])
+    json_files = sorted(os.path.join(json_files_dir, f) for f in os.listdir(json_files_dir) if f.endswith('.json'))
+    tasks = [(first, json_files[first:end]) for first, end in chunk_ranges(0, len(json_files), CHUNK_SIZE)]
+    with Pool(cpu_count(), initializer=init_worker, initargs=(lexicon, shard_dir)) as pool:
+        shards = list(tqdm(pool.imap(process_chunk, tasks), total=len(tasks), unit="chunks"))
+    write_manifest(os.path.join(shard_dir, "shards_manifest.json"), shards)
+
+    writer = ForwardIndexWriter(os.path.join("..", "Forward Index", "forward_index_pdf.bin"), PAPER_ZONES)
+    for shard in tqdm(shards, desc="Writing binary forward index", unit="chunks"):
+        for number, (doc_length, word_ids, counts, positions) in iter_run(shard["path"]):
+            writer.add(number, doc_length, word_ids, counts, positions)
+        os.remove(shard["path"])
+    print(f"{writer.close()} papers written to the binary forward index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Builds the passage stores the result snippets are made from
+(util_scripts/passage_store.py):
+
+    python passage_index.py html    ../Forward Index/passages_html.bin from the raw pages
+    python passage_index.py pdf     ../Forward Index/passages_pdf.bin from the paper JSONs
+
+The text is tokenized exactly like forward_index.py / paper_forward_index.py
+do, so the passages carry the same token positions as the binary forward
+indexes. A page's passages cover its whole extracted text; a paper's only its
+abstract and body (the title, authors and references make poor snippets), but
+the positions still count every section in JSONinvertedIndex.paper_sections
+order.
+"""
+
+import json
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Inverted Index Scripts"))
+from doc_ids import doc_number
+from html_extractor import extract_zones
+from passage_store import PassageWriter, split_passages
+from tokenizer import html_token_spans, paper_token_spans
+
+from JSONinvertedIndex import paper_sections
+
+SOURCES = {
+    # dataset: (input directory, doc id prefix, file extension, output, tokenizer)
+    "html": (os.path.join("..", "Data", "Files", "raw"), "H", ".html",
+             os.path.join("..", "Forward Index", "passages_html.bin"), "html"),
+    "pdf": (os.path.join("..", "Data", "Cord 19", "document_parses", "pdf_json"), "P", ".json",
+            os.path.join("..", "Forward Index", "passages_pdf.bin"), "paper"),
+}
+PASSAGE_SECTIONS = ("abstract", "body")
+
+
+def page_passages(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        text = extract_zones(f.read()).text
+    return split_passages(text, html_token_spans(text), 0)
+
+
+def paper_passages(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        doc = json.load(f)
+    passages = []
+    pos = 0
+    for _, section, text in paper_sections(doc, os.path.basename(file_path).replace(".json", "")):
+        spans = paper_token_spans(text)
+        if section in PASSAGE_SECTIONS:
+            passages.extend(split_passages(text, spans, pos))
+        pos += len(spans)
+    return passages
+
+
+def process_file(task):
+    dataset, file_path = task
+    try:
+        return file_path, (page_passages if dataset == "html" else paper_passages)(file_path)
+    except (OSError, UnicodeDecodeError, ValueError):
+        return file_path, []
+
+
+def main():
+    if len(sys.argv) != 2 or sys.argv[1] not in SOURCES:
+        print(f"usage: python passage_index.py {{{'|'.join(SOURCES)}}}")
+        sys.exit(1)
+    dataset = sys.argv[1]
+    input_dir, prefix, extension, output_path, tokenizer = SOURCES[dataset]
+
+    files = sorted(os.path.join(input_dir, f) for f in os.listdir(input_dir) if f.endswith(extension))
+    writer = PassageWriter(output_path, tokenizer)
+    with Pool(cpu_count()) as pool:
+        tasks = [(dataset, file_path) for file_path in files]
+        for file_path, passages in tqdm(pool.imap_unordered(process_file, tasks, chunksize=64),
+                                        total=len(tasks), desc="Cutting passages", unit="files"):
+            writer.add(doc_number(prefix + os.path.basename(file_path)[:-len(extension)]), passages)
+    print(f"Passages of {writer.close()} documents written to {output_path}")
+
+
+if __name__ == "__main__":
+    main()
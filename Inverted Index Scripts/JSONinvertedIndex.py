@@ -15,131 +15,117 @@ Build Inverted Index from JSON documents using multiprocessing.
 ]
 """
 
+import csv
 import json
 from collections import defaultdict, Counter
+from functools import lru_cache
 from multiprocessing import Pool, cpu_count
 from tqdm import tqdm
-import re
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from checkpoint import Checkpoint
+from shards import chunk_ranges, shard_path, write_dense_json, write_manifest, write_shard
+from shared_tables import IntLists, StringList, StringTable, forward_index_tables, lexicon_tables
+from tokenizer import paper_tokens
 
 MAX_POS = 15
+TITLE_FIXES_PATH = os.path.join("..", "Data", "PageRankCord19", "title_fixes.csv")
 
 # ------------------ Utilities ------------------
 def normalize_and_tokenize(text):
     """
     Tokenize text to match the C++ lexicon extraction logic.
     Extracts alphanumeric tokens, preserving unicode characters.
+    Returns a generator, see util_scripts/tokenizer.py for the rules.
     """
-    if not isinstance(text, str):
-        return []
-    
-    tokens = []
-    word = []
-    
-    for c in text:
-        # Match C++ logic: isalnum(c) || c >= 128 (unicode)
-        if c.isalnum() or ord(c) >= 128:
-            word.append(c.lower())
-        else:
-            if word:
-                tokens.append(''.join(word))
-                word = []
-    
-    # Don't forget the last word
-    if word:
-        tokens.append(''.join(word))
-    
-    return tokens
-
-
-# ------------------ Process One File ------------------
-def process_json_file(args):
-    file_path, words = args
+    return paper_tokens(text)
 
-    with open(file_path, 'r', encoding='utf-8') as f:
-        doc = json.load(f)
 
-    # Fix docid source - add P prefix for research papers
-    docid = "P" + os.path.basename(file_path).replace(".json", "")
-    positions_map = defaultdict(list)
+@lru_cache(maxsize=None)
+def title_fixes():
+    """{paper id: title} of the papers whose JSON has no title, from papers_citations_mapper.py."""
+    if not os.path.exists(TITLE_FIXES_PATH):
+        return {}
+    with open(TITLE_FIXES_PATH, 'r', newline='', encoding='utf-8') as f:
+        return {row["paper_id"]: row["title"] for row in csv.DictReader(f)}
 
-    # Section group counters:
-    group1 = Counter()  # title + abstract + authors
-    group2 = Counter()  # body_text
-    group3 = Counter()  # references + ref_entries + back_matter
-
-    pos = 0
 
+# ------------------ Process One File ------------------
+def paper_sections(doc, paper_id):
+    """
+    (group, section, text) of every piece of text of a paper in token position order,
+    group 1 is title + abstract + authors, 2 the body text, 3 bib_entries + ref_entries + back_matter.
+    """
     # ----- TITLE -----
-    title = doc.get("metadata", {}).get("title", "")
-    for tok in normalize_and_tokenize(title):
-        if len(positions_map[tok]) < MAX_POS:
-            positions_map[tok].append(pos)
-        group1[tok] += 1
-        pos += 1
+    yield 1, "title", doc.get("metadata", {}).get("title", "") or title_fixes().get(paper_id, "")
 
     # ----- ABSTRACT -----
     for item in doc.get("abstract", []):
-        for tok in normalize_and_tokenize(item.get("text", "")):
-            if len(positions_map[tok]) < MAX_POS:
-                positions_map[tok].append(pos)
-            group1[tok] += 1
-            pos += 1
+        yield 1, "abstract", item.get("text", "")
 
     # ----- AUTHORS -----
     # Match C++ logic: extract ALL fields from author objects
     for author in doc.get("metadata", {}).get("authors", []):
         if isinstance(author, str):
             # If author is a plain string
-            for tok in normalize_and_tokenize(author):
-                if len(positions_map[tok]) < MAX_POS:
-                    positions_map[tok].append(pos)
-                group1[tok] += 1
-                pos += 1
+            yield 1, "authors", author
         elif isinstance(author, dict):
             # Extract all string fields from author object (first, last, middle, suffix, affiliation, email, etc.)
             for key, value in author.items():
                 if isinstance(value, str):
-                    for tok in normalize_and_tokenize(value):
-                        if len(positions_map[tok]) < MAX_POS:
-                            positions_map[tok].append(pos)
-                        group1[tok] += 1
-                        pos += 1
+                    yield 1, "authors", value
 
     # ----- BODY TEXT -----
     for item in doc.get("body_text", []):
-        for tok in normalize_and_tokenize(item.get("text", "")):
-            if len(positions_map[tok]) < MAX_POS:
-                positions_map[tok].append(pos)
-            group2[tok] += 1
-            pos += 1
+        yield 2, "body", item.get("text", "")
 
     # ----- BIB ENTRIES (titles only) -----
     for ref in doc.get("bib_entries", {}).values():
-        for tok in normalize_and_tokenize(ref.get("title", "")):
-            if len(positions_map[tok]) < MAX_POS:
-                positions_map[tok].append(pos)
-            group3[tok] += 1
-            pos += 1
+        yield 3, "bib_entries", ref.get("title", "")
 
     # ----- REF ENTRIES (FIGREF, TABREF...) -----
     for ref in doc.get("ref_entries", {}).values():
-        for tok in normalize_and_tokenize(ref.get("text", "")):
-            if len(positions_map[tok]) < MAX_POS:
-                positions_map[tok].append(pos)
-            group3[tok] += 1
-            pos += 1
+        yield 3, "ref_entries", ref.get("text", "")
 
     # ----- BACK MATTER -----
     for item in doc.get("back_matter", []):
-        for tok in normalize_and_tokenize(item.get("text", "")):
+        yield 3, "back_matter", item.get("text", "")
+
+
+def process_json_file(args):
+    file_path, words = args
+
+    with open(file_path, 'r', encoding='utf-8') as f:
+        doc = json.load(f)
+
+    # Fix docid source - add P prefix for research papers
+    docid = "P" + os.path.basename(file_path).replace(".json", "")
+    positions_map = defaultdict(list)
+
+    # Section group counters:
+    group1 = Counter()  # title + abstract + authors
+    group2 = Counter()  # body_text
+    group3 = Counter()  # references + ref_entries + back_matter
+    groups = {1: group1, 2: group2, 3: group3}
+
+    pos = 0
+    for group, _, text in paper_sections(doc, docid[1:]):
+        counter = groups[group]
+        for tok in normalize_and_tokenize(text):
             if len(positions_map[tok]) < MAX_POS:
                 positions_map[tok].append(pos)
-            group3[tok] += 1
+            counter[tok] += 1
             pos += 1
 
 
     # ------------------ BUILD HITLISTS ------------------
+    # words=None builds hitlists for every token of the paper (used for new documents
+    # that are not in the forward index yet)
+    if words is None:
+        words = list(positions_map)
+
     hitlists = {}
     for word in words:
 
@@ -167,74 +153,96 @@ def process_json_file(args):
     return hitlists
 
 
-# ------------------ MAIN ------------------
-def main():
-    lexicon_path = r"..\Lexicon\lexicons_ids.json"
-    forward_index_path = r"..\Forward Index\forward_index_pdf_files.json"
-    json_files_dir = r"..\Data\Cord 19\document_parses\pdf_json"
-    inverted_index_dir = r"..\Inverted Index\JsonBatches"
+# ------------------ Workers ------------------
+CHUNK_SIZE = 250    # papers per worker task, one shard file per chunk
 
-    os.makedirs(inverted_index_dir, exist_ok=True)
 
-    # Load lexicon
-    with open(lexicon_path, 'r', encoding='utf-8') as f:
-        lexicon = json.load(f)
+def init_worker(lexicon_arg, inverse_lexicon_arg, file_ids_arg, rows_arg, json_files_dir_arg, shard_dir_arg):
+    # Memory-mapped tables (pickled as paths): the forward index rows are read
+    # by the workers instead of travelling through the task queue
+    global lexicon, inverse_lexicon, file_ids, rows, json_files_dir, shard_dir
+    lexicon = lexicon_arg
+    inverse_lexicon = inverse_lexicon_arg
+    file_ids = file_ids_arg
+    rows = rows_arg
+    json_files_dir = json_files_dir_arg
+    shard_dir = shard_dir_arg
 
-    inverse_lexicon = {v: k for k, v in lexicon.items()}
 
-    # Load forward index
-    with open(forward_index_path, 'r', encoding='utf-8') as f:
-        forward_index = json.load(f)
+def process_row(row):
+    words = [inverse_lexicon[w] for w in rows[row]]
+    file_path = os.path.join(json_files_dir, f"{file_ids[row]}.json")
+    return process_json_file((file_path, words))
 
-    # Prepare args
-    args = []
-    for file_id, word_ids in tqdm(forward_index.items(), desc="Preparing args"):
-        words = [inverse_lexicon[w] for w in word_ids]
-        file_path = os.path.join(json_files_dir, f"{file_id}.json")
-        args.append((file_path, words))
 
-    # Free memory before processing
-    del forward_index
+def process_chunk(task):
+    # Hitlists are written to a shard by the worker, the parent only gets the manifest entry
+    first_row, end_row = task
+    inverted_index = defaultdict(list)
+    for row in range(first_row, end_row):
+        for word, entry in process_row(row).items():
+            inverted_index[lexicon[word]].append(entry)
+    return write_shard(shard_path(shard_dir, first_row), sorted(inverted_index.items()))
+
+
+# ------------------ MAIN ------------------
+def main():
+    lexicon_path = os.path.join("..", "Lexicon", "lexicons_ids.json")
+    forward_index_path = os.path.join("..", "Forward Index", "forward_index_pdf_files.json")
+    json_files_dir = os.path.join("..", "Data", "Cord 19", "document_parses", "pdf_json")
+    inverted_index_dir = os.path.join("..", "Inverted Index", "JsonBatches")
+    shard_dir = os.path.join(inverted_index_dir, "Shards")
+
+    os.makedirs(shard_dir, exist_ok=True)
+
+    # Shared tables for the workers
+    lexicon_table_path, inverse_lexicon_path = lexicon_tables(lexicon_path)
+    lexicon = StringTable(lexicon_table_path)
+    inverse_lexicon = StringList(inverse_lexicon_path)
+    file_ids_path, rows_path = forward_index_tables(forward_index_path)
+    file_ids = StringList(file_ids_path)
+    rows = IntLists(rows_path)
+
+    # Finished chunks and batches are journaled, a restarted run skips them
+    checkpoint = Checkpoint(os.path.join(inverted_index_dir, "checkpoint.jsonl"),
+                            inputs=[lexicon_path, forward_index_path])
+    if len(checkpoint):
+        print(f"Resuming: {len(checkpoint)} chunks and batches already done")
 
     # Process in batches (similar to HTML inverted index)
     batch_size = 10000
-    for i in range(0, len(args), batch_size):
-        inverted_index = {}
-        for word, word_id in lexicon.items():
-            inverted_index[word_id] = []
-        
-        batch_args = args[i:i + batch_size]
-        
-        with Pool(cpu_count()) as pool:
-            results = list(
-                tqdm(
-                    pool.imap(process_json_file, batch_args),
-                    total=len(batch_args),
-                    desc=f"Processing files {i+1} to {min(i+batch_size, len(args))}"
-                )
+    manifest = []
+    with Pool(cpu_count(), initializer=init_worker,
+              initargs=(lexicon, inverse_lexicon, file_ids, rows, json_files_dir, shard_dir)) as pool:
+        for i in range(0, len(file_ids), batch_size):
+            # Output batch file, merged from the batch's shards
+            out_file = os.path.join(
+                inverted_index_dir,
+                f"inverted_index_json_part_{i//batch_size + 1}.json"
             )
-
-        # Merge batch results
-        for hitlists in results:
-            for word, entry in hitlists.items():
-                word_id = lexicon[word]
-                inverted_index[word_id].append(entry)
-
-        # Output batch file
-        out_file = os.path.join(
-            inverted_index_dir,
-            f"inverted_index_json_part_{i//batch_size + 1}.json"
-        )
-
-        with open(out_file, 'w', encoding='utf-8') as f:
-            json.dump(inverted_index, f)
-
-        del inverted_index
-        del results
-        del batch_args
-
-    del args
-    del lexicon
+            if checkpoint.done(out_file):
+                manifest.extend(checkpoint.data(out_file)["shards"])
+                continue
+
+            tasks = chunk_ranges(i, min(i + batch_size, len(file_ids)), CHUNK_SIZE)
+            todo = [task for task in tasks if not checkpoint.done(shard_path(shard_dir, task[0]))]
+            for shard in tqdm(
+                pool.imap_unordered(process_chunk, todo),
+                total=len(todo),
+                desc=f"Processing files {i+1} to {min(i+batch_size, len(file_ids))}"
+            ):
+                checkpoint.record(shard["path"], [shard["path"]], shard=shard)
+            shards = [checkpoint.data(shard_path(shard_dir, first))["shard"] for first, _ in tasks]
+
+            write_dense_json(out_file, [shard["path"] for shard in shards], len(inverse_lexicon))
+            for shard in shards:
+                shard["part"] = out_file
+            checkpoint.record(out_file, [out_file], shards=shards)
+            for shard in shards:
+                os.remove(shard["path"])
+            manifest.extend(shards)
+            write_manifest(os.path.join(shard_dir, "shards_manifest.json"), manifest)
+    checkpoint.finish()
 
     print("Done building inverted index")
 
@@ -0,0 +1,150 @@
+"""
+Anchor text field index: for every page the lexicon words of the anchor text
+of the links pointing to it, with their counts, keyed by doc number.
+
+url_anchor_map.py joins all anchor texts of a URL into one string and the
+inverted index builders then ship that string to the workers to count its
+words. Here the counting is one streaming pass over page_rank_links.csv
+that never builds the strings:
+
+1. map: the parent reads the CSV in slices of SLICE_ROWS links and the
+   workers count the words of every link's anchor text for the page the
+   link points to, writing a run sorted by (doc number, term id) per slice.
+   The number of anchor tokens of a page (lexicon words or not) goes under
+   the term LENGTH_TERM.
+2. reduce: the runs are added up in a tree (shards.tree_reduce) into one.
+3. The last run is streamed into ../Inverted Index/anchor_index.bin, a binary
+   forward index with the one zone "anchor" (util_scripts/binary_forward_index.py)
+   whose doc length is the number of anchor tokens.
+
+A link counts for the page whose URL in ind_to_url.json is exactly its
+to_url, the same match the anchors of url_to_anchor_text.json got.
+invert_forward_index.py takes the html anchor counts from this file and
+inverts it into an anchor-only inverted index as well (kind "anchor").
+"""
+
+import csv
+import json
+import os
+import sys
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from binary_forward_index import ANCHOR_ZONES, ForwardIndexWriter
+from shards import iter_run, shard_path, tree_reduce, write_shard
+from shared_tables import StringTable, build_string_table, lexicon_tables
+from tokenizer import html_tokens
+
+SLICE_ROWS = 50000      # links per map task
+LENGTH_TERM = -1        # sorts before every term id of a page
+
+PAGE_LINKS_PATH = os.path.join("..", "Data", "Page_rank_files", "page_rank_links.csv")
+IND_TO_URL_PATH = os.path.join("..", "Data", "ind_to_url.json")
+LEXICON_PATH = os.path.join("..", "Lexicon", "lexicons_ids.json")
+ANCHOR_INDEX_PATH = os.path.join("..", "Inverted Index", "anchor_index.bin")
+SHARD_DIR = os.path.join("..", "Inverted Index", "Shards", "anchors")
+
+
+def init_worker(url_pages_arg, lexicon_arg):
+    global url_pages, lexicon
+    url_pages = url_pages_arg
+    lexicon = lexicon_arg
+
+
+def count_anchors(task):
+    # Map: anchor word counts of one slice of links, written to a run
+    out_path, links = task
+    counts = Counter()
+    for to_url, anchor_text in links:
+        page = url_pages.get(to_url)
+        if page is None:
+            continue
+        number = page << 1      # doc number of H<page>
+        tokens = list(html_tokens(anchor_text))
+        counts[number, LENGTH_TERM] += len(tokens)
+        for token in tokens:
+            term = lexicon.get(token)
+            if term is not None:
+                counts[number, term] += 1
+    return write_shard(out_path, (([number, term], [count]) for (number, term), count in sorted(counts.items())))
+
+
+def read_links(path):
+    """(to_url, anchor_text) of every link with an anchor text."""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        to_column, text_column = header.index("to_url"), header.index("anchor_text")
+        for row in reader:
+            if row[text_column]:
+                yield row[to_column], row[text_column]
+
+
+def iter_pages(run_path):
+    """(doc number, anchor tokens, term ids, counts) of every page in a reduced run."""
+    number, length, terms, counts = None, 0, [], []
+    for (page_number, term), (count,) in iter_run(run_path):
+        if page_number != number:
+            if number is not None:
+                yield number, length, terms, counts
+            number, length, terms, counts = page_number, 0, [], []
+        if term == LENGTH_TERM:
+            length = count
+        else:
+            terms.append(term)
+            counts.append(count)
+    if number is not None:
+        yield number, length, terms, counts
+
+
+def main():
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    lexicon = StringTable(lexicon_tables(LEXICON_PATH)[0])
+
+    # URL -> page number, memory-mapped for the workers
+    url_pages_path = os.path.join(SHARD_DIR, "url_pages.table")
+    with open(IND_TO_URL_PATH, 'r', encoding='utf-8') as f:
+        url_to_page = {}
+        for page, url in json.load(f).items():
+            url_to_page.setdefault(url, int(page))
+    build_string_table(url_pages_path, url_to_page)
+    del url_to_page
+    url_pages = StringTable(url_pages_path)
+
+    runs = []
+    links = read_links(PAGE_LINKS_PATH)
+    with Pool(cpu_count(), initializer=init_worker, initargs=(url_pages, lexicon)) as pool, \
+            tqdm(desc="Counting anchor words", unit="links") as progress:
+        # A few slices at a time, so the CSV is never read further ahead than the workers
+        while True:
+            tasks = []
+            for _ in range(2 * cpu_count()):
+                rows = list(islice(links, SLICE_ROWS))
+                if not rows:
+                    break
+                tasks.append((shard_path(SHARD_DIR, len(runs) + len(tasks)), rows))
+            if not tasks:
+                break
+            for entry in pool.imap(count_anchors, tasks):
+                runs.append(entry["path"])
+            progress.update(sum(len(rows) for _, rows in tasks))
+
+        runs = tree_reduce(pool, runs, SHARD_DIR, len(runs))
+
+    writer = ForwardIndexWriter(ANCHOR_INDEX_PATH, ANCHOR_ZONES, max_positions=0)
+    for run in runs:
+        for number, length, terms, counts in iter_pages(run):
+            writer.add(number, length, terms, counts, [[]] * len(terms))
+        os.remove(run)
+    pages = writer.close()
+    os.remove(url_pages_path)
+
+    print(f"Anchor text of {pages} pages written to {ANCHOR_INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -43,6 +43,7 @@
 """
 import ijson
 import json
+import sys
 from tqdm import tqdm
 
 def drop_keys_to_list(input_file, output_file):
@@ -76,7 +77,11 @@ def drop_keys_to_list(input_file, output_file):
         f_out.write("]")
 
 if __name__ == "__main__":
-    drop_keys_to_list(
-        "../Inverted Index/JsonBatches/inverted_index_json.json",
-        "../Inverted Index/JsonBatches/inverted_index_dropped_keys.json"
-    )
+    # python drop_keys.py [<input.json> <output.json>], the research papers index by default
+    if len(sys.argv) == 3:
+        drop_keys_to_list(sys.argv[1], sys.argv[2])
+    else:
+        drop_keys_to_list(
+            "../Inverted Index/JsonBatches/inverted_index_json.json",
+            "../Inverted Index/JsonBatches/inverted_index_dropped_keys.json"
+        )
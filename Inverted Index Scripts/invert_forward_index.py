@@ -0,0 +1,230 @@
+"""
+Builds the inverted index part files from the binary forward indexes
+(util_scripts/binary_forward_index.py) instead of parsing the documents again.
+
+inverted_index.py and JSONinvertedIndex.py only take the word ids of a
+document from the forward index and then open, parse and tokenize the raw
+HTML / paper JSON once more to count the hits. The binary forward index
+already has those counts and positions, so here the inversion is a transpose
+of its arrays:
+
+1. map: every worker takes a chunk of documents, sorts their (term, document)
+   pairs by term id and partitions them by term id range (PARTITIONS ranges
+   of equal width, a radix partition on the high part of the id). The
+   postings of every range go to their own run, sorted by term id.
+2. reduce: one worker per range merges the runs of the range in document
+   order into one shard.
+3. The ranges are disjoint and in id order, so the shards of a part are
+   simply streamed one after the other into the part's JSON.
+
+The parts have the same format and names as the ones of inverted_index.py
+(html) and JSONinvertedIndex.py (pdf), so merge_indexes.py and
+merge_json_batches.py take them as they are. Documents go in doc number
+order, BATCH_SIZE documents per part. The anchor text counts of the pages
+depend on the links of the other pages, so they are not in the forward index
+of the pages but in the anchor field index of anchor_index.py.
+
+That field index is inverted the same way (kind "anchor") into
+../Inverted Index/AnchorBatches/anchor_index_part_<n>.json for anchor-only
+lookups, with postings [document_id, [], [anchor_count, anchor_length]].
+
+Usage: python invert_forward_index.py html|pdf|anchor [--partitions 64]
+"""
+
+import argparse
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from binary_forward_index import BinaryForwardIndex
+from checkpoint import Checkpoint
+from doc_ids import doc_id
+from shards import merge_runs, shard_path, write_dense_json, write_manifest, write_shard
+from shared_tables import StringList, lexicon_tables
+
+BATCH_SIZE = 10000    # documents per part file, like the parsing builders
+CHUNK_SIZE = 2000     # documents per map task
+PARTITIONS = 64       # term id ranges, one reduce task each
+
+LEXICON_PATH = os.path.join("..", "Lexicon", "lexicons_ids.json")
+ANCHOR_INDEX_PATH = os.path.join("..", "Inverted Index", "anchor_index.bin")
+
+KINDS = {
+    "html": {
+        "forward_index": os.path.join("..", "Forward Index", "forward_index_html.bin"),
+        "part": os.path.join("..", "Inverted Index", "inverted_index_part_{}.json"),
+        "shard_dir": os.path.join("..", "Inverted Index", "Shards", "html_inversion"),
+    },
+    "pdf": {
+        "forward_index": os.path.join("..", "Forward Index", "forward_index_pdf.bin"),
+        "part": os.path.join("..", "Inverted Index", "JsonBatches", "inverted_index_json_part_{}.json"),
+        "shard_dir": os.path.join("..", "Inverted Index", "JsonBatches", "Shards", "inversion"),
+    },
+    "anchor": {
+        "forward_index": ANCHOR_INDEX_PATH,
+        "part": os.path.join("..", "Inverted Index", "AnchorBatches", "anchor_index_part_{}.json"),
+        "shard_dir": os.path.join("..", "Inverted Index", "AnchorBatches", "Shards"),
+    },
+}
+
+
+# ------------------ Postings ------------------
+def html_posting(number, counts, positions, doc_length, anchor_count):
+    title, meta, headings, total, in_domain, in_url = counts
+    return {
+        "document_id": doc_id(number),
+        "positions": positions,
+        "hit_counter": [title, meta, headings, total, anchor_count, in_domain, in_url, doc_length],
+    }
+
+
+def paper_posting(number, counts, positions, doc_length):
+    front, body, back, total = counts
+    return [doc_id(number), positions, [front, body, back, total, doc_length]]
+
+
+def anchor_posting(number, counts, positions, doc_length):
+    return [doc_id(number), positions, [counts[0], doc_length]]
+
+
+def anchor_counts(number):
+    """{term id: occurrences} in the anchor text of the links to page `number`."""
+    if anchors is None or number not in anchors:
+        return {}
+    terms, counts = anchors.term_frequencies(number, "anchor")
+    return dict(zip(terms.tolist(), counts.tolist()))
+
+
+# ------------------ Workers ------------------
+def init_worker(kind_arg, index_arg, anchors_arg, partitions_arg, partition_width_arg):
+    global kind, index, anchors, partitions, partition_width
+    kind = kind_arg
+    index = index_arg
+    anchors = anchors_arg
+    partitions = partitions_arg
+    partition_width = partition_width_arg
+
+
+def partition_dir(shard_dir, partition):
+    return os.path.join(shard_dir, f"partition_{partition:03d}")
+
+
+def invert_chunk(task):
+    # Map: the chunk's postings, partitioned by term id range, one run per range
+    shard_dir, first, numbers = task
+    numbers = np.asarray(numbers, dtype=np.int64)
+    starts = index.term_start[numbers].astype(np.int64)
+    lengths = index.term_end[numbers].astype(np.int64) - starts
+    rows = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    docs = np.repeat(numbers, lengths)
+
+    terms = index.term_ids[rows]
+    order = np.argsort(terms, kind='stable')     # stable: documents stay in order within a term
+    rows, docs, terms = rows[order], docs[order], terms[order]
+    bounds = np.searchsorted(terms, np.arange(partitions + 1) * partition_width)
+
+    anchor_cache = {}
+    runs = []
+    for partition in range(partitions):
+        low, high = int(bounds[partition]), int(bounds[partition + 1])
+        if low == high:
+            continue
+        records, current_term, postings = [], None, None
+        for row, number, term in zip(rows[low:high].tolist(), docs[low:high].tolist(), terms[low:high].tolist()):
+            if term != current_term:
+                postings = []
+                records.append((term, postings))
+                current_term = term
+            counts = index.counts[row].tolist()
+            positions = index.positions_data[index.position_start[row]:index.position_start[row + 1]].tolist()
+            doc_length = int(index.doc_lengths[number])
+            if kind == "html":
+                if number not in anchor_cache:
+                    anchor_cache[number] = anchor_counts(number)
+                postings.append(html_posting(number, counts, positions, doc_length, anchor_cache[number].get(term, 0)))
+            elif kind == "pdf":
+                postings.append(paper_posting(number, counts, positions, doc_length))
+            else:
+                postings.append(anchor_posting(number, counts, positions, doc_length))
+        runs.append(write_shard(shard_path(partition_dir(shard_dir, partition), first), records)["path"])
+    return runs
+
+
+def reduce_partition(task):
+    # Reduce: the runs of one term id range, merged in document order
+    out_path, run_paths = task
+    entry = write_shard(out_path, merge_runs(run_paths))
+    for path in run_paths:
+        os.remove(path)
+    return entry
+
+
+# ------------------ MAIN ------------------
+def main():
+    parser = argparse.ArgumentParser(description="Invert a binary forward index into inverted index part files.")
+    parser.add_argument("kind", choices=sorted(KINDS), help="html pages, pdf papers or the anchor text of the pages")
+    parser.add_argument("--partitions", type=int, default=PARTITIONS, help="term id ranges reduced in parallel")
+    args = parser.parse_args()
+    partitions = args.partitions
+    paths = KINDS[args.kind]
+    shard_dir = paths["shard_dir"]
+    for partition in range(partitions):
+        os.makedirs(partition_dir(shard_dir, partition), exist_ok=True)
+
+    inverse_lexicon_path = lexicon_tables(LEXICON_PATH)[1]
+    term_count = len(StringList(inverse_lexicon_path))
+    partition_width = -(-term_count // partitions) or 1
+    index = BinaryForwardIndex(paths["forward_index"])
+    numbers = index.doc_numbers().tolist()
+
+    inputs = [paths["forward_index"], LEXICON_PATH]
+    anchors = None
+    if args.kind == "html":
+        inputs.append(ANCHOR_INDEX_PATH)
+        anchors = BinaryForwardIndex(ANCHOR_INDEX_PATH)
+
+    # Finished parts are journaled, a restarted run skips them
+    checkpoint = Checkpoint(os.path.join(shard_dir, "checkpoint.jsonl"), inputs=inputs)
+    if len(checkpoint):
+        print(f"Resuming: {len(checkpoint)} parts already done")
+
+    manifest = []
+    with Pool(cpu_count(), initializer=init_worker,
+              initargs=(args.kind, index, anchors, partitions, partition_width)) as pool:
+        for i in range(0, len(numbers), BATCH_SIZE):
+            part_path = paths["part"].format(i // BATCH_SIZE + 1)
+            if checkpoint.done(part_path):
+                manifest.extend(checkpoint.data(part_path)["shards"])
+                continue
+
+            batch = numbers[i:i + BATCH_SIZE]
+            tasks = [(shard_dir, i + first, batch[first:first + CHUNK_SIZE]) for first in range(0, len(batch), CHUNK_SIZE)]
+            runs = {}
+            for chunk_runs in tqdm(pool.imap_unordered(invert_chunk, tasks), total=len(tasks),
+                                   desc=f"Inverting documents {i+1} to {i+len(batch)}", unit="chunks"):
+                for path in chunk_runs:
+                    runs.setdefault(os.path.dirname(path), []).append(path)
+
+            tasks = [(os.path.join(shard_dir, f"partition_{partition:03d}.msgpack"), sorted(runs[partition_dir(shard_dir, partition)]))
+                     for partition in range(partitions) if partition_dir(shard_dir, partition) in runs]
+            shards = list(tqdm(pool.imap(reduce_partition, tasks), total=len(tasks),
+                               desc="Merging term ranges", unit="ranges"))
+
+            write_dense_json(part_path, [shard["path"] for shard in shards], term_count)
+            for shard in shards:
+                shard["part"] = part_path
+                os.remove(shard["path"])
+            checkpoint.record(part_path, [part_path], shards=shards)
+            manifest.extend(shards)
+            write_manifest(os.path.join(shard_dir, "shards_manifest.json"), manifest)
+    checkpoint.finish()
+
+    print(f"Inverted {len(numbers)} documents into {-(-len(numbers) // BATCH_SIZE)} parts")
+
+
+if __name__ == "__main__":
+    main()
@@ -36,38 +36,38 @@
         ], ...
     }
 """
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 from multiprocessing import Pool, cpu_count
 from tqdm import tqdm
 import pandas as pd
 import json
-import re
+import os
+import sys
 
-doc_id_to_url = {}
-with open('..\\Data\\ind_to_url.json', 'r', encoding='utf-8') as f:
-    doc_id_to_url = json.load(f)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from checkpoint import Checkpoint
+from html_extractor import extract_zones
+from shards import chunk_ranges, shard_path, write_dense_json, write_manifest, write_shard
+from shared_tables import (IntLists, StringList, StringTable, build_string_list, forward_index_tables,
+                           lexicon_tables, url_table)
+from tokenizer import html_tokens
+
+# Memory-mapped, so spawned workers that import this module do not each load the JSON
+doc_id_to_url = StringList(url_table(os.path.join("..", "Data", "ind_to_url.json")))
 
 
 def normalize_and_tokenize(text):
-    text = re.sub(r'\n', ' ', text)
-    text = re.sub(r'(?<!\d)[^\w\s]|[^\w\s](?!\d)', ' ', text)
-    text = re.sub(r"\s+", " ", text).strip()
-    return text.lower().split(' ')
+    return list(html_tokens(text))
 
 from collections import Counter, defaultdict
-from urllib.parse import urlparse
-from bs4 import BeautifulSoup
-import re
 
 def process_file_for_word(args):
     file_path, words, anchors_used = args
     with open(file_path, 'r', encoding='utf-8') as f:
         html = f.read()
     
-    soup = BeautifulSoup(html, 'lxml')  
-    text = soup.get_text()
-    tokens = normalize_and_tokenize(text)
+    zones = extract_zones(html)
+    tokens = normalize_and_tokenize(zones.text)
     doc_length = len(tokens)
     
     tokens_counter = Counter(tokens)
@@ -78,26 +78,24 @@ def process_file_for_word(args):
             positions_map[tok].append(i)
     
     title_text = []
-    if soup.title:
-        title_text = normalize_and_tokenize(soup.title.text)
+    if zones.title:
+        title_text = normalize_and_tokenize(zones.title)
     title_counter = Counter(title_text)
     
     meta_desc_text = []
-    meta_tag = soup.find('meta', attrs={'name': 'description'})
-    if meta_tag and 'content' in meta_tag.attrs:
-        meta_desc_text = normalize_and_tokenize(meta_tag['content'])
+    if zones.meta_description:
+        meta_desc_text = normalize_and_tokenize(zones.meta_description)
     meta_counter = Counter(meta_desc_text)
     
     headings = []
-    for i in range(1, 7):
-        for heading in soup.find_all(f'h{i}'):
-            headings.extend(normalize_and_tokenize(heading.text))
+    for heading in zones.headings:
+        headings.extend(normalize_and_tokenize(heading))
     headings_counter = Counter(headings)
     
     anchors_tokens = normalize_and_tokenize(anchors_used)
     anchors_counter = Counter(anchors_tokens)
     
-    document_id = "H" + file_path.split('\\')[-1].split('.')[0]
+    document_id = "H" + os.path.basename(file_path).split('.')[0]
     url = doc_id_to_url.get(document_id.replace("H", ""), "")
     url_path = urlparse(url).path
     domain = urlparse(url).netloc
@@ -121,69 +119,106 @@ def process_file_for_word(args):
     
     return hit_lists
 
-def main():    
-    lexicon = {}
-    with open('..\\Lexicon\\lexicons_ids.json', 'r', encoding='utf-8') as f:
-        lexicon = json.load(f)
-    
-    inverse_lexicon = {v: k for k, v in lexicon.items()}
+# ------------------ Workers ------------------
+CHUNK_SIZE = 250    # documents per worker task, one shard file per chunk
 
-    forward_index_path = '..\\Forward Index\\forward_index_html_files.json'
-    with open(forward_index_path, 'r', encoding='utf-8') as f:
-        forward_index = json.load(f)
-    
+
+def init_worker(lexicon_arg, inverse_lexicon_arg, file_ids_arg, rows_arg, anchors_arg, shard_dir_arg):
+    # The tables arrive as file paths and are memory-mapped, so the workers
+    # share one copy of them instead of getting the word lists through the queue
+    global lexicon, inverse_lexicon, file_ids, rows, anchors, shard_dir
+    lexicon = lexicon_arg
+    inverse_lexicon = inverse_lexicon_arg
+    file_ids = file_ids_arg
+    rows = rows_arg
+    anchors = anchors_arg
+    shard_dir = shard_dir_arg
+
+
+def build_anchor_table(file_ids, anchors_path=os.path.join("..", "Inverted Index", "html_anchors.table")):
+    """Anchor text of every forward index row, shared with the workers like the other tables."""
     # page_rank_links = pd.read_csv('..\\Data\\Page_rank_files\\url_to_anchor_text.csv')
     url_to_anchor = {}
-    with open('..\\Data\\Page_rank_files\\url_to_anchor_text.json', 'r', encoding='utf-8') as f:
+    with open(os.path.join("..", "Data", "Page_rank_files", "url_to_anchor_text.json"), 'r', encoding='utf-8') as f:
         url_to_anchor = json.load(f)
     print(f"Loaded Links Data")
-    
-    args = []
 
-    
-    def prepare_args(file_id):
-        words = forward_index[file_id]
-        words = [inverse_lexicon[word_id] for word_id in words]
-        file_path = f"..\\Data\\Files\\raw\\{file_id}.html"
-        anchors = url_to_anchor.get(doc_id_to_url.get(file_id, ""), "")
-        return (file_path, words, anchors)
+    build_string_list(anchors_path, (
+        url_to_anchor.get(doc_id_to_url.get(file_ids[row], ""), "")
+        for row in tqdm(range(len(file_ids)), desc="Preparing anchors", unit="files")
+    ))
+    return StringList(anchors_path)
+
+
+def process_row(row):
+    file_id = file_ids[row]
+    words = [inverse_lexicon[word_id] for word_id in rows[row]]
+    file_path = os.path.join("..", "Data", "Files", "raw", f"{file_id}.html")
+    return process_file_for_word((file_path, words, anchors[row]))
 
-    file_ids_list = list(forward_index.keys())
-    args = []
 
-    for file_id in tqdm(file_ids_list, desc="Preparing arguments", unit="files", total=len(file_ids_list)):
-        args.append(prepare_args(file_id))
+def process_chunk(task):
+    # The hit lists stay in the worker: they are written to a shard sorted by
+    # word id and only the shard's manifest entry goes back to the parent
+    first_row, end_row = task
+    inverted_index = defaultdict(list)
+    for row in range(first_row, end_row):
+        for word, hit_list in process_row(row).items():
+            inverted_index[lexicon[word]].append(hit_list)
+    return write_shard(shard_path(shard_dir, first_row), sorted(inverted_index.items()))
+
+
+def main():    
+    lexicon_path = os.path.join("..", "Lexicon", "lexicons_ids.json")
+    lexicon_table_path, inverse_lexicon_path = lexicon_tables(lexicon_path)
+    lexicon = StringTable(lexicon_table_path)
+    inverse_lexicon = StringList(inverse_lexicon_path)
+
+    forward_index_path = os.path.join("..", "Forward Index", "forward_index_html_files.json")
+    file_ids_path, rows_path = forward_index_tables(forward_index_path)
+    file_ids = StringList(file_ids_path)
+    rows = IntLists(rows_path)
+    
+    anchors = build_anchor_table(file_ids)
 
-    args = args
+    shard_dir = os.path.join("..", "Inverted Index", "Shards", "html")
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest = []
 
-    del forward_index
-    del url_to_anchor
+    # Finished chunks and parts are journaled, a restarted run skips them
+    checkpoint = Checkpoint(os.path.join(shard_dir, "checkpoint.jsonl"),
+                            inputs=[lexicon_path, forward_index_path, os.path.join("..", "Data", "ind_to_url.json"),
+                                    os.path.join("..", "Data", "Page_rank_files", "url_to_anchor_text.json")])
+    if len(checkpoint):
+        print(f"Resuming: {len(checkpoint)} chunks and parts already done")
 
     batch_size = 10000
-    for i in range(0, len(args), batch_size):
-        inverted_index = {}
-        for word, word_id in lexicon.items(): 
-            inverted_index[word_id] = []
-        batch_args = args[i:i + batch_size]
-        with Pool(processes=cpu_count()) as pool:
-            results = list(tqdm(pool.imap(process_file_for_word, batch_args), 
-                                total=len(batch_args), 
-                                desc=f"Processing files {i+1} to {min(i+batch_size, len(args))}", 
-                                unit="files"))
-        
-        for hit_lists in results:
-            for word, hit_list in hit_lists.items():
-                word_id = lexicon[word]
-                inverted_index[word_id].append(hit_list)
-
-        with open(f'..\\Inverted Index\\inverted_index_part_{i//batch_size + 1}.json', 'w', encoding='utf-8') as f:
-            json.dump(inverted_index, f)
-        
-        del results
-        del batch_args
-
-    del args
-    del lexicon
+    with Pool(processes=cpu_count(), initializer=init_worker,
+              initargs=(lexicon, inverse_lexicon, file_ids, rows, anchors, shard_dir)) as pool:
+        for i in range(0, len(file_ids), batch_size):
+            part_path = os.path.join("..", "Inverted Index", f"inverted_index_part_{i//batch_size + 1}.json")
+            if checkpoint.done(part_path):
+                manifest.extend(checkpoint.data(part_path)["shards"])
+                continue
+
+            tasks = chunk_ranges(i, min(i + batch_size, len(file_ids)), CHUNK_SIZE)
+            todo = [task for task in tasks if not checkpoint.done(shard_path(shard_dir, task[0]))]
+            for shard in tqdm(pool.imap_unordered(process_chunk, todo),
+                              total=len(todo),
+                              desc=f"Processing files {i+1} to {min(i+batch_size, len(file_ids))}",
+                              unit="chunks"):
+                checkpoint.record(shard["path"], [shard["path"]], shard=shard)
+            shards = [checkpoint.data(shard_path(shard_dir, first))["shard"] for first, _ in tasks]
+
+            write_dense_json(part_path, [shard["path"] for shard in shards], len(inverse_lexicon))
+            for shard in shards:
+                shard["part"] = part_path
+            checkpoint.record(part_path, [part_path], shards=shards)
+            for shard in shards:
+                os.remove(shard["path"])
+            manifest.extend(shards)
+            write_manifest(os.path.join(shard_dir, "shards_manifest.json"), manifest)
+    checkpoint.finish()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,22 @@
+"""
+Merge the anchor text inverted index batches of invert_forward_index.py
+(kind "anchor") into a single file, streaming them like merge_json_batches.py.
+"""
+
+import os
+
+from stream_merge_indexes import find_parts, merge_part_files
+
+
+def main():
+    batch_dir = os.path.join("..", "Inverted Index", "AnchorBatches")
+    output_file = os.path.join(batch_dir, "anchor_index.json")
+
+    batches = find_parts(batch_dir, "anchor_index_part_")
+    merge_part_files(batches, output_file)
+
+    print(f"Done! Merged anchor index saved to: {output_file}")
+
+
+if __name__ == "__main__":
+    main()
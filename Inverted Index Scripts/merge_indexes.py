@@ -1,16 +1,7 @@
-import json 
+import os
 
-inverted_index = {}
+from stream_merge_indexes import find_parts, merge_part_files
 
-for i in range(1, 6):
-    with open(f'..\\Inverted Index\\inverted_index_part_{i}.json', 'r', encoding='utf-8') as f:
-        part_index = json.load(f)
-    for word_id, postings in part_index.items():
-        if word_id not in inverted_index:
-            inverted_index[word_id] = []
-        inverted_index[word_id].extend(postings)
-    del part_index
-    print(f"Merged part {i}")
-
-with open('..\\Inverted Index\\inverted_index.json', 'w', encoding='utf-8') as f:
-    json.dump(inverted_index, f)
+# Streams every inverted_index_part_<n>.json the HTML builder wrote, however many there are
+parts = find_parts(os.path.join("..", "Inverted Index"), 'inverted_index_part_')
+merge_part_files(parts, os.path.join("..", "Inverted Index", "inverted_index.json"))
@@ -0,0 +1,601 @@
+"""
+Incremental indexing with immutable segments (LSM style).
+
+New pages and papers do not require rebuilding the lexicon, forward index,
+inverted index and barrels of the whole corpus any more. They are indexed
+into a small segment of their own:
+
+    ../Segments/
+        segments.json          -> manifest: generation number + the live segments, oldest first
+        seg_000001/            -> one immutable segment
+            0.msgpack ...      -> barrels, same format as ../Barrels
+            barrels_index.json -> word -> [barrel_number, offset_in_barrel]
+            segment.json       -> document ids and sizes of the segment
+
+A segment is written to a temporary folder and renamed into place before the
+manifest (rewritten atomically) makes it live, so readers only ever see
+complete segments. The full build in ../Barrels can be registered as a segment
+as well (`adopt`), then queries see the old corpus and every new segment.
+
+Queries go through SegmentSearcher, which looks a word up in every live
+segment and concatenates the posting lists, oldest segment first.
+
+Deleting a document does not touch the barrels: its internal doc number (see
+util_scripts/doc_ids.py) is set in the tombstone bitmap of every live segment
+holding it, and SegmentReader drops tombstoned postings while reading a
+hitlist. Tombstone files are never rewritten in place, every change writes a
+new `<segment>.<generation>.del` file that the manifest points to. Adding a
+document that is already indexed is an update: the new segment goes live and
+the old versions get tombstones in the same manifest change. Only documents
+a segment actually holds are tombstoned in it: the new segments list their
+documents in segment.json, the adopted full build gets a bitmap of the
+documents in its postings when it is adopted.
+
+A tiered merge policy keeps the number of segments small: segments are
+grouped into tiers by document count (powers of MERGE_FACTOR) and as soon as a
+tier holds MERGE_FACTOR segments they are compacted into one. Compaction skips
+tombstoned postings, and a segment with more than PURGE_RATIO of its documents
+deleted is rewritten on its own. `watch` runs the policy in a loop so it can be
+left running as a background process; `purge` rewrites every segment with
+deletes, the adopted full build included.
+
+Usage:
+    python segments.py add --pages 1200 1201 --papers 88000
+    python segments.py delete --pages 1200 --papers 88000
+    python segments.py adopt ../Barrels
+    python segments.py purge
+    python segments.py merge
+    python segments.py watch --interval 60
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+
+import orjson
+import ormsgpack
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Forward Index Scripts"))
+from barrel_writer import BARREL_SIZE_MB, BarrelWriter
+from binary_forward_index import HTML_ZONES, BinaryForwardIndex
+from doc_ids import doc_number
+from shards import merge_runs, merge_streams
+from shared_tables import StringList, StringTable, lexicon_tables, url_table
+from tombstones import TombstoneBitmap, posting_doc_id
+
+import forward_index
+from JSONinvertedIndex import process_json_file
+from spimi_inverted_index import SpimiAccumulator
+
+SEGMENTS_DIR = os.path.join("..", "Segments")
+LEXICON_PATH = os.path.join("..", "Lexicon", "lexicons_ids.json")
+IND_TO_URL_PATH = os.path.join("..", "Data", "ind_to_url.json")
+HTML_FILES_DIR = os.path.join("..", "Data", "Files", "raw")
+JSON_FILES_DIR = os.path.join("..", "Data", "Cord 19", "document_parses", "pdf_json")
+ANCHOR_INDEX_PATH = os.path.join("..", "Inverted Index", "anchor_index.bin")
+
+MERGE_FACTOR = 10
+PURGE_RATIO = 0.2
+SEGMENT_RAM_MB = 256
+LOCK_TIMEOUT_SECONDS = 600
+
+
+# ------------------ Manifest ------------------
+class ManifestLock:
+    """Exclusive lock around manifest updates, shared by `add` and the merger."""
+
+    def __init__(self, segments_dir):
+        self.path = os.path.join(segments_dir, "segments.lock")
+
+    def __enter__(self):
+        deadline = time.time() + LOCK_TIMEOUT_SECONDS
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                if time.time() > deadline:
+                    raise TimeoutError(f"Could not lock {self.path}, remove it if no other indexer is running")
+                time.sleep(0.2)
+
+    def __exit__(self, *exc):
+        os.remove(self.path)
+
+
+def load_manifest(segments_dir):
+    path = os.path.join(segments_dir, "segments.json")
+    if not os.path.exists(path):
+        return {"generation": 0, "next_segment": 1, "segments": []}
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def save_manifest(segments_dir, manifest):
+    manifest["generation"] += 1
+    path = os.path.join(segments_dir, "segments.json")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def segment_path(segments_dir, entry):
+    return os.path.normpath(os.path.join(segments_dir, entry["path"]))
+
+
+def segment_doc_ids(segments_dir, entry):
+    with open(os.path.join(segment_path(segments_dir, entry), "segment.json"), 'rb') as f:
+        return orjson.loads(f.read())["doc_ids"]
+
+
+# ------------------ Tombstones ------------------
+def load_tombstones(segments_dir, entry):
+    """Tombstone bitmap of a manifest entry, None if nothing in it was deleted."""
+    if not entry.get("tombstones"):
+        return None
+    return TombstoneBitmap.load(os.path.join(segments_dir, entry["tombstones"]))
+
+
+def set_tombstones(segments_dir, manifest, entry, bitmap):
+    """Write `bitmap` as a new tombstone file of `entry`, returns the file it replaces."""
+    name = f"{os.path.basename(entry['path'])}.{manifest['generation'] + 1}.del"
+    bitmap.save(os.path.join(segments_dir, name))
+    replaced = entry.get("tombstones")
+    entry["tombstones"] = name
+    entry["deleted"] = len(bitmap)
+    return replaced
+
+
+def posting_documents(path):
+    """Bitmap of the documents that have postings in the barrels at `path`."""
+    doc_ids = set()
+    for _, postings in SegmentReader(path).iter_words():
+        doc_ids.update(posting_doc_id(posting) for posting in postings)
+    documents = TombstoneBitmap()
+    for doc_id in doc_ids:
+        documents.add(doc_number(doc_id))
+    return documents
+
+
+def base_documents(segments_dir, entry):
+    """Bitmap of the documents of the adopted full build."""
+    if not entry.get("documents"):
+        # Adopted before the bitmap was recorded, record it now (saved with the manifest)
+        entry["documents"] = f"{os.path.basename(entry['path'])}.docs"
+        posting_documents(segment_path(segments_dir, entry)).save(os.path.join(segments_dir, entry["documents"]))
+    return TombstoneBitmap.load(os.path.join(segments_dir, entry["documents"]))
+
+
+def mark_deleted(segments_dir, manifest, doc_ids):
+    """
+    Tombstone `doc_ids` in every live segment of the manifest that holds them.
+    Call with the lock held and save the manifest afterwards; returns the
+    replaced tombstone files, which can be removed once the manifest is saved.
+    """
+    replaced = []
+    for entry in manifest["segments"]:
+        if entry.get("base"):
+            held = base_documents(segments_dir, entry)
+            numbers = [number for number in map(doc_number, doc_ids) if number in held]
+        else:
+            held = set(segment_doc_ids(segments_dir, entry))
+            numbers = [doc_number(doc_id) for doc_id in doc_ids if doc_id in held]
+        if not numbers:
+            continue
+        bitmap = load_tombstones(segments_dir, entry) or TombstoneBitmap()
+        if all(number in bitmap for number in numbers):
+            continue
+        for number in numbers:
+            bitmap.add(number)
+        old = set_tombstones(segments_dir, manifest, entry, bitmap)
+        if old:
+            replaced.append(old)
+    return replaced
+
+
+def remove_files(segments_dir, names):
+    for name in names:
+        try:
+            os.remove(os.path.join(segments_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+def delete_documents(page_ids, paper_ids, segments_dir=SEGMENTS_DIR):
+    """Tombstone pages/papers so queries stop returning them."""
+    doc_ids = ["P" + str(paper_id) for paper_id in paper_ids] + ["H" + str(page_id) for page_id in page_ids]
+    with ManifestLock(segments_dir):
+        manifest = load_manifest(segments_dir)
+        replaced = mark_deleted(segments_dir, manifest, doc_ids)
+        save_manifest(segments_dir, manifest)
+    remove_files(segments_dir, replaced)
+    print(f"Deleted {len(doc_ids)} documents")
+
+
+# ------------------ Indexing new documents ------------------
+def init_worker(lexicon_arg, index_to_url_arg):
+    global lexicon
+    lexicon = lexicon_arg
+    forward_index.init_worker(index_to_url_arg, lexicon_arg)
+
+
+def new_paper_records(file_path):
+    hitlists = process_json_file((file_path, None))
+    return [(lexicon[word], entry) for word, entry in hitlists.items() if word in lexicon]
+
+
+def new_page_records(file_path):
+    # Same words and counts as the full build: the forward index row of the page, with
+    # the anchor counts of the anchor field index (invert_forward_index.html_posting)
+    document_id = "H" + os.path.basename(file_path).split('.')[0]
+    number = doc_number(document_id)
+    word_ids, doc_length, counts, positions = forward_index.process_page(file_path)
+    anchor_counts = {}
+    if number in anchors:
+        terms, term_counts = anchors.term_frequencies(number, "anchor")
+        anchor_counts = dict(zip(terms.tolist(), term_counts.tolist()))
+    records = []
+    for i, word_id in enumerate(word_ids):
+        title, meta, headings, total, in_domain, in_url = counts[i * len(HTML_ZONES):(i + 1) * len(HTML_ZONES)]
+        hit_counter = [title, meta, headings, total, anchor_counts.get(word_id, 0), in_domain, in_url, doc_length]
+        records.append((word_id, [document_id, positions[i], hit_counter]))
+    return records
+
+
+def init_page_worker(lexicon_arg, index_to_url_arg, anchors_arg):
+    global anchors
+    init_worker(lexicon_arg, index_to_url_arg)
+    anchors = anchors_arg
+
+
+def write_segment(segments_dir, name, postings_stream, doc_ids):
+    """Write (word, postings) pairs as a new segment folder, atomically."""
+    final_dir = os.path.join(segments_dir, name)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    writer = BarrelWriter(tmp_dir, BARREL_SIZE_MB)
+    for word, postings in postings_stream:
+        writer.add(word, postings)
+    barrels = writer.close()
+
+    # doc_ids may be filled while the stream is consumed (compaction), read it afterwards
+    doc_ids = sorted(doc_ids, key=doc_number)
+    with open(os.path.join(tmp_dir, "segment.json"), 'w', encoding='utf-8') as f:
+        json.dump({"docs": len(doc_ids), "barrels": barrels, "doc_ids": doc_ids}, f)
+    os.replace(tmp_dir, final_dir)
+    return {"path": name, "docs": len(doc_ids)}
+
+
+def add_documents(page_ids, paper_ids, segments_dir=SEGMENTS_DIR):
+    """Index new pages/papers into a fresh segment and make it live."""
+    os.makedirs(segments_dir, exist_ok=True)
+    # Memory-mapped tables, the workers get their paths instead of pickled dicts
+    lexicon_path, inverse_lexicon_path = lexicon_tables(LEXICON_PATH)
+    lexicon = StringTable(lexicon_path)
+    inverse_lexicon = StringList(inverse_lexicon_path)
+    index_to_url = StringList(url_table(IND_TO_URL_PATH))
+
+    missing = [page_id for page_id in page_ids if not index_to_url.get(page_id)]
+    if missing:
+        raise KeyError(f"Pages {missing[:10]} have no URL in {IND_TO_URL_PATH}, add them there first")
+
+    if page_ids and not os.path.exists(ANCHOR_INDEX_PATH):
+        # Without it the pages would get no anchor counts, unlike in the full build
+        raise FileNotFoundError(f"{ANCHOR_INDEX_PATH} is missing, build it with anchor_index.py first")
+
+    with ManifestLock(segments_dir):
+        manifest = load_manifest(segments_dir)
+        name = f"seg_{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        save_manifest(segments_dir, manifest)
+
+    run_dir = os.path.join(segments_dir, name + ".runs")
+    accumulator = SpimiAccumulator(run_dir, SEGMENT_RAM_MB * 1024 * 1024)
+    processes = max(1, min(cpu_count(), len(page_ids) + len(paper_ids)))
+
+    # Papers first, then pages, like the full build
+    if paper_ids:
+        tasks = [os.path.join(JSON_FILES_DIR, f"{paper_id}.json") for paper_id in paper_ids]
+        with Pool(processes, initializer=init_worker, initargs=(lexicon, index_to_url)) as pool:
+            for records in tqdm(pool.imap(new_paper_records, tasks), total=len(tasks), desc="Indexing papers"):
+                for word_id, posting in records:
+                    accumulator.add(word_id, posting)
+    if page_ids:
+        tasks = [os.path.join(HTML_FILES_DIR, f"{page_id}.html") for page_id in page_ids]
+        anchors = BinaryForwardIndex(ANCHOR_INDEX_PATH)
+        with Pool(processes, initializer=init_page_worker, initargs=(lexicon, index_to_url, anchors)) as pool:
+            for records in tqdm(pool.imap(new_page_records, tasks), total=len(tasks), desc="Indexing pages"):
+                for word_id, posting in records:
+                    accumulator.add(word_id, posting)
+
+    doc_ids = ["P" + str(paper_id) for paper_id in paper_ids] + ["H" + str(page_id) for page_id in page_ids]
+    postings = ((inverse_lexicon[word_id], postings) for word_id, postings in merge_runs(accumulator.finish()))
+    entry = write_segment(segments_dir, name, postings, doc_ids)
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+    # Documents that are already indexed get replaced: the old versions are
+    # tombstoned in the same manifest change that makes the new segment live
+    with ManifestLock(segments_dir):
+        manifest = load_manifest(segments_dir)
+        replaced = mark_deleted(segments_dir, manifest, doc_ids)
+        manifest["segments"].append(entry)
+        save_manifest(segments_dir, manifest)
+    remove_files(segments_dir, replaced)
+    print(f"Segment {name} is live with {len(doc_ids)} documents")
+    return entry
+
+
+def adopt_barrels(barrels_dir, segments_dir=SEGMENTS_DIR):
+    """Register an existing barrels folder (e.g. the full build) as the oldest segment."""
+    os.makedirs(segments_dir, exist_ok=True)
+    # Its documents, so that only deletes of documents it holds tombstone it
+    documents = posting_documents(barrels_dir)
+    barrels_dir = os.path.relpath(os.path.abspath(barrels_dir), os.path.abspath(segments_dir))
+    with ManifestLock(segments_dir):
+        manifest = load_manifest(segments_dir)
+        if any(entry["path"] == barrels_dir for entry in manifest["segments"]):
+            print(f"{barrels_dir} is already a segment")
+            return
+        documents_file = f"{os.path.basename(barrels_dir)}.docs"
+        documents.save(os.path.join(segments_dir, documents_file))
+        # The full build is never rewritten by the merge policy, hence no doc count tier
+        manifest["segments"].insert(0, {"path": barrels_dir, "docs": None, "base": True, "documents": documents_file})
+        save_manifest(segments_dir, manifest)
+    print(f"Registered {barrels_dir} as the base segment")
+
+
+# ------------------ Searching ------------------
+class SegmentReader:
+    """Read access to the barrels of one segment, skipping tombstoned documents."""
+
+    def __init__(self, path, tombstones=None):
+        self.path = path
+        self.tombstones = tombstones
+        self.tombstones_file = None
+        with open(os.path.join(path, "barrels_index.json"), 'rb') as f:
+            self.barrels_index = orjson.loads(f.read())
+
+    def load_barrel(self, barrel_id):
+        with open(os.path.join(self.path, f"{barrel_id}.msgpack"), 'rb') as f:
+            return ormsgpack.unpackb(f.read())
+
+    def postings(self, word):
+        indices = self.barrels_index.get(word)
+        if indices is None:
+            return []
+        postings = self.load_barrel(indices[0])[indices[1]]
+        if self.tombstones is not None:
+            postings = self.tombstones.live_postings(postings)
+        return postings
+
+    def iter_words(self):
+        """Yield (word, postings) barrel by barrel, holding one barrel in memory."""
+        by_barrel = {}
+        for word, (barrel_id, offset) in self.barrels_index.items():
+            by_barrel.setdefault(barrel_id, []).append((offset, word))
+        for barrel_id in sorted(by_barrel):
+            barrel = self.load_barrel(barrel_id)
+            for offset, word in sorted(by_barrel[barrel_id]):
+                postings = barrel[offset]
+                if self.tombstones is not None:
+                    postings = self.tombstones.live_postings(postings)
+                if postings:
+                    yield word, postings
+
+
+class SegmentSearcher:
+    """Looks words up in every live segment; picks up new manifests on its own."""
+
+    def __init__(self, segments_dir=SEGMENTS_DIR):
+        self.segments_dir = segments_dir
+        self.generation = None
+        self.readers = []
+        self.refresh()
+
+    def refresh(self):
+        manifest = load_manifest(self.segments_dir)
+        if manifest["generation"] == self.generation:
+            return
+        cached = {reader.path: reader for reader in self.readers}
+        readers = []
+        for entry in manifest["segments"]:
+            path = segment_path(self.segments_dir, entry)
+            reader = cached.get(path) or SegmentReader(path)
+            if reader.tombstones_file != entry.get("tombstones"):
+                reader.tombstones = load_tombstones(self.segments_dir, entry)
+                reader.tombstones_file = entry.get("tombstones")
+            readers.append(reader)
+        self.readers = readers
+        self.generation = manifest["generation"]
+
+    def postings(self, word):
+        """Hitlist of a word across all live segments, oldest segment first."""
+        self.refresh()
+        merged = []
+        for reader in self.readers:
+            merged.extend(reader.postings(word))
+        return merged
+
+
+# ------------------ Merge policy ------------------
+def tier_of(entry):
+    return int(math.log(max(entry["docs"], 1), MERGE_FACTOR))
+
+
+def pick_merge(manifest):
+    """Oldest MERGE_FACTOR segments of the lowest full tier, or None."""
+    tiers = {}
+    for entry in manifest["segments"]:
+        if entry.get("base"):
+            continue
+        tiers.setdefault(tier_of(entry), []).append(entry)
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= MERGE_FACTOR:
+            return tiers[tier][:MERGE_FACTOR]
+    return None
+
+
+def pick_purge(manifest, include_base=False):
+    """First segment worth rewriting to drop its deleted postings, or None."""
+    for entry in manifest["segments"]:
+        if not entry.get("deleted"):
+            continue
+        if entry.get("base"):
+            if include_base:
+                return [entry]
+        elif include_base or entry["deleted"] >= PURGE_RATIO * entry["docs"]:
+            return [entry]
+    return None
+
+
+def merge_segments(entries, segments_dir, lexicon):
+    """Compact segments into one new segment without their tombstoned postings."""
+    readers = [
+        SegmentReader(segment_path(segments_dir, entry), load_tombstones(segments_dir, entry))
+        for entry in entries
+    ]
+    # Words the lexicon lost since a segment was written have no id to merge on,
+    # their postings are carried over after the other words, per segment
+    carried = [{} for _ in readers]
+
+    def by_word_id(number, reader):
+        for word, postings in reader.iter_words():
+            word_id = lexicon.get(word)
+            if word_id is None:
+                carried[number][word] = postings
+            else:
+                yield word_id, [(word, postings)]
+
+    # The adopted full build has no document list, so the ids are collected from the postings
+    doc_ids = set()
+
+    def merged_postings():
+        streams = [by_word_id(number, reader) for number, reader in enumerate(readers)]
+        for _, word_postings in merge_streams(streams):
+            postings = [posting for _, segment_postings in word_postings for posting in segment_postings]
+            doc_ids.update(posting_doc_id(posting) for posting in postings)
+            yield word_postings[0][0], postings
+        for word in sorted(set().union(*carried)):
+            postings = [posting for segment_words in carried for posting in segment_words.get(word, [])]
+            doc_ids.update(posting_doc_id(posting) for posting in postings)
+            yield word, postings
+
+    with ManifestLock(segments_dir):
+        manifest = load_manifest(segments_dir)
+        name = f"seg_{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        save_manifest(segments_dir, manifest)
+    return write_segment(segments_dir, name, merged_postings(), doc_ids)
+
+
+def compact(chosen, segments_dir, lexicon):
+    """Replace the chosen segments by one compacted segment, returns True on success."""
+    merged = merge_segments(chosen, segments_dir, lexicon)
+    chosen_paths = [entry["path"] for entry in chosen]
+    used_tombstones = {entry["path"]: entry.get("tombstones") for entry in chosen}
+    with ManifestLock(segments_dir):
+        manifest = load_manifest(segments_dir)
+        live = [entry for entry in manifest["segments"] if entry["path"] in chosen_paths]
+        if len(live) != len(chosen):
+            # Someone else compacted some of them in the meantime, drop our result
+            shutil.rmtree(os.path.join(segments_dir, merged["path"]), ignore_errors=True)
+            return False
+
+        # Documents deleted while the merge was running are still in the merged
+        # segment, carry their tombstones over
+        carried = TombstoneBitmap()
+        for entry in live:
+            if entry.get("tombstones") != used_tombstones[entry["path"]]:
+                current = load_tombstones(segments_dir, entry)
+                used = load_tombstones(segments_dir, {"tombstones": used_tombstones[entry["path"]]})
+                carried.update(current.difference(used) if used else current)
+        if carried:
+            set_tombstones(segments_dir, manifest, merged, carried)
+
+        position = manifest["segments"].index(live[0])
+        remaining = [entry for entry in manifest["segments"] if entry["path"] not in chosen_paths]
+        remaining.insert(position, merged)
+        manifest["segments"] = remaining
+        save_manifest(segments_dir, manifest)
+
+    remove_files(segments_dir, [entry["tombstones"] for entry in live if entry.get("tombstones")])
+    remove_files(segments_dir, [name for name in used_tombstones.values() if name])
+    for entry in live:
+        # The adopted full build is left on disk, it is only dropped from the manifest
+        if not entry.get("base"):
+            shutil.rmtree(os.path.join(segments_dir, entry["path"]), ignore_errors=True)
+    print(f"Compacted {len(chosen)} segments into {merged['path']} ({merged['docs']} documents)")
+    return True
+
+
+def maybe_merge(segments_dir=SEGMENTS_DIR, lexicon=None, include_base=False):
+    """Run one step of the merge/purge policy, returns True if segments were compacted."""
+    manifest = load_manifest(segments_dir)
+    chosen = pick_merge(manifest) or pick_purge(manifest, include_base)
+    if not chosen:
+        return False
+    if lexicon is None:
+        lexicon = StringTable(lexicon_tables(LEXICON_PATH)[0])
+    return compact(chosen, segments_dir, lexicon)
+
+
+def watch(segments_dir=SEGMENTS_DIR, interval=60):
+    """Background merge loop: compact whenever the policy finds a full tier or a purge."""
+    lexicon = StringTable(lexicon_tables(LEXICON_PATH)[0])
+    while True:
+        while maybe_merge(segments_dir, lexicon):
+            pass
+        time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental indexing with immutable segments.")
+    parser.add_argument("--segments-dir", default=SEGMENTS_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="index new documents into a new segment")
+    add.add_argument("--pages", nargs="*", default=[], help="ids of new HTML pages (Data/Files/raw/<id>.html)")
+    add.add_argument("--papers", nargs="*", default=[], help="ids of new papers (pdf_json/<id>.json)")
+
+    delete = commands.add_parser("delete", help="tombstone documents so queries stop returning them")
+    delete.add_argument("--pages", nargs="*", default=[])
+    delete.add_argument("--papers", nargs="*", default=[])
+
+    adopt = commands.add_parser("adopt", help="register an existing barrels folder as the base segment")
+    adopt.add_argument("barrels_dir")
+
+    commands.add_parser("merge", help="run the merge policy until no tier is full")
+    commands.add_parser("purge", help="rewrite every segment with deleted documents, the full build included")
+
+    watch_cmd = commands.add_parser("watch", help="keep running the merge policy in the background")
+    watch_cmd.add_argument("--interval", type=int, default=60)
+
+    args = parser.parse_args()
+    if args.command == "add":
+        add_documents(args.pages, args.papers, args.segments_dir)
+    elif args.command == "delete":
+        delete_documents(args.pages, args.papers, args.segments_dir)
+    elif args.command == "adopt":
+        adopt_barrels(args.barrels_dir, args.segments_dir)
+    elif args.command == "merge":
+        while maybe_merge(args.segments_dir):
+            pass
+    elif args.command == "purge":
+        while maybe_merge(args.segments_dir, include_base=True):
+            pass
+    else:
+        watch(args.segments_dir, args.interval)
+
+
+if __name__ == "__main__":
+    main()
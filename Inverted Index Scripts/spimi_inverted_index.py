@@ -0,0 +1,170 @@
+"""
+Single-pass, memory-bounded inverted index builder (SPIMI).
+
+Instead of building one dict with an entry for every lexicon word per batch of
+10,000 documents, dumping whole batches as JSON and merging them afterwards,
+this script:
+
+1. Publishes the lexicon and the PDF and HTML forward indexes as memory-mapped
+   tables (util_scripts/shared_tables.py) and sends row numbers to the worker
+   pool in slices, so only one slice of tasks is ever queued.
+2. Lets every worker turn its document into (word_id, posting) records using
+   the existing hit list code (process_json_file / process_file_for_word).
+3. Accumulates the records in a term dict and, as soon as the configured RAM
+   budget is used, spills it to disk as a run sorted by word id.
+4. k-way merges all runs straight into msgpack barrels + barrels_index.json.
+
+Runs are msgpack streams of [word_id, [posting, ...]] records. Postings are in
+the dropped-keys format the barrels use: [document_id, positions, hit_counter].
+Documents are processed PDFs first, then HTML, so the merged posting lists keep
+the order Barrels.py produced. Words without any posting are left out of the
+barrels index, which the query code already treats as "no results".
+"""
+
+import argparse
+import os
+import shutil
+import sys
+from collections import defaultdict
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
+import ormsgpack
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from barrel_writer import BARREL_SIZE_MB, BarrelWriter
+from shards import merge_runs
+from shared_tables import IntLists, StringList, StringTable, forward_index_tables, lexicon_tables
+
+from JSONinvertedIndex import process_json_file
+from inverted_index import build_anchor_table, process_file_for_word
+
+TASK_SLICE = 5000         # documents handed to the pool at a time
+POSTING_OVERHEAD = 300    # rough in-memory bytes of one posting besides its positions
+POSITION_BYTES = 36       # rough in-memory bytes of one position (list slot + int object)
+
+
+def init_worker(lexicon_arg, inverse_lexicon_arg, file_ids_arg, rows_arg, files_dir_arg, anchors_arg=None):
+    # All tables are memory-mapped and arrive as paths, tasks are just row numbers
+    global lexicon, inverse_lexicon, file_ids, rows, files_dir, anchors
+    lexicon = lexicon_arg
+    inverse_lexicon = inverse_lexicon_arg
+    file_ids = file_ids_arg
+    rows = rows_arg
+    files_dir = files_dir_arg
+    anchors = anchors_arg
+
+
+def paper_records(row):
+    words = [inverse_lexicon[w] for w in rows[row]]
+    hitlists = process_json_file((os.path.join(files_dir, f"{file_ids[row]}.json"), words))
+    return [(lexicon[word], entry) for word, entry in hitlists.items()]
+
+
+def html_records(row):
+    words = [inverse_lexicon[w] for w in rows[row]]
+    hit_lists = process_file_for_word((os.path.join(files_dir, f"{file_ids[row]}.html"), words, anchors[row]))
+    return [
+        (lexicon[word], [hit['document_id'], hit['positions'], hit['hit_counter']])
+        for word, hit in hit_lists.items()
+    ]
+
+
+# ------------------ SPIMI accumulator ------------------
+class SpimiAccumulator:
+    """Collects postings per word id and spills sorted runs once the RAM budget is used."""
+
+    def __init__(self, run_dir, ram_budget_bytes, run_prefix="run"):
+        self.run_dir = run_dir
+        self.ram_budget_bytes = ram_budget_bytes
+        self.run_prefix = run_prefix
+        self.run_paths = []
+        self.postings = defaultdict(list)
+        self.used_bytes = 0
+        os.makedirs(run_dir, exist_ok=True)
+
+    def add(self, word_id, posting):
+        self.postings[word_id].append(posting)
+        self.used_bytes += POSTING_OVERHEAD + POSITION_BYTES * len(posting[1])
+        if self.used_bytes >= self.ram_budget_bytes:
+            self.spill()
+
+    def spill(self):
+        if not self.postings:
+            return
+        run_path = os.path.join(self.run_dir, f"{self.run_prefix}_{len(self.run_paths):05d}.msgpack")
+        with open(run_path, 'wb') as f:
+            for word_id in sorted(self.postings):
+                f.write(ormsgpack.packb([word_id, self.postings[word_id]]))
+        self.run_paths.append(run_path)
+        self.postings = defaultdict(list)
+        self.used_bytes = 0
+
+    def finish(self):
+        """Spill whatever is left and return the run files in the order they were written."""
+        self.spill()
+        return self.run_paths
+
+
+# ------------------ Input ------------------
+def feed_pool(pool, worker, tasks, accumulator, desc):
+    with tqdm(desc=desc, unit="files") as progress:
+        while True:
+            task_slice = list(islice(tasks, TASK_SLICE))
+            if not task_slice:
+                break
+            for records in pool.imap(worker, task_slice, chunksize=16):
+                for word_id, posting in records:
+                    accumulator.add(word_id, posting)
+            progress.update(len(task_slice))
+
+
+# ------------------ MAIN ------------------
+def main():
+    parser = argparse.ArgumentParser(description="Build the barrels with a memory-bounded SPIMI pass.")
+    parser.add_argument("--ram-mb", type=int, default=2048, help="postings kept in RAM before a run is spilled")
+    parser.add_argument("--barrel-size-mb", type=float, default=BARREL_SIZE_MB)
+    parser.add_argument("--run-dir", default=os.path.join("..", "Inverted Index", "SpimiRuns"))
+    parser.add_argument("--barrels-dir", default=os.path.join("..", "Barrels"))
+    parser.add_argument("--keep-runs", action="store_true", help="do not delete the run files after merging")
+    args = parser.parse_args()
+
+    lexicon_path = os.path.join("..", "Lexicon", "lexicons_ids.json")
+    pdf_forward_index_path = os.path.join("..", "Forward Index", "forward_index_pdf_files.json")
+    html_forward_index_path = os.path.join("..", "Forward Index", "forward_index_html_files.json")
+    json_files_dir = os.path.join("..", "Data", "Cord 19", "document_parses", "pdf_json")
+    html_files_dir = os.path.join("..", "Data", "Files", "raw")
+
+    lexicon_table_path, inverse_lexicon_path = lexicon_tables(lexicon_path)
+    lexicon = StringTable(lexicon_table_path)
+    inverse_lexicon = StringList(inverse_lexicon_path)
+
+    accumulator = SpimiAccumulator(args.run_dir, args.ram_mb * 1024 * 1024)
+    file_ids_path, rows_path = forward_index_tables(pdf_forward_index_path)
+    file_ids, rows = StringList(file_ids_path), IntLists(rows_path)
+    with Pool(cpu_count(), initializer=init_worker,
+              initargs=(lexicon, inverse_lexicon, file_ids, rows, json_files_dir)) as pool:
+        feed_pool(pool, paper_records, iter(range(len(rows))), accumulator, "Indexing papers")
+
+    file_ids_path, rows_path = forward_index_tables(html_forward_index_path)
+    file_ids, rows = StringList(file_ids_path), IntLists(rows_path)
+    anchors = build_anchor_table(file_ids)
+    with Pool(cpu_count(), initializer=init_worker,
+              initargs=(lexicon, inverse_lexicon, file_ids, rows, html_files_dir, anchors)) as pool:
+        feed_pool(pool, html_records, iter(range(len(rows))), accumulator, "Indexing pages")
+    run_paths = accumulator.finish()
+    print(f"Spilled {len(run_paths)} sorted runs to {args.run_dir}")
+
+    writer = BarrelWriter(args.barrels_dir, args.barrel_size_mb)
+    for word_id, postings in tqdm(merge_runs(run_paths), desc="Merging runs into barrels", total=len(inverse_lexicon)):
+        writer.add(inverse_lexicon[word_id], postings)
+    barrel_count = writer.close()
+    print(f"Wrote {barrel_count} barrels and {writer.index_path}")
+
+    if not args.keep_runs:
+        shutil.rmtree(args.run_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Streaming k-way merge of inverted index part files.
+
+Every part is a JSON object {"word_id": [postings...], ...} whose keys appear in
+increasing word id order (the builders fill them from the lexicon, which is
+sorted by id). All parts are read in parallel with ijson, merged in word id
+order with a heap, and the postings of a word are concatenated in part order
+and written out straight away. Only the current word of every part is held in
+memory, so nothing is loaded fully and any number of parts can be merged.
+
+Usage: python stream_merge_indexes.py <output.json> <part_1.json> [<part_2.json> ...]
+"""
+
+import heapq
+import json
+import os
+import re
+import sys
+
+import ijson
+from tqdm import tqdm
+
+
+def find_parts(directory, prefix):
+    """All `<prefix><number>.json` files in a directory, sorted by their number."""
+    pattern = re.compile(re.escape(prefix) + r"(\d+)\.json$")
+    parts = []
+    for filename in os.listdir(directory):
+        match = pattern.match(filename)
+        if match:
+            parts.append((int(match.group(1)), os.path.join(directory, filename)))
+    return [path for _, path in sorted(parts)]
+
+
+def iter_part(part_path, part_number):
+    with open(part_path, 'rb') as f:
+        previous_id = -1
+        for word_id, postings in ijson.kvitems(f, ''):
+            word_id = int(word_id)
+            if word_id <= previous_id:
+                raise ValueError(
+                    f"{part_path} is not sorted by word id ({word_id} comes after {previous_id})"
+                )
+            previous_id = word_id
+            yield word_id, part_number, postings
+
+
+def merge_parts(part_paths):
+    """Yield (word_id, postings) in word id order with the postings of all parts concatenated."""
+    streams = [iter_part(path, number) for number, path in enumerate(part_paths)]
+    current_id, current_postings = None, []
+    for word_id, _, postings in heapq.merge(*streams, key=lambda record: record[:2]):
+        if word_id != current_id:
+            if current_id is not None:
+                yield current_id, current_postings
+            current_id, current_postings = word_id, []
+        current_postings.extend(postings)
+    if current_id is not None:
+        yield current_id, current_postings
+
+
+def merge_part_files(part_paths, output_path):
+    """Merge the part files into one JSON object, written one word at a time."""
+    if not part_paths:
+        raise FileNotFoundError("No inverted index parts to merge")
+
+    print(f"Merging {len(part_paths)} parts into {output_path}")
+    words = 0
+    with open(output_path, 'w', encoding='utf-8') as out:
+        out.write("{")
+        for word_id, postings in tqdm(merge_parts(part_paths), desc="Merging", unit="words"):
+            if words:
+                out.write(",")
+            out.write(f'"{word_id}":')
+            json.dump(postings, out)
+            words += 1
+        out.write("}")
+    print(f"Merged {words} words into {output_path}")
+    return words
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python stream_merge_indexes.py <output.json> <part_1.json> [<part_2.json> ...]")
+        sys.exit(1)
+    merge_part_files(sys.argv[2:], sys.argv[1])
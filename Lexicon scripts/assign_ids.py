@@ -1,4 +1,6 @@
 import json
+import os
+
 def assign_ids_to_words(input_file, output_file):
     with open(input_file, 'r', encoding='utf-8') as f:
         words = f.readlines()
@@ -10,5 +12,6 @@ def assign_ids_to_words(input_file, output_file):
 
 
 if __name__ == "__main__":
-    assign_ids_to_words('..\\Lexicon\\final_words_lexicon.txt', '..\\Lexicon\\lexicons_ids.json')
+    assign_ids_to_words(os.path.join("..", "Lexicon", "final_words_lexicon.txt"),
+                        os.path.join("..", "Lexicon", "lexicons_ids.json"))
 
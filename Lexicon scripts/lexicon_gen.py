@@ -1,58 +1,124 @@
+"""
+Counts the words of the HTML pages for lexicon_main.py.
+
+lexicon_words.json:        word -> number of occurrences in all pages
+lexicon_word_domains.json: word -> number of domains with a page containing it
+
+The counting is a map-reduce done by the workers:
+- map: the pages are grouped by domain and the domains packed into chunks, a
+  worker counts a whole chunk and writes a shard sorted by word with
+  [occurrences, domains]. A domain never spans two chunks, so the worker's
+  per-domain word sets are enough to count every domain exactly once.
+- reduce: the shards are merged a few at a time by the workers, level after
+  level (a tree, shards.tree_reduce), until one shard with the totals is left.
+The parent only hands out tasks and streams the last shard into the JSON files.
+"""
+
 import os
-from bs4 import BeautifulSoup
+import sys
+from collections import Counter, defaultdict
 from multiprocessing import Pool, cpu_count
 from urllib.parse import urlparse
-import re 
 from tqdm import tqdm
 import json
 
-def process_file(data):
-    file_path, domain = data
-    alphanum = {}
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from html_extractor import extract_text
+from shards import iter_run, shard_path, tree_reduce, write_shard
+from tokenizer import html_tokens
+
+CHUNK_FILES = 500       # pages per map task (a larger domain is one task on its own)
+
+
+def process_file(file_path):
+    alphanum = Counter()
     with open(file_path, 'r', encoding='utf-8') as f:
         file_content = f.read()
-    soup = BeautifulSoup(file_content, 'html.parser')
-    text = re.sub(r'\n', ' ', soup.get_text())
-    text = re.sub(r'(?<!\d)[^\w\s]|[^\w\s](?!\d)', ' ', text)
-    text = re.sub(r"\s+", " ", text).strip()
-    text = text.lower()
-    tokens = text.split(' ')
-    for word in tokens:
-        alphanum[word] = alphanum.get(word, 0) + 1
-    
-    return alphanum, domain
+    alphanum.update(html_tokens(extract_text(file_content)))
+    return alphanum
+
+
+def domain_chunks(files):
+    """Pack [(file_path, domain)] into chunks of whole domains, largest chunks first."""
+    by_domain = defaultdict(list)
+    for file_path, domain in files:
+        by_domain[domain].append(file_path)
+
+    chunks, current, size = [], [], 0
+    for domain in sorted(by_domain, key=lambda d: len(by_domain[d]), reverse=True):
+        if current and size + len(by_domain[domain]) > CHUNK_FILES:
+            chunks.append(current)
+            current, size = [], 0
+        current.append((domain, by_domain[domain]))
+        size += len(by_domain[domain])
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def chunk_counts(chunk):
+    """Occurrences and domain counts of the words of one domain chunk."""
+    word_counts = Counter()
+    domain_counts = Counter()
+    for _, file_paths in chunk:
+        domain_words = set()
+        for file_path in file_paths:
+            alphanum = process_file(file_path)
+            word_counts.update(alphanum)
+            domain_words.update(alphanum)
+        domain_counts.update(domain_words)
+    return word_counts, domain_counts
+
+
+def count_chunk(task):
+    # Map: occurrences and domain counts of one chunk, written to a shard
+    out_path, chunk = task
+    word_counts, domain_counts = chunk_counts(chunk)
+    return write_shard(out_path, ((word, [count, domain_counts[word]]) for word, count in sorted(word_counts.items())))
+
+
+def write_counts(output_path, shard, column):
+    """Stream one column of the shard into a JSON object (same layout as json.dump with indent=4)."""
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        f.write("{")
+        first = True
+        for word, counts in iter_run(shard):
+            f.write("\n    " if first else ",\n    ")
+            f.write(f"{json.dumps(word, ensure_ascii=False)}: {counts[column]}")
+            first = False
+            count += 1
+        f.write("}" if first else "\n}")
+    return count
+
 
 def main():
-    data_dir = os.path.join("..", "Data", "Files\\raw")
+    data_dir = os.path.join("..", "Data", "Files", "raw")
+    shard_dir = os.path.join("..", "Lexicon", "Shards")
+    os.makedirs(shard_dir, exist_ok=True)
     file_id_to_url_map = {}
     with open(os.path.join("..", "Data", "ind_to_url.json"), 'r', encoding='utf-8') as f:
         file_id_to_url_map = json.load(f)
 
 
     files = [(os.path.join(data_dir, f), urlparse(file_id_to_url_map.get(f.split('.')[0])).netloc) for f in os.listdir(data_dir) if f.endswith('.html')]
-    
-    all_alphanum = {}
-    domain_to_words = {}
-    all_uniq_domain = {}
-    with Pool(cpu_count()) as pool:
+    del file_id_to_url_map
+    chunks = domain_chunks(files)
 
-        for alphanum, domain in tqdm(pool.imap_unordered(process_file, files), total=len(files)):
-            if domain not in domain_to_words:
-                domain_to_words[domain] = set()
-            for key, value in alphanum.items():
-                all_alphanum[key] = all_alphanum.get(key, 0) + value
-                if key not in domain_to_words[domain]:
-                    domain_to_words[domain].add(key)
-                    all_uniq_domain[key] = all_uniq_domain.get(key, 0) + 1
+    with Pool(cpu_count()) as pool:
+        tasks = [(shard_path(shard_dir, number), chunk) for number, chunk in enumerate(chunks)]
+        shards = [entry["path"] for entry in
+                  tqdm(pool.imap_unordered(count_chunk, tasks), total=len(tasks), desc="Counting", unit="chunks")]
 
+        shards = tree_reduce(pool, shards, shard_dir, len(chunks))
 
-    with open('lexicon_words.json', 'w', encoding='utf-8') as f:
-        json.dump(all_alphanum, f, ensure_ascii=False, indent=4)
-    
-    with open('lexicon_word_domains.json', 'w', encoding='utf-8') as f:
-        json.dump(all_uniq_domain, f, ensure_ascii=False, indent=4)
+    if not shards:
+        shards = [write_shard(shard_path(shard_dir, 0), [])["path"]]
+    total_words = write_counts(os.path.join("..", "Lexicon", "lexicon_words.json"), shards[0], 0)
+    write_counts(os.path.join("..", "Lexicon", "lexicon_word_domains.json"), shards[0], 1)
+    os.remove(shards[0])
 
-    print(f"Total unique tokens: {len(all_alphanum)}")
+    print(f"Total unique tokens: {total_words}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,3 +1,4 @@
+import os
 import re
 import json
 
@@ -90,16 +91,22 @@ def save_lexicon(final_set, output_path, assign_id=True):
         
 
 
-def build_lexicon():
-    lex_domains = load_json("lexicon_word_domains.json")
-    lex_words = load_json("lexicon_words.json")
+def select_words(lex_words, lex_domains):
+    """The words of the lexicon, from word -> frequency and word -> domain count (both are emptied)."""
     final_set = set()
 
     remove_long_words(lex_words, lex_domains, max_len=20)
     initial_filter(lex_words, lex_domains, final_set)
     cleanup_words(lex_words, lex_domains)
     add_remaining_words(lex_words, lex_domains, final_set)
-    save_lexicon(final_set, "final_lexicon", assign_id=False)
+    return final_set
+
+
+def build_lexicon():
+    lex_domains = load_json(os.path.join("..", "Lexicon", "lexicon_word_domains.json"))
+    lex_words = load_json(os.path.join("..", "Lexicon", "lexicon_words.json"))
+    final_set = select_words(lex_words, lex_domains)
+    save_lexicon(final_set, os.path.join("..", "Lexicon", "final_lexicon"), assign_id=False)
 
 
 if __name__ == "__main__":
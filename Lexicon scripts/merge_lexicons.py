@@ -1,6 +1,8 @@
+import os
+
 def main():
-    json_files_lexicon = "..\\Lexicon\\words.txt"
-    html_files_lexicon = "..\\Lexicon\\final_lexicon.txt"
+    json_files_lexicon = os.path.join("..", "Lexicon", "words.txt")
+    html_files_lexicon = os.path.join("..", "Lexicon", "final_lexicon.txt")
 
     final = set()
 
@@ -14,7 +16,7 @@ def main():
     final.update(json)
     final.update(html)
 
-    with open("..\\Lexicon\\final_words_lexicon.txt", 'w', encoding='utf-8') as f:
+    with open(os.path.join("..", "Lexicon", "final_words_lexicon.txt"), 'w', encoding='utf-8') as f:
         sorted_final = sorted(final)
         f.writelines(sorted_final)
 
@@ -0,0 +1,134 @@
+"""
+Builds final_lexicon.txt like lexicon_gen.py followed by lexicon_main.py, but
+without exact counts of every raw token, which on a large crawl do not fit in
+memory (most of them are junk that lexicon_main.py throws away anyway).
+
+Pass 1, sketch: the workers count domain chunks of pages (see lexicon_gen.py)
+and the counts go into two count-min sketches of fixed size: occurrences per
+word, and domains per word (every domain adds one per distinct word). The
+most frequent words are kept in a heavy hitters summary.
+
+Pass 2, exact: the workers read the pages again and only count the candidate
+words: the words that the thresholds of lexicon_main.py would keep given
+their estimated counts. Estimates are never below the true counts and the
+thresholds only get easier with larger counts, so every word of the exact
+lexicon is a candidate. Their exact counts are tree-reduced like in
+lexicon_gen.py and lexicon_main.select_words() picks the final words, so the
+result is the same lexicon the exact scripts build.
+
+Outputs: ../Lexicon/final_lexicon.txt, ../Lexicon/heavy_hitters.json
+
+Usage:
+    python sketch_lexicon.py [--width 2097152] [--depth 4] [--top 1000]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+from urllib.parse import urlparse
+
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from lexicon_gen import chunk_counts, domain_chunks
+from lexicon_main import save_lexicon, select_words
+from shards import iter_run, shard_path, tree_reduce, write_shard
+from sketches import CountMinSketch, HeavyHitters, hash_rows
+
+LEXICON_DIR = os.path.join("..", "Lexicon")
+SHARD_DIR = os.path.join("..", "Lexicon", "Shards")
+
+
+# ------------------ Pass 1: sketch ------------------
+def sketch_chunk(task):
+    # The chunk's counts go back hashed, the parent only adds them into the tables
+    chunk, depth, width, top = task
+    word_counts, domain_counts = chunk_counts(chunk)
+    words = list(word_counts)
+    columns = hash_rows(words, depth, width).astype('uint32')
+    heavy = HeavyHitters(top)
+    heavy.update(word_counts)
+    return columns, [word_counts[w] for w in words], [domain_counts[w] for w in words], heavy.counts
+
+
+# ------------------ Pass 2: exact counts of the candidates ------------------
+def init_worker(word_sketch_path, domain_sketch_path):
+    global word_sketch, domain_sketch
+    word_sketch = CountMinSketch.load(word_sketch_path)
+    domain_sketch = CountMinSketch.load(domain_sketch_path)
+
+
+def count_candidates(task):
+    out_path, chunk = task
+    word_counts, domain_counts = chunk_counts(chunk)
+    words = list(word_counts)
+    estimates = zip(words, word_sketch.estimate(words).tolist(), domain_sketch.estimate(words).tolist())
+    candidates = [word for word, freq, dcount in estimates if select_words({word: freq}, {word: dcount})]
+    return write_shard(out_path, ((word, [word_counts[word], domain_counts[word]]) for word in sorted(candidates)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the HTML lexicon in fixed memory with count-min sketches.")
+    parser.add_argument("--width", type=int, default=2 ** 21, help="counters per sketch row")
+    parser.add_argument("--depth", type=int, default=4, help="sketch rows")
+    parser.add_argument("--top", type=int, default=1000, help="heavy hitters to keep")
+    args = parser.parse_args()
+
+    data_dir = os.path.join("..", "Data", "Files", "raw")
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    with open(os.path.join("..", "Data", "ind_to_url.json"), 'r', encoding='utf-8') as f:
+        file_id_to_url_map = json.load(f)
+    files = [(os.path.join(data_dir, f), urlparse(file_id_to_url_map.get(f.split('.')[0])).netloc) for f in os.listdir(data_dir) if f.endswith('.html')]
+    del file_id_to_url_map
+    chunks = domain_chunks(files)
+
+    word_sketch = CountMinSketch(args.width, args.depth)
+    domain_sketch = CountMinSketch(args.width, args.depth)
+    heavy_hitters = HeavyHitters(args.top)
+    with Pool(cpu_count()) as pool:
+        tasks = [(chunk, args.depth, args.width, args.top) for chunk in chunks]
+        for columns, counts, domain_counts, heavy in tqdm(pool.imap_unordered(sketch_chunk, tasks),
+                                                          total=len(tasks), desc="Sketching", unit="chunks"):
+            word_sketch.add_hashed(columns, counts)
+            domain_sketch.add_hashed(columns, domain_counts)
+            heavy_hitters.update(heavy)
+
+    word_sketch_path = os.path.join(SHARD_DIR, "word_counts_sketch.npy")
+    domain_sketch_path = os.path.join(SHARD_DIR, "domain_counts_sketch.npy")
+    word_sketch.save(word_sketch_path)
+    domain_sketch.save(domain_sketch_path)
+    total = word_sketch.total()
+    print(f"{total:,} tokens sketched, counts overestimated by at most {math.e * total / args.width:,.1f} "
+          f"with probability {1 - math.e ** -args.depth:.3f}")
+
+    with Pool(cpu_count(), initializer=init_worker, initargs=(word_sketch_path, domain_sketch_path)) as pool:
+        tasks = [(shard_path(SHARD_DIR, number), chunk) for number, chunk in enumerate(chunks)]
+        shards = [entry["path"] for entry in
+                  tqdm(pool.imap_unordered(count_candidates, tasks), total=len(tasks), desc="Counting candidates", unit="chunks")]
+
+        shards = tree_reduce(pool, shards, SHARD_DIR, len(chunks))
+
+    # Only the candidates are held in memory here
+    lex_words, lex_domains = {}, {}
+    for shard in shards:
+        for word, (count, domains) in iter_run(shard):
+            lex_words[word] = count
+            lex_domains[word] = domains
+        os.remove(shard)
+    candidates = len(lex_words)
+    final_set = select_words(lex_words, lex_domains)
+    save_lexicon(final_set, os.path.join(LEXICON_DIR, "final_lexicon"), assign_id=False)
+
+    with open(os.path.join(LEXICON_DIR, "heavy_hitters.json"), 'w', encoding='utf-8') as f:
+        json.dump(dict(heavy_hitters.top()), f, ensure_ascii=False, indent=4)
+
+    os.remove(word_sketch_path)
+    os.remove(domain_sketch_path)
+    print(f"{candidates} candidates counted exactly, {len(final_set)} words in the lexicon")
+
+
+if __name__ == "__main__":
+    main()
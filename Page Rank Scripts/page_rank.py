@@ -0,0 +1,181 @@
+"""
+PageRank of the page, domain and citation graphs, the same computation as
+page_rank.cpp but on a scipy sparse matrix, so the ranks can be recomputed
+here whenever the link files change.
+
+    page:      ../Data/Page_rank_files/page_rank_links_ids.csv   -> ../Page Rank Results/page_rank_output.csv
+    domain:    ../Data/Page_rank_files/domain_rank_links_ids.csv -> ../Page Rank Results/domain_rank_output.csv
+    citations: ../Data/PageRankCord19/references_map_ids.csv     -> ../Page Rank Results/citation_rank_output.csv
+
+The edges are loaded into a CSR matrix holding 1 / out degree of the source
+(duplicate edges count twice, like in the adjacency lists of page_rank.cpp),
+and every iteration is one sparse matrix-vector product:
+
+    rank' = (1 - d) / n + d * (M @ rank + dangling / n)
+
+where dangling is the rank of the nodes without out links, spread over all
+nodes. The iteration stops once the L1 difference of two iterations is below
+the tolerance. With --warm-start the iteration starts from the ranks of the
+previous output instead of the uniform vector, which after a small change of
+the graph needs far fewer iterations.
+
+The outputs are "id,rank" lines without a header sorted by rank, like the
+ones of page_rank.cpp. With --scores the 1 - 10 decile Score of
+results_analyzer.ipynb / cord_19_map_gen.ipynb is written as well, next to
+the names of the nodes (URLs, domains or the paper titles of
+papers_citations_mapper.py) when their id mapping exists.
+
+The graph has as many nodes as the largest id + 1, or --nodes if that is
+more (page_rank.cpp always used a fixed size, which counts the unused ids in
+the random jump as well).
+
+Usage: python page_rank.py [page] [domain] [citations] [--tol 1e-8] [--damping 0.85] [--warm-start] [--scores] [--nodes N]
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+PAGE_RANK_FILES = os.path.join("..", "Data", "Page_rank_files")
+RESULTS_DIR = os.path.join("..", "Page Rank Results")
+
+GRAPHS = {
+    "page": {
+        "links": os.path.join(PAGE_RANK_FILES, "page_rank_links_ids.csv"),
+        "output": os.path.join(RESULTS_DIR, "page_rank_output.csv"),
+        "names": os.path.join(PAGE_RANK_FILES, "id_to_url.json"),
+        "scores": os.path.join(RESULTS_DIR, "page_rank_results_with_urls.csv"),
+        "columns": ["URL", "Page Rank", "Score"],
+    },
+    "domain": {
+        "links": os.path.join(PAGE_RANK_FILES, "domain_rank_links_ids.csv"),
+        "output": os.path.join(RESULTS_DIR, "domain_rank_output.csv"),
+        "names": os.path.join(PAGE_RANK_FILES, "id_to_domain.json"),
+        "scores": os.path.join(RESULTS_DIR, "domain_rank_results_with_domain_nm.csv"),
+        "columns": ["Domain", "Domain Score", "Score"],
+    },
+    "citations": {
+        "links": os.path.join("..", "Data", "PageRankCord19", "references_map_ids.csv"),
+        "output": os.path.join(RESULTS_DIR, "citation_rank_output.csv"),
+        "names": os.path.join("..", "Data", "PageRankCord19", "id_to_title.json"),
+        "scores": os.path.join(RESULTS_DIR, "citation_ranks_with_scores.csv"),
+        "columns": ["paper_title", "citation_rank", "Score"],
+    },
+}
+
+
+# ------------------ Graph ------------------
+def load_id_edges(path):
+    """(sources, targets) of a from_id,to_id CSV."""
+    edges = pd.read_csv(path).dropna()
+    return edges.iloc[:, 0].to_numpy(dtype=np.int64), edges.iloc[:, 1].to_numpy(dtype=np.int64)
+
+
+def transition_matrix(sources, targets, n):
+    """CSR matrix M with M[target, source] = 1 / out degree of source, and the dangling node mask."""
+    out_degree = np.bincount(sources, minlength=n).astype(np.float64)
+    weights = 1.0 / out_degree[sources]
+    matrix = sparse.csr_matrix((weights, (targets, sources)), shape=(n, n))
+    return matrix, out_degree == 0
+
+
+# ------------------ Power iteration ------------------
+def page_rank(matrix, dangling, damping=0.85, tol=1e-8, start=None, max_iterations=1000):
+    """Ranks of all nodes (summing to 1) and the number of iterations it took."""
+    n = matrix.shape[0]
+    rank = np.full(n, 1.0 / n) if start is None else start / start.sum()
+    for iteration in range(1, max_iterations + 1):
+        new_rank = matrix @ rank
+        new_rank += rank[dangling].sum() / n
+        new_rank *= damping
+        new_rank += (1 - damping) / n
+        diff = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if diff <= tol:
+            break
+    return rank, iteration
+
+
+def load_ranks(path, n):
+    """Ranks of a previous output as a start vector, nodes that were not in it get the average rank."""
+    if not os.path.exists(path):
+        return None
+    previous = pd.read_csv(path, header=None, names=["id", "rank"])
+    previous = previous[previous["id"] < n]
+    start = np.full(n, np.nan)
+    start[previous["id"].to_numpy()] = previous["rank"].to_numpy()
+    start[np.isnan(start)] = 1.0 / n if previous.empty else previous["rank"].mean()
+    return start
+
+
+# ------------------ Output ------------------
+def decile_scores(count):
+    """Score of results_analyzer.ipynb for the ranks in descending order: 10 for the top tenth ... 1."""
+    num = count - 1
+    starts = np.array([int(i * 0.1 * num) for i in range(10)])
+    return 10 - (np.searchsorted(starts, np.arange(count), side='right') - 1)
+
+
+def write_ranks(path, ids, ranks):
+    with open(path, 'w', encoding='utf-8') as f:
+        for node, rank in zip(ids.tolist(), ranks.tolist()):
+            f.write(f"{node},{rank:.6g}\n")
+
+
+def write_scores(path, columns, names, ranks):
+    pd.DataFrame({columns[0]: names, columns[1]: ranks, columns[2]: decile_scores(len(ranks))}).to_csv(path, index=False)
+
+
+def run(graph, args):
+    config = GRAPHS[graph]
+    started = time.time()
+    sources, targets = load_id_edges(config["links"])
+    n = max(int(sources.max(initial=-1)) + 1, int(targets.max(initial=-1)) + 1, args.nodes)
+    if n == 0:
+        print(f"{graph}: no links in {config['links']}")
+        return
+
+    matrix, dangling = transition_matrix(sources, targets, n)
+    start = load_ranks(config["output"], n) if args.warm_start else None
+    ranks, iterations = page_rank(matrix, dangling, args.damping, args.tol, start)
+
+    order = np.lexsort((np.arange(n), -ranks))
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    write_ranks(config["output"], order, ranks[order])
+    if args.scores:
+        if config["names"] and os.path.exists(config["names"]):
+            with open(config["names"], 'r', encoding='utf-8') as f:
+                id_to_name = json.load(f)
+            names = [id_to_name.get(str(node), "") for node in order.tolist()]
+        else:
+            names = order
+        write_scores(config["scores"], config["columns"], names, ranks[order])
+    print(f"{graph}: {n} nodes, {len(sources)} links, converged in {iterations} iterations "
+          f"({time.time() - started:.1f}s), written to {config['output']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PageRank of the page, domain and citation graphs.")
+    parser.add_argument("graphs", nargs="*", help=f"graphs to rank, of {', '.join(GRAPHS)} (default: all with a link file)")
+    parser.add_argument("--tol", type=float, default=1e-8, help="L1 difference of two iterations to stop at")
+    parser.add_argument("--damping", type=float, default=0.85)
+    parser.add_argument("--warm-start", action="store_true", help="start from the ranks of the previous output")
+    parser.add_argument("--scores", action="store_true", help="also write the decile Score of every node")
+    parser.add_argument("--nodes", type=int, default=0, help="rank at least this many nodes (ids without links included)")
+    args = parser.parse_args()
+    for graph in args.graphs:
+        if graph not in GRAPHS:
+            parser.error(f"unknown graph {graph}, choose from {', '.join(GRAPHS)}")
+
+    graphs = args.graphs or [graph for graph in GRAPHS if os.path.exists(GRAPHS[graph]["links"])]
+    for graph in graphs:
+        run(graph, args)
+
+
+if __name__ == "__main__":
+    main()
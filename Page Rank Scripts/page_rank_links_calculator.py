@@ -3,6 +3,23 @@
     Page-to-page links are stored in page_rank_links.csv (from_url,to_url,anchor_text).
     Domain-to-domain links are stored in domain_rank_links.csv (from_domain,to_domain).
     Later used for PageRank and Domain Rank calculations.
+
+    The workers already drop the junk links (data:, javascript:, mailto:,
+    xmpp:, invalid domains) and collapse the identical links of a page, the
+    anchor texts of a collapsed link are joined. As the pages come back the
+    URLs and domains get dense integer ids in order of first appearance and
+    the links are written straight away, with ids as well:
+        page_rank_links_ids.csv, domain_rank_links_ids.csv (from_id,to_id)
+        url_to_id.json, id_to_url.json, domain_to_id.json, id_to_domain.json
+    so page_rank.py can use them without pre_process_data.ipynb. Only the
+    id dictionaries are held in memory, never the links.
+
+    Pages are processed in batches. The rows of every finished batch are
+    appended to <file>.partial files (the new URLs and domains too, one per
+    line) and the batch is journaled with the file sizes, so a restarted run
+    truncates the partial files to the last finished batch, reloads the ids
+    and continues from there. The files get their final names only when all
+    pages are done.
 """
 
 import os
@@ -12,6 +29,23 @@ from urllib.parse import urlparse, urljoin, urldefrag, parse_qs, urlencode, urlu
 from multiprocessing import Pool, cpu_count
 from tqdm import tqdm
 import csv
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from checkpoint import Checkpoint, atomic_write
+
+BATCH_SIZE = 5000
+JUNK_SCHEMES = ("data:", "javascript:", "mailto:", "xmpp:")
+
+# Streamed outputs in Data/Page_rank_files: file name and CSV header (None for the id lists)
+OUTPUTS = {
+    "page": ("page_rank_links.csv", ["from_url", "to_url", "anchor_text"]),
+    "domain": ("domain_rank_links.csv", ["from_domain", "to_domain"]),
+    "page_ids": ("page_rank_links_ids.csv", ["from_id", "to_id"]),
+    "domain_ids": ("domain_rank_links_ids.csv", ["from_id", "to_id"]),
+    "urls": ("urls.jsonl", None),
+    "domains": ("domains.jsonl", None),
+}
 
 def clean_url(url):
     """Remove tracking params, strip fragments, and normalize the URL."""
@@ -28,14 +62,30 @@ def clean_url(url):
 
     return urlunparse(parsed._replace(query=clean_qs))
 
+def is_valid_domain(domain):
+    """Same check as pre_process_data.ipynb did on domain_rank_links.csv."""
+    if not isinstance(domain, str) or domain.strip() == "":
+        return False
+    if " " in domain:
+        return False
+    if any(char in domain for char in ['/', '\\', ':', '?', '#', '[', ']', '@', '!', '$', '&', "'", '(', ')', '*', '+', ',', ';', '=']):
+        return False
+    if '.' not in domain:
+        return False
+    return True
+
 def extract_links_for_page(args):
+    """
+    (page URL, its domain, [(to_url, anchor_text)], [to_domain]) of one page,
+    every link and domain once (in order of first appearance).
+    """
     html_files_dir, page_id, base_url = args
-    page_to_page_links = []
-    domain_to_domain_links = []
+    page_to_page_links = {}
+    domain_to_domain_links = {}
     try:
         html_file = os.path.join(html_files_dir, f"{page_id}.html")
         if not os.path.exists(html_file):
-            return page_to_page_links, domain_to_domain_links
+            return None, None, [], []
 
         with open(html_file, "r", encoding="utf-8") as f:
             html = f.read()
@@ -44,7 +94,7 @@ def extract_links_for_page(args):
     except Exception as e:
         with open(os.path.join(os.getcwd(), "logs", "htmL_file_processing_errors.log"), "a", encoding="utf-8") as log_file:
             log_file.write(f"Error processing {html_file}: {e}\n")
-        return page_to_page_links, domain_to_domain_links
+        return None, None, [], []
 
     try:
         base_url = clean_url(base_url)
@@ -52,12 +102,12 @@ def extract_links_for_page(args):
     except Exception as e:
         with open(os.path.join(os.getcwd(), "logs", "page_rank_link_parser_errors.log"), "a", encoding="utf-8") as log_file:
             log_file.write(f"Error cleaning base URL {base_url} for {html_file}: {e}\n")
-        return page_to_page_links, domain_to_domain_links
+        return None, None, [], []
 
     for a in soup.find_all('a'):
         try:
             href = a.get('href')
-            if not href:
+            if not href or href.strip().lower().startswith(JUNK_SCHEMES):
                 continue
             href = urljoin(base_url, href)
             cleaned_href = clean_url(href)
@@ -65,21 +115,17 @@ def extract_links_for_page(args):
             with open(os.path.join(os.getcwd(), "logs", "page_rank_link_parser_errors.log"), "a", encoding="utf-8") as log_file:
                 log_file.write(f"Error processing link in {html_file}: {e}\n")
             continue
-        if cleaned_href == base_url:  
+        if cleaned_href == base_url or cleaned_href.startswith(JUNK_SCHEMES):
             continue
 
-        page_to_page_links.append({
-            "from_url": base_url,
-            "to_url": cleaned_href,
-            "anchor_text": a.get_text(strip=True)
-        })
+        anchor_texts = page_to_page_links.setdefault(cleaned_href, [])
+        anchor_text = a.get_text(strip=True)
+        if anchor_text and anchor_text not in anchor_texts:
+            anchor_texts.append(anchor_text)
 
         to_domain = urlparse(cleaned_href).netloc
-        if to_domain != from_domain:
-            domain_to_domain_links.append({
-                "from_domain": from_domain,
-                "to_domain": to_domain
-            })
+        if to_domain != from_domain and is_valid_domain(from_domain) and is_valid_domain(to_domain):
+            domain_to_domain_links[to_domain] = True
 
     # Images need a lot of cleaning; skipping for now
     # for img in soup.find_all('img'):
@@ -105,45 +151,120 @@ def extract_links_for_page(args):
     #                 "to_domain": urlparse(cleaned_src).netloc
     #             })
 
-    return page_to_page_links, domain_to_domain_links
+    page_links = [(to_url, " ".join(anchor_texts)) for to_url, anchor_texts in page_to_page_links.items()]
+    return base_url, from_domain, page_links, list(domain_to_domain_links)
+
+def open_partial(path, header, size):
+    """Open path for appending, cut back to `size` bytes (a fresh file with the CSV header when size is 0)."""
+    if size:
+        os.truncate(path, size)
+        return open(path, "a", newline="", encoding="utf-8")
+    f = open(path, "w", newline="", encoding="utf-8")
+    if header:
+        csv.writer(f).writerow(header)
+    return f
+
+
+class IdAssigner:
+    """Dense ids in order of first appearance, every new name is appended to a JSON lines file."""
+
+    def __init__(self, f, path):
+        self.file = f
+        self.ids = {}
+        # A resumed run continues the ids of the names already in the (truncated) file
+        with open(path, "r", encoding="utf-8") as names:
+            for line in names:
+                self.ids[json.loads(line)] = len(self.ids)
+
+    def __call__(self, name):
+        name_id = self.ids.get(name)
+        if name_id is None:
+            name_id = self.ids[name] = len(self.ids)
+            self.file.write(json.dumps(name, ensure_ascii=False) + "\n")
+        return name_id
+
+
+def write_id_maps(ids, name_to_id_path, id_to_name_path):
+    with atomic_write(name_to_id_path, "w", encoding="utf-8") as f:
+        json.dump(ids, f, ensure_ascii=False, indent=4)
+    with atomic_write(id_to_name_path, "w", encoding="utf-8") as f:
+        json.dump({name_id: name for name, name_id in ids.items()}, f, ensure_ascii=False, indent=4)
+
 
 def main():
-    data_dir = os.path.join("..\\Data")
+    data_dir = os.path.join("..", "Data")
     html_files_dir = os.path.join(data_dir, "Files", "raw")
     page_rank_data_dir = os.path.join(data_dir, "Page_rank_files")
     os.makedirs(page_rank_data_dir, exist_ok=True)
-
-    page_rank_csv = os.path.join(page_rank_data_dir, "page_rank_links.csv")
-    domain_rank_csv = os.path.join(page_rank_data_dir, "domain_rank_links.csv")
     id_to_url_path = os.path.join(data_dir, "ind_to_url.json")
 
+    checkpoint = Checkpoint(os.path.join(page_rank_data_dir, "links_checkpoint.jsonl"), inputs=[id_to_url_path])
+
     with open(id_to_url_path, "r", encoding="utf-8") as f:
         id_to_url_map = json.load(f)
 
     page_ids = list(id_to_url_map.keys())
 
     pool_args = [(html_files_dir, pid, id_to_url_map[pid]) for pid in page_ids]
-    page_links_all = []
-    domain_links_all = []
-
-    with Pool(processes=cpu_count()) as pool:
-        for result in tqdm(pool.imap_unordered(extract_links_for_page, pool_args), total=len(pool_args)):
-            page_links, domain_links = result
-            page_links_all.extend(page_links)
-            domain_links_all.extend(domain_links)
-
-    with open(page_rank_csv, "w", newline="", encoding="utf-8") as pr_file:
-        writer = csv.DictWriter(pr_file, fieldnames=["from_url", "to_url", "anchor_text"])
-        writer.writeheader()
-        writer.writerows(page_links_all)
-
-    with open(domain_rank_csv, "w", newline="", encoding="utf-8") as dr_file:
-        writer = csv.DictWriter(dr_file, fieldnames=["from_domain", "to_domain"])
-        writer.writeheader()
-        writer.writerows(domain_links_all)
-
-    print(f"Page-to-page links saved to {page_rank_csv}")
-    print(f"Domain-to-domain links saved to {domain_rank_csv}")
+    batches = range(0, len(pool_args), BATCH_SIZE)
+    del id_to_url_map
+
+    # Resume after the last batch whose rows made it into the partial files
+    partials = {name: os.path.join(page_rank_data_dir, file_name + ".partial") for name, (file_name, _) in OUTPUTS.items()}
+    done_batches = 0
+    while f"batch_{done_batches}" in checkpoint.units:
+        done_batches += 1
+    sizes = checkpoint.data(f"batch_{done_batches - 1}") if done_batches else dict.fromkeys(OUTPUTS, 0)
+    if done_batches and not all(os.path.exists(partials[name]) and os.path.getsize(partials[name]) >= sizes.get(name, 0)
+                                for name in OUTPUTS):
+        checkpoint.reset()
+        done_batches, sizes = 0, dict.fromkeys(OUTPUTS, 0)
+    if done_batches:
+        print(f"Resuming after {done_batches} of {len(batches)} batches")
+
+    files = {name: open_partial(partials[name], header, sizes.get(name, 0)) for name, (_, header) in OUTPUTS.items()}
+    writers = {name: csv.writer(files[name]) for name in ("page", "domain", "page_ids", "domain_ids")}
+    url_id = IdAssigner(files["urls"], partials["urls"])
+    domain_id = IdAssigner(files["domains"], partials["domains"])
+
+    with Pool(processes=cpu_count()) as pool, \
+            tqdm(total=len(pool_args), initial=min(done_batches * BATCH_SIZE, len(pool_args))) as progress:
+        for batch_number in range(done_batches, len(batches)):
+            start = batches[batch_number]
+            # In page order, so the ids come out the same on every run
+            for base_url, from_domain, page_links, domain_links in pool.imap(extract_links_for_page,
+                                                                              pool_args[start:start + BATCH_SIZE],
+                                                                              chunksize=16):
+                progress.update()
+                if page_links:
+                    from_id = url_id(base_url)
+                    for to_url, anchor_text in page_links:
+                        writers["page"].writerow((base_url, to_url, anchor_text))
+                        writers["page_ids"].writerow((from_id, url_id(to_url)))
+                if domain_links:
+                    from_id = domain_id(from_domain)
+                    for to_domain in domain_links:
+                        writers["domain"].writerow((from_domain, to_domain))
+                        writers["domain_ids"].writerow((from_id, domain_id(to_domain)))
+
+            for f in files.values():
+                f.flush()
+                os.fsync(f.fileno())
+            checkpoint.record(f"batch_{batch_number}", **{name: os.fstat(f.fileno()).st_size for name, f in files.items()})
+
+    for f in files.values():
+        f.close()
+    write_id_maps(url_id.ids, os.path.join(page_rank_data_dir, "url_to_id.json"), os.path.join(page_rank_data_dir, "id_to_url.json"))
+    write_id_maps(domain_id.ids, os.path.join(page_rank_data_dir, "domain_to_id.json"), os.path.join(page_rank_data_dir, "id_to_domain.json"))
+    for name, (file_name, header) in OUTPUTS.items():
+        if header:
+            os.replace(partials[name], os.path.join(page_rank_data_dir, file_name))
+        else:
+            os.remove(partials[name])
+    checkpoint.finish()
+
+    print(f"{len(url_id.ids)} URLs and {len(domain_id.ids)} domains")
+    print(f"Links saved to {page_rank_data_dir}")
 
 if __name__ == "__main__":
     main()
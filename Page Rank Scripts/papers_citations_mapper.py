@@ -1,11 +1,61 @@
+"""
+    Maps every paper to the papers it cites, by normalized title. The papers
+    are only read: from every JSON just metadata.title and the titles of
+    bib_entries are pulled, with ijson's event parser instead of loading the
+    whole document.
+
+    Outputs in ../Data/PageRankCord19:
+        references_map_ids.csv  from_paper,to_paper as integer ids (edges with
+                                an empty title on either end are left out)
+        id_to_title.json        id -> normalized title, ids in order of first
+                                appearance
+        title_fixes.csv         paper_id,title for the papers without a title in
+                                their JSON: the title from metadata_cleaned.csv,
+                                which JSONinvertedIndex.process_json_file uses
+                                in place of the missing one
+
+    A bibliography title rarely matches the title of the paper it cites
+    character for character, so the cited titles are resolved against the
+    catalogue of paper titles (the titles of the papers with a JSON and of
+    metadata_cleaned.csv): a cited title that is not in it goes to the most
+    similar catalogue title if their character shingles have a Jaccard
+    similarity of at least SIMILARITY_THRESHOLD. The catalogue is indexed
+    with MinHash LSH (util_scripts/sketches.py), so every cited title is only
+    compared to the few catalogue titles sharing a band of its signature, and
+    the cited titles are resolved in parallel.
+
+    Papers are processed in batches, every batch's references and title fixes
+    go to part CSVs that are journaled with their checksums, so a restarted run
+    only redoes the batches that did not finish. The parts are joined at the
+    end, when the cited titles are resolved and the titles get their ids. All
+    files are written atomically.
+"""
+
 import os
+import csv
 import json
 import re
 import string
+import sys
+import ijson
+import numpy as np
 import pandas as pd
 from multiprocessing import Pool, cpu_count
 from tqdm import tqdm
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from checkpoint import Checkpoint, atomic_write
+from sketches import MinHash, MinHashLSH, jaccard, shingles
+
+BATCH_SIZE = 5000
+SHINGLE_SIZE = 3              # characters per shingle of a normalized title
+NUM_PERM = 128                # MinHash signature length
+LSH_BANDS = 16                # of 8 rows: titles of similarity 0.8 share a band with probability 0.95
+SIMILARITY_THRESHOLD = 0.8    # Jaccard similarity of the shingles to resolve a cited title
+RESOLVE_CHUNK = 256           # titles per task
+
+minhash = MinHash(NUM_PERM)
+
 
 def normalize_title(title):
     title = title.lower()
@@ -15,40 +65,44 @@ def normalize_title(title):
     return title.strip()
 
 
+def read_titles(json_path):
+    """(metadata.title, [title of every bib entry]) of a paper JSON, streamed."""
+    title = ""
+    bib_titles = []
+    with open(json_path, "rb") as f:
+        for prefix, event, value in ijson.parse(f):
+            if event != "string":
+                continue
+            if prefix == "metadata.title":
+                title = value
+            elif prefix.startswith("bib_entries.") and prefix.endswith(".title") and prefix.count(".") == 2:
+                bib_titles.append(value)
+    return title, bib_titles
+
 
 def process_one(args):
+    """(title from the metadata if the JSON has none, else None; [(paper, cited paper)] normalized titles)"""
     idx, title, json_path = args
     refs = []
 
     try:
-        with open(json_path, "r", encoding="utf-8") as f:
-            paper = json.load(f)
+        paper_title, bib_titles = read_titles(json_path)
     except Exception as e:
         print(f"[ERR] Failed loading {json_path}: {e}")
-        return refs
-
-    if paper.get("metadata", {}).get("title", "") == "":
-        if "metadata" not in paper:
-            paper["metadata"] = {}
-        paper["metadata"]["title"] = title
+        return None, refs
 
-    norm_parent = normalize_title(paper["metadata"]["title"])
+    title_fix = None
+    if paper_title == "":
+        paper_title = title_fix = title if isinstance(title, str) else ""
 
-    bib_entries = paper.get("bib_entries", {})
-    for entry in bib_entries.values():
-        if "title" in entry:
-            refs.append((norm_parent, normalize_title(entry["title"])))
+    norm_parent = normalize_title(paper_title)
+    for bib_title in bib_titles:
+        refs.append((norm_parent, normalize_title(bib_title)))
 
-    try:
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(paper, f, ensure_ascii=False, indent=4)
-    except Exception as e:
-        print(f"[ERR] Failed writing {json_path}: {e}")
-
-    return refs
+    return title_fix, refs
 
 
-def build_reference_map_mp(metadata_cleaned, json_dir):
+def build_reference_map_mp(metadata_cleaned, json_dir, parts_dir, checkpoint):
 
     jobs = []
     for idx, row in metadata_cleaned.iterrows():
@@ -63,26 +117,156 @@ def build_reference_map_mp(metadata_cleaned, json_dir):
 
     print(f"Total JSON files to process: {len(jobs)}")
 
-    all_refs = []
+    os.makedirs(parts_dir, exist_ok=True)
+    part_paths = []
+    with Pool(cpu_count()) as pool, tqdm(total=len(jobs), desc="Processing JSON files") as progress:
+        for batch_number, start in enumerate(range(0, len(jobs), BATCH_SIZE)):
+            batch = jobs[start:start + BATCH_SIZE]
+            part_path = os.path.join(parts_dir, f"references_part_{batch_number}.csv")
+            part_paths.append(part_path)
+            if checkpoint.done(part_path):
+                progress.update(len(batch))
+                continue
+
+            refs, fixes = [], []
+            for (_, _, json_path), (title_fix, results) in zip(batch, pool.imap(process_one, batch)):
+                refs.extend(results)
+                if title_fix:
+                    fixes.append((os.path.basename(json_path)[:-len(".json")], title_fix))
+                progress.update()
+            fixes_path = fixes_part_path(part_path)
+            with atomic_write(part_path, "w", newline="", encoding="utf-8") as f:
+                pd.DataFrame(refs, columns=["from_paper", "to_paper"]).to_csv(f, index=False)
+            with atomic_write(fixes_path, "w", newline="", encoding="utf-8") as f:
+                pd.DataFrame(fixes, columns=["paper_id", "title"]).to_csv(f, index=False)
+            checkpoint.record(part_path, [part_path, fixes_path], refs=len(refs), fixes=len(fixes))
+
+    return part_paths
+
+
+def fixes_part_path(part_path):
+    return part_path.replace("references_part_", "title_fixes_part_")
+
+
+def iter_references(part_paths):
+    """(paper, cited paper) normalized titles of the reference parts, without the ones with an empty title."""
+    for part_path in part_paths:
+        with open(part_path, "r", newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader)
+            for from_title, to_title in reader:
+                if from_title and to_title:
+                    yield from_title, to_title
+
+
+# ------------------ Fuzzy resolution of the cited titles ------------------
+def title_signatures(titles):
+    return minhash.signatures([shingles(title, SHINGLE_SIZE) for title in titles])
+
+
+def init_resolver(catalogue_arg, lsh_arg):
+    global catalogue, lsh
+    catalogue = catalogue_arg
+    lsh = lsh_arg
+
+
+def resolve_chunk(titles):
+    """[(cited title, most similar catalogue title)] of the titles with one at SIMILARITY_THRESHOLD or above."""
+    title_shingles = [shingles(title, SHINGLE_SIZE) for title in titles]
+    resolved = []
+    for title, shingle_set, candidates in zip(titles, title_shingles, lsh.query(minhash.signatures(title_shingles))):
+        best, best_similarity = None, 0.0
+        for candidate in candidates.tolist():
+            similarity = jaccard(shingle_set, shingles(catalogue[candidate], SHINGLE_SIZE))
+            if similarity >= SIMILARITY_THRESHOLD and similarity > best_similarity:
+                best, best_similarity = catalogue[candidate], similarity
+        if best is not None:
+            resolved.append((title, best))
+    return resolved
+
+
+def resolve_titles(catalogue, cited):
+    """{cited title: catalogue title} of the cited titles that only nearly match a paper of the catalogue."""
+    chunks = [cited[i:i + RESOLVE_CHUNK] for i in range(0, len(cited), RESOLVE_CHUNK)]
     with Pool(cpu_count()) as pool:
-        for results in tqdm(
-            pool.imap_unordered(process_one, jobs),
-            total=len(jobs),
-            desc="Processing JSON files",
-        ):
-            all_refs.extend(results)
+        signatures = list(tqdm(pool.imap(title_signatures, [catalogue[i:i + RESOLVE_CHUNK] for i in range(0, len(catalogue), RESOLVE_CHUNK)]),
+                               total=-(-len(catalogue) // RESOLVE_CHUNK), desc="Indexing the catalogue", unit="chunks"))
+    index = MinHashLSH(np.concatenate(signatures) if signatures else np.zeros((0, NUM_PERM), dtype=np.uint64), LSH_BANDS)
+
+    resolved = {}
+    with Pool(cpu_count(), initializer=init_resolver, initargs=(catalogue, index)) as pool:
+        for pairs in tqdm(pool.imap_unordered(resolve_chunk, chunks), total=len(chunks),
+                          desc="Resolving cited titles", unit="chunks"):
+            resolved.update(pairs)
+    return resolved
+
+
+def join_parts(part_paths, metadata_titles, edges_path, id_to_title_path, fixes_path):
+    """
+    Number the titles of the reference parts and write the id edges, the ids and the title fixes.
+    Cited titles that are no paper title (of a paper JSON or metadata_cleaned.csv) go to the
+    catalogue paper they are similar enough to, if there is one.
+    """
+    # The catalogue: the titles of the citing papers, then the rest of the metadata titles
+    catalogue = {}
+    cited = {}
+    for from_title, to_title in iter_references(part_paths):
+        catalogue[from_title] = True
+        cited[to_title] = True
+    for title in metadata_titles:
+        if title:
+            catalogue[title] = True
+    resolved = resolve_titles(list(catalogue), [title for title in cited if title not in catalogue])
+    del catalogue, cited
+
+    title_ids = {}
+
+    def title_id(title):
+        if title not in title_ids:
+            title_ids[title] = len(title_ids)
+        return title_ids[title]
+
+    edges = 0
+    with atomic_write(edges_path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        writer.writerow(["from_paper", "to_paper"])
+        for from_title, to_title in iter_references(part_paths):
+            writer.writerow((title_id(from_title), title_id(resolved.get(to_title, to_title))))
+            edges += 1
+
+    with atomic_write(id_to_title_path, "w", encoding="utf-8") as f:
+        json.dump({title_number: title for title, title_number in title_ids.items()}, f, ensure_ascii=False)
+
+    with atomic_write(fixes_path, "w", newline="", encoding="utf-8") as out:
+        out.write("paper_id,title\n")
+        for part_path in part_paths:
+            with open(fixes_part_path(part_path), "r", newline="", encoding="utf-8") as f:
+                next(f)
+                for line in f:
+                    out.write(line)
+    return edges, len(resolved)
 
-    return all_refs
 
 if __name__ == "__main__":
-    metadata_cleaned = pd.read_csv("../Data/Cord 19/metadata_cleaned.csv")
+    metadata_path = "../Data/Cord 19/metadata_cleaned.csv"
     json_files_dir_path = "../Data/Cord 19/document_parses/pdf_json/"
-    refs = build_reference_map_mp(
+    output_dir = "../Data/PageRankCord19"
+    parts_dir = "../Data/PageRankCord19/references_parts"
+
+    checkpoint = Checkpoint(os.path.join(parts_dir, "checkpoint.jsonl"), inputs=[metadata_path])
+    metadata_cleaned = pd.read_csv(metadata_path)
+    part_paths = build_reference_map_mp(
         metadata_cleaned,
         json_files_dir_path,
+        parts_dir,
+        checkpoint,
     )
+    metadata_titles = (normalize_title(title) for title in metadata_cleaned["title"] if isinstance(title, str))
+    edges, resolved = join_parts(part_paths, metadata_titles,
+                                 os.path.join(output_dir, "references_map_ids.csv"),
+                                 os.path.join(output_dir, "id_to_title.json"),
+                                 os.path.join(output_dir, "title_fixes.csv"))
+    fixes = sum(checkpoint.data(part_path)["fixes"] for part_path in part_paths)
+    checkpoint.finish()
 
-    df = pd.DataFrame(refs, columns=["from_paper", "to_paper"])
-    df.to_csv("../Data/PageRankCord19/references_map.csv", index=False)
-
-    print("Done! Total mappings:", len(refs))
+    print("Done! Total mappings:", edges, "titles fixed:", fixes, "cited titles resolved by similarity:", resolved)
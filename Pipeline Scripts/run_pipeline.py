@@ -0,0 +1,385 @@
+"""
+Runs the whole index build as one pipeline.
+
+Every stage is one of the existing scripts, declared with the files it reads
+and writes. The order comes from those declarations (a stage runs after the
+stages producing its inputs) and stages that do not depend on each other run
+at the same time, e.g. the link extraction next to the forward index.
+
+A stage is only rebuilt when it has to: its fingerprint is the sha256 of its
+script, its arguments and the content of all its inputs (a directory counts
+as all the files in it). The fingerprint of the last successful run is kept in
+Data/pipeline_state.json together with how long the stage took; a stage whose
+fingerprint did not change and whose outputs exist is skipped. Because the
+inputs of a stage are the outputs of the previous ones, a rebuilt stage that
+writes the same bytes as before does not trigger the stages after it. File
+hashes are cached by size and mtime (Data/pipeline_hashes.json), so only
+changed files are read again.
+
+The scripts run from their own directory, like by hand, and their output goes
+to Data/pipeline_logs/<stage>.log.
+
+Inputs that come from outside the pipeline: the crawled HTML files and
+ind_to_url.json, the CORD-19 papers and metadata_cleaned.csv, and the outputs
+of the C++ tool jsonParser.cpp (Lexicon/words.txt). The inverted indexes are
+built from the binary forward indexes (invert_forward_index.py), so the
+documents are only parsed once, by the forward index stages.
+
+Usage:
+    python run_pipeline.py [stage ...] [--jobs 2] [--force] [--dry-run]
+    python run_pipeline.py --list
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "util_scripts"))
+from checkpoint import atomic_write, file_sha256
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+STATE_FILE = os.path.join(ROOT, "Data", "pipeline_state.json")
+HASH_CACHE_FILE = os.path.join(ROOT, "Data", "pipeline_hashes.json")
+LOG_DIR = os.path.join(ROOT, "Data", "pipeline_logs")
+
+# Paths relative to the repository root
+RAW_HTML = os.path.join("Data", "Files", "raw")
+IND_TO_URL = os.path.join("Data", "ind_to_url.json")
+PDF_JSON = os.path.join("Data", "Cord 19", "document_parses", "pdf_json")
+PAPERS_METADATA = os.path.join("Data", "Cord 19", "metadata_cleaned.csv")
+LEXICON = os.path.join("Lexicon", "lexicons_ids.json")
+HTML_FORWARD_INDEX = os.path.join("Forward Index", "forward_index_html_files.json")
+HTML_BINARY_FORWARD_INDEX = os.path.join("Forward Index", "forward_index_html.bin")
+PDF_BINARY_FORWARD_INDEX = os.path.join("Forward Index", "forward_index_pdf.bin")
+HTML_PASSAGES = os.path.join("Forward Index", "passages_html.bin")
+PDF_PASSAGES = os.path.join("Forward Index", "passages_pdf.bin")
+PAGE_LINKS = os.path.join("Data", "Page_rank_files", "page_rank_links.csv")
+DOMAIN_LINKS = os.path.join("Data", "Page_rank_files", "domain_rank_links.csv")
+PAGE_LINK_IDS = os.path.join("Data", "Page_rank_files", "page_rank_links_ids.csv")
+DOMAIN_LINK_IDS = os.path.join("Data", "Page_rank_files", "domain_rank_links_ids.csv")
+ID_TO_PAGE_URL = os.path.join("Data", "Page_rank_files", "id_to_url.json")
+ID_TO_DOMAIN = os.path.join("Data", "Page_rank_files", "id_to_domain.json")
+REFERENCE_IDS = os.path.join("Data", "PageRankCord19", "references_map_ids.csv")
+ID_TO_TITLE = os.path.join("Data", "PageRankCord19", "id_to_title.json")
+TITLE_FIXES = os.path.join("Data", "PageRankCord19", "title_fixes.csv")
+ANCHOR_INDEX = os.path.join("Inverted Index", "anchor_index.bin")
+ANCHOR_PARTS = os.path.join("Inverted Index", "AnchorBatches", "anchor_index_part_*.json")
+HTML_PARTS = os.path.join("Inverted Index", "inverted_index_part_*.json")
+HTML_INDEX = os.path.join("Inverted Index", "inverted_index.json")
+HTML_DROPPED = os.path.join("Inverted Index", "inverted_index_dropped_keys.json")
+PDF_PARTS = os.path.join("Inverted Index", "JsonBatches", "inverted_index_json_part_*.json")
+PDF_INDEX = os.path.join("Inverted Index", "JsonBatches", "inverted_index_json.json")
+DOC_METADATA = os.path.join("Data", "DocMetadata")
+PDF_DROPPED = os.path.join("Inverted Index", "JsonBatches", "inverted_index_dropped_keys_json.json")
+
+
+class Stage:
+    def __init__(self, name, script, inputs, outputs, args=(), after=()):
+        self.name = name
+        self.script = script        # relative to the root, run from its own directory
+        self.inputs = inputs        # files, directories or glob patterns
+        self.outputs = outputs
+        self.args = list(args)      # relative to the script's directory
+        self.after = list(after)    # stages that have to run first without sharing a file
+
+
+STAGES = [
+    Stage("lexicon_gen", os.path.join("Lexicon scripts", "lexicon_gen.py"),
+          inputs=[RAW_HTML, IND_TO_URL],
+          outputs=[os.path.join("Lexicon", "lexicon_words.json"), os.path.join("Lexicon", "lexicon_word_domains.json")]),
+    Stage("lexicon_main", os.path.join("Lexicon scripts", "lexicon_main.py"),
+          inputs=[os.path.join("Lexicon", "lexicon_words.json"), os.path.join("Lexicon", "lexicon_word_domains.json")],
+          outputs=[os.path.join("Lexicon", "final_lexicon.txt")]),
+    Stage("merge_lexicons", os.path.join("Lexicon scripts", "merge_lexicons.py"),
+          inputs=[os.path.join("Lexicon", "words.txt"), os.path.join("Lexicon", "final_lexicon.txt")],
+          outputs=[os.path.join("Lexicon", "final_words_lexicon.txt")]),
+    Stage("assign_ids", os.path.join("Lexicon scripts", "assign_ids.py"),
+          inputs=[os.path.join("Lexicon", "final_words_lexicon.txt")],
+          outputs=[LEXICON]),
+    Stage("forward_index", os.path.join("Forward Index Scripts", "forward_index.py"),
+          inputs=[RAW_HTML, IND_TO_URL, LEXICON],
+          outputs=[HTML_FORWARD_INDEX, HTML_BINARY_FORWARD_INDEX]),
+    Stage("passage_index_html", os.path.join("Forward Index Scripts", "passage_index.py"),
+          args=["html"],
+          inputs=[RAW_HTML],
+          outputs=[HTML_PASSAGES]),
+    Stage("links", os.path.join("Page Rank Scripts", "page_rank_links_calculator.py"),
+          inputs=[RAW_HTML, IND_TO_URL],
+          outputs=[PAGE_LINKS, DOMAIN_LINKS, PAGE_LINK_IDS, DOMAIN_LINK_IDS, ID_TO_PAGE_URL, ID_TO_DOMAIN,
+                   os.path.join("Data", "Page_rank_files", "url_to_id.json"),
+                   os.path.join("Data", "Page_rank_files", "domain_to_id.json")]),
+    Stage("page_rank", os.path.join("Page Rank Scripts", "page_rank.py"),
+          args=["page", "domain", "--scores"],
+          inputs=[PAGE_LINK_IDS, DOMAIN_LINK_IDS, ID_TO_PAGE_URL, ID_TO_DOMAIN],
+          outputs=[os.path.join("Page Rank Results", "page_rank_output.csv"),
+                   os.path.join("Page Rank Results", "domain_rank_output.csv"),
+                   os.path.join("Page Rank Results", "page_rank_results_with_urls.csv"),
+                   os.path.join("Page Rank Results", "domain_rank_results_with_domain_nm.csv")]),
+    Stage("anchors", os.path.join("Inverted Index Scripts", "anchor_index.py"),
+          inputs=[PAGE_LINKS, IND_TO_URL, LEXICON],
+          outputs=[ANCHOR_INDEX]),
+    Stage("anchor_inverted_index", os.path.join("Inverted Index Scripts", "invert_forward_index.py"),
+          args=["anchor"],
+          inputs=[LEXICON, ANCHOR_INDEX],
+          outputs=[ANCHOR_PARTS]),
+    Stage("merge_anchor_batches", os.path.join("Inverted Index Scripts", "merge_anchor_batches.py"),
+          inputs=[ANCHOR_PARTS],
+          outputs=[os.path.join("Inverted Index", "AnchorBatches", "anchor_index.json")]),
+    Stage("inverted_index", os.path.join("Inverted Index Scripts", "invert_forward_index.py"),
+          args=["html"],
+          inputs=[LEXICON, HTML_BINARY_FORWARD_INDEX, ANCHOR_INDEX],
+          outputs=[HTML_PARTS]),
+    Stage("merge_indexes", os.path.join("Inverted Index Scripts", "merge_indexes.py"),
+          inputs=[HTML_PARTS],
+          outputs=[HTML_INDEX]),
+    Stage("drop_keys_html", os.path.join("Inverted Index Scripts", "drop_keys.py"),
+          args=[os.path.join("..", HTML_INDEX), os.path.join("..", HTML_DROPPED)],
+          inputs=[HTML_INDEX],
+          outputs=[HTML_DROPPED]),
+    # Only reads the paper JSONs, the missing titles go to title_fixes.csv for the paper index
+    Stage("citations", os.path.join("Page Rank Scripts", "papers_citations_mapper.py"),
+          inputs=[PAPERS_METADATA, PDF_JSON],
+          outputs=[REFERENCE_IDS, ID_TO_TITLE, TITLE_FIXES]),
+    Stage("citation_rank", os.path.join("Page Rank Scripts", "page_rank.py"),
+          args=["citations", "--scores"],
+          inputs=[REFERENCE_IDS, ID_TO_TITLE],
+          outputs=[os.path.join("Page Rank Results", "citation_rank_output.csv"),
+                   os.path.join("Page Rank Results", "citation_ranks_with_scores.csv")]),
+    Stage("paper_forward_index", os.path.join("Forward Index Scripts", "paper_forward_index.py"),
+          inputs=[LEXICON, PDF_JSON, TITLE_FIXES],
+          outputs=[PDF_BINARY_FORWARD_INDEX]),
+    Stage("passage_index_pdf", os.path.join("Forward Index Scripts", "passage_index.py"),
+          args=["pdf"],
+          inputs=[PDF_JSON, TITLE_FIXES],
+          outputs=[PDF_PASSAGES]),
+    Stage("json_inverted_index", os.path.join("Inverted Index Scripts", "invert_forward_index.py"),
+          args=["pdf"],
+          inputs=[LEXICON, PDF_BINARY_FORWARD_INDEX],
+          outputs=[PDF_PARTS]),
+    Stage("merge_json_batches", os.path.join("Inverted Index Scripts", "merge_json_batches.py"),
+          inputs=[PDF_PARTS],
+          outputs=[PDF_INDEX]),
+    Stage("drop_keys_pdf", os.path.join("Inverted Index Scripts", "drop_keys.py"),
+          args=[os.path.join("..", PDF_INDEX), os.path.join("..", PDF_DROPPED)],
+          inputs=[PDF_INDEX],
+          outputs=[PDF_DROPPED]),
+    Stage("doc_metadata", os.path.join("util_scripts", "doc_metadata.py"),
+          inputs=[RAW_HTML, IND_TO_URL, PAPERS_METADATA, HTML_BINARY_FORWARD_INDEX, PDF_BINARY_FORWARD_INDEX],
+          outputs=[DOC_METADATA]),
+    Stage("barrels", os.path.join("Barrel Scripts", "Barrels.py"),
+          inputs=[LEXICON, PDF_DROPPED, HTML_DROPPED],
+          outputs=[os.path.join("Barrels", "barrels_index.json"), os.path.join("Barrels", "barrels_manifest.json")]),
+]
+
+
+# ------------------ Fingerprints ------------------
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_write(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+
+
+def expand(pattern):
+    """Files (relative to the root) of a file, directory or glob pattern, sorted."""
+    path = os.path.join(ROOT, pattern)
+    if glob.has_magic(pattern):
+        paths = glob.glob(path)
+    elif os.path.isdir(path):
+        paths = [os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names]
+    else:
+        paths = [path] if os.path.exists(path) else []
+    return sorted(os.path.relpath(p, ROOT) for p in paths if os.path.isfile(p))
+
+
+class HashCache:
+    """sha256 of files, only recomputed when the size or mtime of a file changed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.hashes = load_json(path, {})
+
+    def sha256(self, relative_path):
+        stat = os.stat(os.path.join(ROOT, relative_path))
+        cached = self.hashes.get(relative_path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = file_sha256(os.path.join(ROOT, relative_path))
+        self.hashes[relative_path] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def save(self):
+        save_json(self.path, self.hashes)
+
+
+def fingerprint(stage, hashes):
+    """sha256 of the stage's script, arguments and inputs; raises if an input is missing."""
+    inputs = {}
+    for pattern in stage.inputs:
+        files = expand(pattern)
+        if not files:
+            raise FileNotFoundError(f"{stage.name}: missing input {pattern}")
+        inputs[pattern] = [[path, hashes.sha256(path)] for path in files]
+    description = {"script": hashes.sha256(stage.script), "args": stage.args, "inputs": inputs}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def outputs_exist(stage):
+    return all(expand(pattern) for pattern in stage.outputs)
+
+
+# ------------------ Graph ------------------
+def dependencies(stages):
+    """{stage name: names of the selected stages it has to wait for}"""
+    producers = {output: stage.name for stage in stages for output in stage.outputs}
+    names = {stage.name for stage in stages}
+    return {
+        stage.name: {producers[pattern] for pattern in stage.inputs if pattern in producers}
+                    | {name for name in stage.after if name in names}
+        for stage in stages
+    }
+
+
+def select(targets):
+    """The target stages and every stage they depend on, in declaration order."""
+    if not targets:
+        return list(STAGES)
+    by_name = {stage.name: stage for stage in STAGES}
+    unknown = [name for name in targets if name not in by_name]
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(unknown)}")
+    deps = dependencies(STAGES)
+    needed, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(deps[name])
+    return [stage for stage in STAGES if stage.name in needed]
+
+
+# ------------------ Running ------------------
+def run_stage(stage):
+    """Run the stage's script, returns (succeeded, seconds)."""
+    script_path = os.path.join(ROOT, stage.script)
+    os.makedirs(LOG_DIR, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(LOG_DIR, f"{stage.name}.log"), 'w', encoding='utf-8') as log:
+        result = subprocess.run([sys.executable, os.path.basename(script_path), *stage.args],
+                                cwd=os.path.dirname(script_path), stdout=log, stderr=subprocess.STDOUT)
+    return result.returncode == 0 and outputs_exist(stage), time.perf_counter() - start
+
+
+def run_pipeline(stages, jobs=2, force=(), dry_run=False):
+    state = load_json(STATE_FILE, {})
+    hashes = HashCache(HASH_CACHE_FILE)
+    deps = dependencies(stages)
+    pending = list(stages)
+    done, failed, rebuilt = set(), set(), set()
+    report = []
+
+    def up_to_date(stage):
+        if stage.name in force or not outputs_exist(stage):
+            return False
+        if dry_run and deps[stage.name] & rebuilt:
+            return False    # its inputs are going to change
+        return state.get(stage.name, {}).get("fingerprint") == fingerprint(stage, hashes)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while pending or running:
+            for stage in list(pending):
+                if deps[stage.name] & failed:
+                    pending.remove(stage)
+                    failed.add(stage.name)
+                    report.append((stage.name, "skipped, a dependency failed", None))
+                elif deps[stage.name] <= done and len(running) < jobs:
+                    pending.remove(stage)
+                    try:
+                        current = up_to_date(stage)
+                    except FileNotFoundError as e:
+                        print(e)
+                        failed.add(stage.name)
+                        report.append((stage.name, "missing input", None))
+                        continue
+                    if current:
+                        done.add(stage.name)
+                        report.append((stage.name, "up to date", None))
+                    elif dry_run:
+                        done.add(stage.name)
+                        rebuilt.add(stage.name)
+                        report.append((stage.name, "would run", state.get(stage.name, {}).get("seconds")))
+                    else:
+                        print(f"Running {stage.name}")
+                        running[executor.submit(run_stage, stage)] = stage
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                succeeded, seconds = future.result()
+                if succeeded:
+                    # Fingerprinted after the run: a stage may rewrite its inputs
+                    state[stage.name] = {"fingerprint": fingerprint(stage, hashes), "seconds": round(seconds, 1),
+                                         "finished": time.strftime("%Y-%m-%d %H:%M:%S")}
+                    save_json(STATE_FILE, state)
+                    hashes.save()
+                    done.add(stage.name)
+                    report.append((stage.name, "done", seconds))
+                    print(f"Finished {stage.name} in {seconds:.1f}s")
+                else:
+                    failed.add(stage.name)
+                    report.append((stage.name, "failed", seconds))
+                    print(f"{stage.name} failed, see {os.path.join(LOG_DIR, stage.name + '.log')}")
+    if not dry_run:
+        # A dry run leaves nothing behind on disk, not even the hash cache
+        hashes.save()
+
+    print()
+    for name, status, seconds in report:
+        print(f"{name:<22} {status:<30} {'' if seconds is None else f'{seconds:,.1f}s'}")
+    return not failed
+
+
+def list_stages():
+    state = load_json(STATE_FILE, {})
+    deps = dependencies(STAGES)
+    for stage in STAGES:
+        last = state.get(stage.name)
+        took = f"last run {last['finished']}, {last['seconds']:,.1f}s" if last else "never run"
+        print(f"{stage.name:<22} after: {', '.join(sorted(deps[stage.name])) or '-':<40} {took}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the index, rerunning only the stages whose inputs changed.")
+    parser.add_argument("stages", nargs="*", help="stages to bring up to date (with their dependencies), all by default")
+    parser.add_argument("--jobs", type=int, default=2, help="stages running at the same time")
+    parser.add_argument("--force", action="store_true", help="rerun the named stages (all without names) even if up to date")
+    parser.add_argument("--dry-run", action="store_true", help="only show which stages would run")
+    parser.add_argument("--list", action="store_true", help="show the stages, their dependencies and last durations")
+    args = parser.parse_args()
+
+    if args.list:
+        list_stages()
+        return
+    stages = select(args.stages)
+    force = set(args.stages or [stage.name for stage in stages]) if args.force else set()
+    if not run_pipeline(stages, args.jobs, force, args.dry_run):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
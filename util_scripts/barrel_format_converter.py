@@ -1,10 +1,25 @@
+"""
+Converts JSON barrels of older builds to msgpack. Barrels.py writes msgpack
+directly now, this is only needed for barrel folders built before that.
+
+Usage: python barrel_format_converter.py [barrels_dir]
+"""
+
+import os
+import re
+import sys
+
 import orjson
 import ormsgpack
-import time
 
-for i in range(72,79):
-    with open(f'..\\Barrels\\{i}.json', 'rb') as f:
+barrels_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join("..", "Barrels")
+json_barrels = sorted(
+    (int(match.group(1)) for match in map(re.compile(r"(\d+)\.json$").match, os.listdir(barrels_dir)) if match)
+)
+
+for i in json_barrels:
+    with open(os.path.join(barrels_dir, f"{i}.json"), 'rb') as f:
         data = orjson.loads(f.read())
-    with open(f'..\\Barrels\\{i}.msgpack', 'wb') as f:
+    with open(os.path.join(barrels_dir, f"{i}.msgpack"), 'wb') as f:
         f.write(ormsgpack.packb(data))
-    print(f"Converted {i}.json to {i}.msgpack")
\ No newline at end of file
+    print(f"Converted {i}.json to {i}.msgpack")
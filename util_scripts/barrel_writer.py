@@ -0,0 +1,160 @@
+"""
+Writes posting lists straight into msgpack barrels.
+
+A barrel is a msgpack array of posting lists and barrels_index.json maps every
+word to [barrel_number, offset_in_barrel], the same layout Barrels.py and
+barrel_format_converter.py produce and the query code reads. Each posting list
+is encoded exactly once; its encoded size decides when a barrel is full, and the
+barrel file is the array header followed by the already encoded lists.
+
+Barrels are written by the calling process: the build is bound by parsing
+the inverted indexes, encoding and writing are a small part of it. Every
+barrel's size and sha256 go into barrels_manifest.json next to the index, so
+a copied or half-written barrel directory can be checked with
+verify_barrels().
+"""
+
+import hashlib
+import json
+import os
+import struct
+
+import ormsgpack
+
+from checkpoint import file_sha256
+
+BARREL_SIZE_MB = 45
+
+
+def msgpack_array_header(length):
+    """msgpack header of an array with `length` items."""
+    if length < 16:
+        return bytes([0x90 | length])
+    if length < 0x10000:
+        return b'\xdc' + struct.pack('>H', length)
+    return b'\xdd' + struct.pack('>I', length)
+
+
+def encode_postings(postings):
+    return ormsgpack.packb(postings)
+
+
+def write_barrel(barrel_path, encoded_items):
+    """Write one barrel file, returns (size_in_bytes, sha256 hex digest)."""
+    digest = hashlib.sha256()
+    header = msgpack_array_header(len(encoded_items))
+    digest.update(header)
+    size = len(header)
+    with open(barrel_path, 'wb') as f:
+        f.write(header)
+        for encoded in encoded_items:
+            digest.update(encoded)
+            size += len(encoded)
+        f.writelines(encoded_items)
+    return size, digest.hexdigest()
+
+
+def verify_barrels(barrels_dir, manifest_file="barrels_manifest.json"):
+    """Barrel files whose size or checksum does not match the manifest (empty list when all is fine)."""
+    with open(os.path.join(barrels_dir, manifest_file), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    broken = []
+    for barrel in manifest["barrels"]:
+        path = os.path.join(barrels_dir, barrel["file"])
+        if (not os.path.exists(path) or os.path.getsize(path) != barrel["bytes"]
+                or file_sha256(path) != barrel["sha256"]):
+            broken.append(barrel["file"])
+    return broken
+
+
+class BarrelWriter:
+    """Appends words in order and cuts a new barrel once the size limit would be reached."""
+
+    def __init__(self, barrels_dir, barrel_size_mb=BARREL_SIZE_MB, index_file="barrels_index.json",
+                 manifest_file="barrels_manifest.json"):
+        self.barrels_dir = barrels_dir
+        self.barrel_size_bytes = int(barrel_size_mb * 1024 * 1024)
+        self.index_path = os.path.join(barrels_dir, index_file)
+        self.manifest_path = os.path.join(barrels_dir, manifest_file)
+        os.makedirs(barrels_dir, exist_ok=True)
+
+        self.barrel_number = 0
+        self.current_barrel = []      # encoded posting lists of the open barrel
+        self.current_size = 0
+        self.barrels_index = {}
+        self.barrels = []             # manifest entries of finished barrels
+
+    def add(self, word, postings):
+        self.add_encoded(word, encode_postings(postings))
+
+    def add_encoded(self, word, encoded):
+        if self.current_barrel and self.current_size + len(encoded) >= self.barrel_size_bytes:
+            self._flush()
+        self.barrels_index[word] = [self.barrel_number, len(self.current_barrel)]
+        self.current_barrel.append(encoded)
+        self.current_size += len(encoded)
+
+    def _flush(self):
+        self._write(self.barrel_number, self.current_barrel)
+        self.barrel_number += 1
+        self.current_barrel = []
+        self.current_size = 0
+
+    def _write(self, barrel_number, encoded_items):
+        barrel_path = os.path.join(self.barrels_dir, f"{barrel_number}.msgpack")
+        size, sha256 = write_barrel(barrel_path, encoded_items)
+        self.barrels.append({"file": f"{barrel_number}.msgpack", "words": len(encoded_items),
+                             "bytes": size, "sha256": sha256})
+
+    def close(self):
+        """Write the last barrel, the barrels index and the manifest, returns the number of barrels."""
+        if self.current_barrel:
+            self._flush()
+        self.barrels.sort(key=lambda barrel: int(barrel["file"].split(".")[0]))
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(self.barrels_index, f, indent=2, ensure_ascii=False)
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "barrel_size_bytes": self.barrel_size_bytes,
+                "words": len(self.barrels_index),
+                "barrels": self.barrels,
+            }, f, indent=2)
+        return len(self.barrels)
+
+
+class PlannedBarrelWriter(BarrelWriter):
+    """
+    Writes barrels following a layout from Barrel Scripts/barrel_planner.py:
+    {"barrels": [[word, ...], ...]} gives the words of every barrel. Words still
+    have to be added in word id order; a barrel is written as soon as its last
+    word arrived. Words the layout does not know (added to the lexicon after
+    planning) are packed sequentially into extra barrels after the planned ones.
+    """
+
+    def __init__(self, barrels_dir, layout, **kwargs):
+        super().__init__(barrels_dir, **kwargs)
+        self.word_barrel = {}
+        for barrel_number, words in enumerate(layout["barrels"]):
+            for word in words:
+                self.word_barrel[word] = barrel_number
+        self.missing_words = [len(words) for words in layout["barrels"]]
+        self.open_barrels = {}
+        self.barrel_number = len(layout["barrels"])
+
+    def add_encoded(self, word, encoded):
+        barrel_number = self.word_barrel.get(word)
+        if barrel_number is None:
+            super().add_encoded(word, encoded)
+            return
+        items = self.open_barrels.setdefault(barrel_number, [])
+        self.barrels_index[word] = [barrel_number, len(items)]
+        items.append(encoded)
+        self.missing_words[barrel_number] -= 1
+        if not self.missing_words[barrel_number]:
+            self._write(barrel_number, self.open_barrels.pop(barrel_number))
+
+    def close(self):
+        # Planned words that never showed up leave their barrel short, not broken
+        for barrel_number in sorted(self.open_barrels):
+            self._write(barrel_number, self.open_barrels.pop(barrel_number))
+        return super().close()
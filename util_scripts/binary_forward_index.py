@@ -0,0 +1,217 @@
+"""
+Binary forward index: for every document the run of its term ids, with the
+per-zone counts and the first positions of every term, in typed arrays.
+
+The JSON forward indexes only list the word ids of a document, so everything
+downstream (inverted index, similarity, snippets) had to parse and tokenize
+the raw HTML / paper JSON again. This file keeps what those stages need and
+is read through mmap, so workers share it and nothing is unpickled.
+
+Documents are addressed by their internal number (util_scripts/doc_ids.py:
+H<n> -> 2n, P<n> -> 2n + 1); the HTML pages and the papers go in separate
+files, each with its own zones:
+
+    HTML_ZONES:  title, meta_description, headings, total, in_domain, in_url
+    PAPER_ZONES: front (title, abstract, authors), body, back (references, ...), total
+    ANCHOR_ZONES: anchor (the anchor text of the links to a page, no positions,
+                  see Inverted Index Scripts/anchor_index.py)
+
+Layout (little endian, every section 8-byte aligned):
+    header          magic, zone count, max positions per term, length of the
+                    zone names JSON, document slots N, terms T, positions P
+    zone names      JSON list
+    term_start      uint64[N]   first term of document slot i (ABSENT if no document)
+    term_end        uint64[N]
+    doc_length      uint32[N]   number of tokens of the document
+    term_ids        uint32[T]   sorted within a document
+    counts          uint32[T x zone count]
+    position_start  uint64[T + 1]
+    positions       uint32[P]   at most max positions per term, ascending
+"""
+
+import json
+import mmap
+import os
+import shutil
+import struct
+from array import array
+
+import numpy as np
+
+MAGIC = b"BFI1"
+HEADER = struct.Struct("<4sHHIQQQ")
+ABSENT = 0xFFFFFFFFFFFFFFFF
+MAX_POSITIONS = 15
+
+HTML_ZONES = ("title", "meta_description", "headings", "total", "in_domain", "in_url")
+PAPER_ZONES = ("front", "body", "back", "total")
+ANCHOR_ZONES = ("anchor",)
+
+
+def _padding(size):
+    return b"\0" * (-size % 8)
+
+
+class ForwardIndexWriter:
+    """
+    Collects documents in any order and writes the binary forward index on
+    close(). The term level arrays are spilled to temporary files as the
+    documents come in, only the per-document directory stays in memory.
+    """
+
+    def __init__(self, path, zones, max_positions=MAX_POSITIONS):
+        self.path = path
+        self.zones = list(zones)
+        self.max_positions = max_positions
+        self.tmp_dir = path + ".parts"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.parts = {name: open(os.path.join(self.tmp_dir, name), 'wb')
+                      for name in ("term_ids", "counts", "position_start", "positions")}
+        self.directory = {}      # doc number -> (term_start, term_end, doc_length)
+        self.terms = 0
+        self.positions = 0
+
+    def add(self, number, doc_length, term_ids, counts, positions):
+        """
+        term_ids: sorted term ids of the document
+        counts: the len(zones) counts of every term, flattened ([t0 zone0, t0 zone1, ..., t1 zone0, ...])
+        positions: one list of positions per term (cut to max_positions)
+        """
+        if number in self.directory:
+            raise ValueError(f"Document {number} was already added")
+        position_start = array('Q')
+        flat_positions = array('I')
+        for term_positions in positions:
+            position_start.append(self.positions + len(flat_positions))
+            flat_positions.extend(term_positions[:self.max_positions])
+        flat_counts = array('I', counts)
+        if len(flat_counts) != len(term_ids) * len(self.zones):
+            raise ValueError(f"Document {number}: expected {len(self.zones)} counts per term")
+
+        array('I', term_ids).tofile(self.parts["term_ids"])
+        flat_counts.tofile(self.parts["counts"])
+        position_start.tofile(self.parts["position_start"])
+        flat_positions.tofile(self.parts["positions"])
+        self.directory[number] = (self.terms, self.terms + len(term_ids), doc_length)
+        self.terms += len(term_ids)
+        self.positions += len(flat_positions)
+
+    def close(self):
+        array('Q', [self.positions]).tofile(self.parts["position_start"])
+        for part in self.parts.values():
+            part.close()
+
+        slots = max(self.directory, default=-1) + 1
+        term_start = np.full(slots, ABSENT, dtype='<u8')
+        term_end = np.full(slots, ABSENT, dtype='<u8')
+        doc_length = np.zeros(slots, dtype='<u4')
+        for number, (start, end, length) in self.directory.items():
+            term_start[number], term_end[number], doc_length[number] = start, end, length
+
+        names = json.dumps(self.zones).encode('utf-8')
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(self.zones), self.max_positions, len(names),
+                                slots, self.terms, self.positions))
+            f.write(names + _padding(HEADER.size + len(names)))
+            for column in (term_start, term_end, doc_length):
+                f.write(column.tobytes() + _padding(column.nbytes))
+            for name in ("term_ids", "counts", "position_start", "positions"):
+                with open(os.path.join(self.tmp_dir, name), 'rb') as part:
+                    shutil.copyfileobj(part, f, 1024 * 1024)
+                f.write(_padding(os.path.getsize(os.path.join(self.tmp_dir, name))))
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(self.tmp_dir)
+        return len(self.directory)
+
+
+class BinaryForwardIndex:
+    """Memory-mapped reader of a file written by ForwardIndexWriter."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, zone_count, self.max_positions, names_length, slots, terms, positions = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a binary forward index")
+        self.zones = json.loads(self.mm[HEADER.size:HEADER.size + names_length].decode('utf-8'))
+        self.slots = slots
+
+        offset = HEADER.size + names_length
+        offset += -offset % 8
+
+        def section(dtype, count):
+            nonlocal offset
+            view = np.frombuffer(self.mm, dtype=dtype, count=count, offset=offset)
+            offset += view.nbytes + (-view.nbytes % 8)
+            return view
+
+        self.term_start = section('<u8', slots)
+        self.term_end = section('<u8', slots)
+        self.doc_lengths = section('<u4', slots)
+        self.term_ids = section('<u4', terms)
+        self.counts = section('<u4', terms * zone_count).reshape(terms, zone_count)
+        self.position_start = section('<u8', terms + 1)
+        self.positions_data = section('<u4', positions)
+
+    def __contains__(self, number):
+        return 0 <= number < self.slots and self.term_start[number] != ABSENT
+
+    def __len__(self):
+        return int(np.count_nonzero(self.term_start != ABSENT))
+
+    def doc_numbers(self):
+        """Numbers of the documents in the file, ascending."""
+        return np.flatnonzero(self.term_start != ABSENT)
+
+    def _range(self, number):
+        if number not in self:
+            raise KeyError(number)
+        return int(self.term_start[number]), int(self.term_end[number])
+
+    def doc_length(self, number):
+        self._range(number)
+        return int(self.doc_lengths[number])
+
+    def terms(self, number):
+        """Sorted term ids of a document (a read-only numpy view)."""
+        start, end = self._range(number)
+        return self.term_ids[start:end]
+
+    def zone_counts(self, number):
+        """(terms, zones) array of counts, rows in the order of terms()."""
+        start, end = self._range(number)
+        return self.counts[start:end]
+
+    def term_frequencies(self, number, zone="total"):
+        """(term ids, counts in one zone), e.g. the term vector for similarity."""
+        start, end = self._range(number)
+        return self.term_ids[start:end], self.counts[start:end, self.zones.index(zone)]
+
+    def positions(self, number):
+        """List of position lists, one per term in the order of terms()."""
+        start, end = self._range(number)
+        bounds = self.position_start[start:end + 1].tolist()
+        data = self.positions_data
+        return [data[bounds[i]:bounds[i + 1]].tolist() for i in range(end - start)]
+
+    def term_positions(self, number, term):
+        """Positions of one term in a document (empty if the document does not have it)."""
+        start, end = self._range(number)
+        row = start + int(np.searchsorted(self.term_ids[start:end], term))
+        if row == end or self.term_ids[row] != term:
+            return []
+        return self.positions_data[self.position_start[row]:self.position_start[row + 1]].tolist()
+
+    def document(self, number):
+        """[(term_id, [zone counts], [positions])] of a document."""
+        return list(zip(self.terms(number).tolist(), self.zone_counts(number).tolist(), self.positions(number)))
+
+    def __getstate__(self):
+        # Pickled as its path, the receiving process maps the file itself
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
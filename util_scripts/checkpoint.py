@@ -0,0 +1,128 @@
+"""
+Durable progress for the long-running pipeline stages.
+
+A Checkpoint is an append-only journal (one JSON record per line, fsynced)
+of the units of work a stage has finished: a batch, a chunk of documents, a
+part file. Every record lists the output files of the unit with their sha256,
+so on restart a unit only counts as done if its outputs are still there and
+unchanged; anything else is redone. A torn last line from a crash is ignored.
+The size and mtime of the stage's inputs are recorded too: when an input
+changed since the journal was started, the old progress is thrown away.
+The journal only lives until the stage completes, see finish().
+
+atomic_write() is used for the outputs themselves: the data goes to a
+temporary file next to the target and is renamed over it only once it is
+complete and flushed, so a partial file never has the final name.
+"""
+
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def atomic_write(path, mode='w', **open_kwargs):
+    """open() replacement that only puts the file at `path` if the block succeeds."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, mode, **open_kwargs) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def fingerprint(paths):
+    fingerprints = {}
+    for path in paths:
+        stat = os.stat(path)
+        fingerprints[path] = [stat.st_size, stat.st_mtime_ns]
+    return fingerprints
+
+
+class Checkpoint:
+    INPUTS_UNIT = "__inputs__"
+
+    def __init__(self, path, inputs=(), verify=True):
+        self.path = path
+        self.verify = verify
+        self.units = {}
+        if os.path.exists(path):
+            good_bytes = 0
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break   # torn write of the last record
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self.units[record["unit"]] = record
+                    good_bytes += len(line)
+            # Cut the torn record off so new records start on a fresh line
+            os.truncate(path, good_bytes)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.inputs = fingerprint(inputs)
+        if self.units.get(self.INPUTS_UNIT, {}).get("data", {}).get("inputs") != self.inputs:
+            self.reset()
+
+    def __len__(self):
+        return len(self.units) - 1
+
+    def done(self, unit):
+        """True if `unit` was recorded and its outputs are still intact."""
+        record = self.units.get(unit)
+        if record is None:
+            return False
+        for output, checksum in record["outputs"].items():
+            if not os.path.exists(output):
+                return False
+            if self.verify and file_sha256(output) != checksum:
+                return False
+        return True
+
+    def data(self, unit):
+        """Extra data stored with a recorded unit."""
+        return self.units[unit]["data"]
+
+    def record(self, unit, outputs=(), **data):
+        """Mark `unit` as done once its outputs are complete on disk."""
+        record = {
+            "unit": unit,
+            "outputs": {output: file_sha256(output) for output in outputs},
+            "data": data,
+        }
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.units[unit] = record
+
+    def finish(self):
+        """The stage completed: drop the journal, the next run starts from scratch."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.units = {}
+
+    def reset(self):
+        """Forget all progress, e.g. when the inputs of the stage changed."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.units = {}
+        self.record(self.INPUTS_UNIT, inputs=self.inputs)
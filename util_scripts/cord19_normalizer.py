@@ -0,0 +1,254 @@
+"""
+Normalizes the CORD-19 paper JSONs into the schema of JSON-Cleaner.py, which
+it replaces:
+
+    {"paper_id", "metadata": {"title"}, "body_text": [{"text"}], "bib_entries": {id: {"title", "other_ids"}}}
+
+with the abstract and the section names as "%Abstract%" / "%<section>%"
+marker blocks in body_text, and the bib titles cut to their longest part
+without a comma or period.
+
+JSON-Cleaner.py went through the papers one by one with json.load, wrote
+indented JSON next to them and deleted every original right away. Here a
+process pool parses with orjson and writes compact JSON, atomically, into a
+separate output directory. A restarted run skips the papers whose output is
+already there, so it simply continues where the last one stopped.
+
+With --shards the papers go into a few large JSON lines files
+(cord19_shard_<n>.jsonl, SHARD_SIZE papers each, one paper per line with its
+file name under "id") instead of one file per paper. The shards are
+journaled with a checkpoint, so a restarted run only redoes the unfinished
+ones. Shard numbers are never reused: a run numbers its shards after the ones
+already in the output folder, so e.g. a later run on newly added papers adds
+shards next to the earlier ones instead of overwriting them.
+
+--delete-originals removes the input JSONs once their output is safely on
+disk (per paper, or after all shards were written). With --shards the files
+to delete are first written to deletions.json in the output folder and the
+checkpoint is only dropped once they are gone; a run interrupted while
+deleting is completed by the next one before it looks at the inputs.
+
+Usage:
+    python cord19_normalizer.py [input_dir] [output_dir] [--shards] [--shard-size 5000] [--delete-originals]
+"""
+
+import argparse
+import os
+import re
+from multiprocessing import Pool, cpu_count
+
+import orjson
+from tqdm import tqdm
+
+from checkpoint import Checkpoint, atomic_write
+
+SHARD_SIZE = 5000     # papers per JSON lines shard
+SHARD_RE = re.compile(r"cord19_shard_(\d+)\.jsonl$")
+FIRST_SHARD_UNIT = "__first_shard__"
+DELETIONS_FILE = "deletions.json"
+
+INPUT_DIR = os.path.join("..", "Data", "Cord 19", "document_parses", "pdf_json")
+OUTPUT_DIR = os.path.join("..", "Data", "Cord 19", "document_parses", "pdf_json_clean")
+
+
+# ------------------ Schema ------------------
+def extract_clean_title(text):
+    """Return longest substring without comma or period."""
+    parts = re.split(r"[.,]", text)
+    return max(parts, key=len).strip() if parts else text
+
+
+def normalize_paper(data):
+    """The paper in the schema of JSON-Cleaner.py."""
+    metadata = data.get("metadata", {})
+    body_text = []
+
+    abstract_blocks = metadata.get("abstract") or data.get("abstract") or []
+    if abstract_blocks:
+        body_text.append({"text": "%Abstract%"})
+        for block in abstract_blocks:
+            text = block.get("text", "").strip()
+            if text:
+                body_text.append({"text": text})
+
+    last_section = None
+    for block in metadata.get("body_text") or data.get("body_text") or []:
+        section = block.get("section", "").strip()
+        text = block.get("text", "").strip()
+        if not text:
+            continue
+        if section and section != last_section:
+            body_text.append({"text": f"%{section}%"})
+            last_section = section
+        body_text.append({"text": text})
+
+    bib_entries = {}
+    for ref_id, ref_data in (metadata.get("bib_entries") or data.get("bib_entries") or {}).items():
+        raw_title = ref_data.get("title", "").strip()
+        bib_entries[ref_id] = {
+            "title": extract_clean_title(raw_title) if raw_title else "",
+            "other_ids": ref_data.get("other_ids", {}),
+        }
+
+    return {
+        "paper_id": data.get("paper_id", ""),
+        "metadata": {"title": metadata.get("title", "")},
+        "body_text": body_text,
+        "bib_entries": bib_entries,
+    }
+
+
+def read_paper(path):
+    with open(path, 'rb') as f:
+        return normalize_paper(orjson.loads(f.read()))
+
+
+# ------------------ Workers ------------------
+def normalize_file(task):
+    # One paper to one compact JSON file; returns (path, error) if it fails
+    input_path, output_path, delete_original = task
+    try:
+        paper = read_paper(input_path)
+        with atomic_write(output_path, 'wb') as f:
+            f.write(orjson.dumps(paper))
+    except Exception as e:
+        return input_path, str(e)
+    if delete_original:
+        os.remove(input_path)
+    return None
+
+
+def normalize_shard(task):
+    # A slice of the papers to one JSON lines shard; returns the (path, error) of the failed ones
+    shard_path, input_paths = task
+    errors = []
+    with atomic_write(shard_path, 'wb') as f:
+        for input_path in input_paths:
+            try:
+                paper = read_paper(input_path)
+            except Exception as e:
+                errors.append((input_path, str(e)))
+                continue
+            f.write(orjson.dumps({"id": os.path.basename(input_path)[:-len(".json")], **paper}))
+            f.write(b"\n")
+    return shard_path, len(input_paths) - len(errors), errors
+
+
+# ------------------ MAIN ------------------
+def write_files(pool, input_dir, output_dir, names, delete_originals):
+    todo = [name for name in names if not os.path.exists(os.path.join(output_dir, name))]
+    if len(todo) < len(names):
+        print(f"Resuming: {len(names) - len(todo)} papers already normalized")
+        if delete_originals:
+            for name in set(names) - set(todo):
+                os.remove(os.path.join(input_dir, name))
+
+    tasks = [(os.path.join(input_dir, name), os.path.join(output_dir, name), delete_originals) for name in todo]
+    errors = [error for error in tqdm(pool.imap_unordered(normalize_file, tasks, chunksize=64),
+                                      total=len(tasks), desc="Normalizing papers", unit="papers") if error]
+    return len(tasks) - len(errors), errors
+
+
+def next_shard_number(output_dir):
+    """Number after the highest shard in output_dir, 0 if there is none."""
+    numbers = [int(match.group(1)) for match in map(SHARD_RE.match, os.listdir(output_dir)) if match]
+    return max(numbers, default=-1) + 1
+
+
+def finish_deletions(output_dir):
+    """Delete the originals listed in deletions.json, returns how many were listed."""
+    path = os.path.join(output_dir, DELETIONS_FILE)
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'rb') as f:
+        paths = orjson.loads(f.read())
+    for input_path in paths:
+        try:
+            os.remove(input_path)
+        except FileNotFoundError:
+            pass
+    os.remove(path)
+    return len(paths)
+
+
+def write_shards(pool, input_dir, output_dir, names, delete_originals, shard_size):
+    checkpoint = Checkpoint(os.path.join(output_dir, "checkpoint.jsonl"), inputs=[input_dir])
+    if FIRST_SHARD_UNIT in checkpoint.units:
+        first_shard = checkpoint.data(FIRST_SHARD_UNIT)["first"]
+    else:
+        # A fresh run: continue after the shards of earlier runs, never overwrite them
+        first_shard = next_shard_number(output_dir)
+        checkpoint.record(FIRST_SHARD_UNIT, first=first_shard)
+
+    tasks = []
+    papers, errors, resumed = 0, [], 0
+    for number, start in enumerate(range(0, len(names), shard_size), first_shard):
+        shard_path = os.path.join(output_dir, f"cord19_shard_{number:05d}.jsonl")
+        if checkpoint.done(shard_path):
+            # The papers that failed in an earlier run are not in the shard, keep their originals
+            done = checkpoint.data(shard_path)
+            papers += done["papers"]
+            errors.extend((path, error) for path, error in done.get("failed", []))
+            resumed += 1
+        else:
+            tasks.append((shard_path, [os.path.join(input_dir, name) for name in names[start:start + shard_size]]))
+    if resumed:
+        print(f"Resuming: {resumed} shards already done")
+
+    for shard_path, written, shard_errors in tqdm(pool.imap_unordered(normalize_shard, tasks),
+                                                  total=len(tasks), desc="Writing shards", unit="shards"):
+        if not written:
+            # Only papers that failed again, e.g. the ones left over by an earlier run
+            os.remove(shard_path)
+        checkpoint.record(shard_path, [shard_path] if written else [], papers=written, failed=shard_errors)
+        papers += written
+        errors.extend(shard_errors)
+
+    if delete_originals:
+        # Journal the deletions first: deleting changes the inputs, which resets the checkpoint
+        failed = {path for path, _ in errors}
+        paths = [os.path.join(input_dir, name) for name in names if os.path.join(input_dir, name) not in failed]
+        with atomic_write(os.path.join(output_dir, DELETIONS_FILE), 'wb') as f:
+            f.write(orjson.dumps(paths))
+        finish_deletions(output_dir)
+    checkpoint.finish()
+    return papers, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalize the CORD-19 paper JSONs in parallel.")
+    parser.add_argument("input_dir", nargs="?", default=INPUT_DIR)
+    parser.add_argument("output_dir", nargs="?", default=OUTPUT_DIR)
+    parser.add_argument("--shards", action="store_true", help="write JSON lines shards instead of one file per paper")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="papers per shard")
+    parser.add_argument("--delete-originals", action="store_true", help="remove the input JSONs once normalized")
+    args = parser.parse_args()
+
+    input_dir, output_dir = os.path.abspath(args.input_dir), os.path.abspath(args.output_dir)
+    if not os.path.isdir(input_dir):
+        parser.error(f"{input_dir} is not a folder")
+    if input_dir == output_dir:
+        parser.error("the output folder has to be another one than the input folder")
+    os.makedirs(output_dir, exist_ok=True)
+    interrupted = finish_deletions(output_dir)
+    if interrupted:
+        print(f"Finished deleting the {interrupted} originals of an interrupted run")
+
+    names = sorted(name for name in os.listdir(input_dir) if name.lower().endswith(".json"))
+    if not names:
+        print("No .json files found in the folder.")
+        return
+
+    with Pool(cpu_count()) as pool:
+        if args.shards:
+            papers, errors = write_shards(pool, input_dir, output_dir, names, args.delete_originals, args.shard_size)
+        else:
+            papers, errors = write_files(pool, input_dir, output_dir, names, args.delete_originals)
+
+    for path, error in errors:
+        print(f"[ERR] Failed normalizing {path}: {error}")
+    print(f"Normalized {papers} papers into {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Internal document numbers.
+
+Postings carry string document ids: "H<n>" for HTML pages (n is the index of
+the page in ind_to_url.json) and "P<n>" for CORD-19 papers. Bitmaps and
+columnar tables need a dense integer instead, so both id spaces are
+interleaved into one:
+
+    H<n> -> 2n
+    P<n> -> 2n + 1
+"""
+
+
+def doc_number(doc_id):
+    """Internal number of a "H<n>" / "P<n>" document id."""
+    return (int(doc_id[1:]) << 1) | (doc_id[0] == "P")
+
+
+def doc_id(number):
+    """Inverse of doc_number."""
+    return ("P" if number & 1 else "H") + str(number >> 1)
@@ -0,0 +1,166 @@
+"""
+Columnar store of what it takes to show a result, keyed by internal doc
+number (util_scripts/doc_ids.py: H<n> -> 2n, P<n> -> 2n + 1):
+
+    url             page URL (ind_to_url.json) / paper URL (metadata_cleaned.csv)
+    domain          host of the URL
+    title           <title> of the page / paper title of metadata_cleaned.csv
+    citation_title  the title normalized like papers_citations_mapper.py does,
+                    the key of the citation ranks (papers only)
+    dataset         DATASETS index: "html" or "cord19" ("" for unused numbers)
+    length          tokens of the document, from the binary forward indexes
+
+Rendering results used to load ind_to_url.json and metadata_cleaned.csv
+(through pandas) into dicts keyed by strings in every process and to
+normalize a paper's title again for every citation lookup. Here every column
+is a file in ../Data/DocMetadata that is opened with mmap: the string columns
+are StringLists (util_scripts/shared_tables.py) and the numeric ones a numpy
+record array, one slot per doc number. Hydrating k results is k slot reads,
+nothing is parsed at startup and all processes share the same pages.
+DocMetadata pickles as its path like the other tables.
+
+    python doc_metadata.py     builds the store (page titles are extracted in a process pool)
+"""
+
+import csv
+import json
+import os
+import sys
+from multiprocessing import Pool, cpu_count
+from urllib.parse import urlparse
+
+import numpy as np
+from tqdm import tqdm
+
+from binary_forward_index import BinaryForwardIndex
+from checkpoint import atomic_write
+from doc_ids import doc_number
+from html_extractor import extract_zones
+from shared_tables import StringList, build_string_list
+
+DATASETS = ("", "html", "cord19")
+STRING_COLUMNS = ("url", "domain", "title", "citation_title")
+NUMERIC_DTYPE = np.dtype([("dataset", "u1"), ("length", "<u4")])
+
+METADATA_DIR = os.path.join("..", "Data", "DocMetadata")
+IND_TO_URL_PATH = os.path.join("..", "Data", "ind_to_url.json")
+RAW_HTML_DIR = os.path.join("..", "Data", "Files", "raw")
+PAPERS_METADATA_PATH = os.path.join("..", "Data", "Cord 19", "metadata_cleaned.csv")
+FORWARD_INDEXES = [os.path.join("..", "Forward Index", "forward_index_html.bin"),
+                   os.path.join("..", "Forward Index", "forward_index_pdf.bin")]
+
+
+class DocMetadata:
+    """Memory-mapped reader of the columns written by build()."""
+
+    def __init__(self, path=METADATA_DIR):
+        self.path = path
+        self.strings = {column: StringList(os.path.join(path, column + ".table")) for column in STRING_COLUMNS}
+        self.numeric = np.load(os.path.join(path, "numeric.npy"), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.numeric)
+
+    def __contains__(self, number):
+        return 0 <= number < len(self.numeric) and self.numeric["dataset"][number] != 0
+
+    def get(self, number, column):
+        if column in self.strings:
+            return self.strings[column].get(number, "")
+        value = int(self.numeric[column][number]) if 0 <= number < len(self.numeric) else 0
+        return DATASETS[value] if column == "dataset" else value
+
+    def column(self, column, numbers):
+        """Values of one column for the documents: a numpy gather for the numeric ones (dataset as DATASETS index)."""
+        if column in self.strings:
+            return [self.strings[column].get(number, "") for number in numbers]
+        return self.numeric[column][np.asarray(numbers, dtype=np.int64)]
+
+    def row(self, number):
+        """{column: value} of one document."""
+        return {column: self.get(number, column) for column in STRING_COLUMNS + NUMERIC_DTYPE.names}
+
+    def rows(self, numbers, columns=None):
+        """[{column: value}] of the documents, e.g. the page of results to render."""
+        columns = columns or STRING_COLUMNS + NUMERIC_DTYPE.names
+        return [{column: self.get(number, column) for column in columns} for number in numbers]
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+# ------------------ Build ------------------
+def page_title(task):
+    page, path = task
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return page, extract_zones(f.read()).title.strip()
+    except (OSError, UnicodeDecodeError):
+        return page, ""
+
+
+def read_pages():
+    """{doc number: (url, title)} of the crawled pages."""
+    with open(IND_TO_URL_PATH, 'r', encoding='utf-8') as f:
+        ind_to_url = json.load(f)
+    tasks = [(int(page), os.path.join(RAW_HTML_DIR, f"{page}.html")) for page in ind_to_url]
+    pages = {}
+    with Pool(cpu_count()) as pool:
+        for page, title in tqdm(pool.imap_unordered(page_title, tasks, chunksize=64), total=len(tasks),
+                                desc="Reading page titles", unit="pages"):
+            pages[doc_number(f"H{page}")] = (ind_to_url[str(page)], title)
+    return pages
+
+
+def read_papers():
+    """{doc number: (url, title)} of the papers in metadata_cleaned.csv."""
+    papers = {}
+    with open(PAPERS_METADATA_PATH, 'r', newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row["id"].isdigit():
+                # A paper can have several URLs separated by "; ", the first one is shown
+                papers[doc_number(f"P{row['id']}")] = ((row.get("url") or "").split("; ")[0], row.get("title") or "")
+    return papers
+
+
+def build():
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Page Rank Scripts"))
+    from papers_citations_mapper import normalize_title
+
+    os.makedirs(METADATA_DIR, exist_ok=True)
+    pages = read_pages()
+    papers = read_papers()
+    slots = max(max(pages, default=-1), max(papers, default=-1)) + 1
+
+    numeric = np.zeros(slots, dtype=NUMERIC_DTYPE)
+    numeric["dataset"][list(pages)] = DATASETS.index("html")
+    numeric["dataset"][list(papers)] = DATASETS.index("cord19")
+    for path in FORWARD_INDEXES:
+        if os.path.exists(path):
+            index = BinaryForwardIndex(path)
+            numbers = index.doc_numbers()
+            numbers = numbers[numbers < slots]
+            numeric["length"][numbers] = index.doc_lengths[numbers]
+
+    def per_slot(values):
+        return (values(number) for number in range(slots))
+
+    documents = {**pages, **papers}
+    empty = ("", "")
+    build_string_list(os.path.join(METADATA_DIR, "url.table"), per_slot(lambda n: documents.get(n, empty)[0]))
+    build_string_list(os.path.join(METADATA_DIR, "domain.table"),
+                      per_slot(lambda n: urlparse(documents[n][0]).netloc if n in documents else ""))
+    build_string_list(os.path.join(METADATA_DIR, "title.table"), per_slot(lambda n: documents.get(n, empty)[1]))
+    build_string_list(os.path.join(METADATA_DIR, "citation_title.table"),
+                      per_slot(lambda n: normalize_title(papers[n][1]) if n in papers else ""))
+    with atomic_write(os.path.join(METADATA_DIR, "numeric.npy"), 'wb') as f:
+        np.save(f, numeric)
+
+    print(f"Metadata of {len(pages)} pages and {len(papers)} papers written to {METADATA_DIR}")
+
+
+if __name__ == "__main__":
+    build()
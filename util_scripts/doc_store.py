@@ -0,0 +1,306 @@
+"""
+Packed store of the raw documents: the crawled HTML pages and the CORD-19
+paper JSONs in a few large shard files of zstd-compressed documents instead
+of hundreds of thousands of small files.
+
+Every stage that reads the raw documents lists a directory and opens every
+file on its own; on a cold cache those syscalls and seeks cost more than the
+reading. A store is one directory (Data/DocStore/<kind>) with
+
+    shard_<n>.zst    the documents of the shard, one zstd frame each, back to back
+    shard_<n>.idx    numpy array (number, offset, size) of the frames of the shard
+    dictionary.zstd  zstd dictionary trained on a sample of the documents, the
+                     documents are small and mostly markup, so they share a lot
+                     (empty if there were too few documents to train one)
+    store.json       kind, shard names, document count and sizes
+
+Documents are addressed by their internal number (util_scripts/doc_ids.py:
+H<n> -> 2n, P<n> -> 2n + 1) and go into the shards in number order. DocStore
+reads a store with mmap; get() / text() decompress one document, scan()
+goes through all of them (or a subset) in the order they are stored, which
+is one sequential read per shard. It pickles as its path, like the other
+memory-mapped readers, so it can go to Pool workers.
+
+    python doc_store.py build html|pdf [--shard-mb 256] [--level 9]
+    python doc_store.py bench html|pdf [--limit N]
+
+build compresses the documents in a process pool and seals a shard once it
+reaches --shard-mb. Sealed shards are journaled with a checkpoint, so a
+restarted build continues after the last sealed shard. bench times a full
+scan through the loose files against one through the store (and random
+access by number), and prints documents and MB of raw text per second.
+"""
+
+import argparse
+import json
+import mmap
+import os
+import random
+import time
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+import zstandard as zstd
+from tqdm import tqdm
+
+from checkpoint import Checkpoint, atomic_write
+
+SHARD_BYTES = 256 * 1024 * 1024    # compressed bytes per shard
+CHUNK_DOCS = 256                   # documents per compression task
+DICTIONARY_BYTES = 112 * 1024
+DICTIONARY_SAMPLES = 2000
+LEVEL = 9
+
+INDEX_DTYPE = np.dtype([("number", "<i8"), ("offset", "<i8"), ("size", "<i8")])
+STORE_DIR = os.path.join("..", "Data", "DocStore")
+
+KINDS = {
+    "html": {"source": os.path.join("..", "Data", "Files", "raw"), "suffix": ".html", "parity": 0},
+    "pdf": {"source": os.path.join("..", "Data", "Cord 19", "document_parses", "pdf_json"), "suffix": ".json", "parity": 1},
+}
+
+
+def source_files(kind):
+    """[(number, path)] of the loose files of a kind, in number order."""
+    config = KINDS[kind]
+    files = []
+    for name in os.listdir(config["source"]):
+        stem = name[:-len(config["suffix"])]
+        if name.endswith(config["suffix"]) and stem.isdigit():
+            files.append(((int(stem) << 1) | config["parity"], os.path.join(config["source"], name)))
+    files.sort()
+    return files
+
+
+def compression_dict(data):
+    # An empty dictionary file: too few documents to train one
+    return zstd.ZstdCompressionDict(data) if data else None
+
+
+def shard_name(number):
+    return f"shard_{number:05d}"
+
+
+# ------------------ Reader ------------------
+class DocStore:
+    """Memory-mapped reader of a store written by build()."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "store.json"), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        with open(os.path.join(path, "dictionary.zstd"), 'rb') as f:
+            self.decompressor = zstd.ZstdDecompressor(dict_data=compression_dict(f.read()))
+
+        self.shards = []
+        indexes = []
+        for shard, name in enumerate(self.manifest["shards"]):
+            with open(os.path.join(path, name + ".zst"), 'rb') as f:
+                self.shards.append(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b"")
+            index = np.load(os.path.join(path, name + ".idx"))
+            indexes.append((index, np.full(len(index), shard, dtype=np.int32)))
+        index = np.concatenate([index for index, _ in indexes]) if indexes else np.zeros(0, dtype=INDEX_DTYPE)
+        shard_of = np.concatenate([shards for _, shards in indexes]) if indexes else np.zeros(0, dtype=np.int32)
+        order = np.argsort(index["number"], kind='stable')
+        self.number_index = index["number"][order]
+        self.shard_of = shard_of[order]
+        self.offsets = index["offset"][order]
+        self.sizes = index["size"][order]
+
+    def __len__(self):
+        return len(self.number_index)
+
+    def __contains__(self, number):
+        slot = np.searchsorted(self.number_index, number)
+        return slot < len(self.number_index) and self.number_index[slot] == number
+
+    def numbers(self):
+        """Numbers of the documents in the store, ascending."""
+        return self.number_index
+
+    def _frame(self, slot):
+        offset = int(self.offsets[slot])
+        return self.shards[self.shard_of[slot]][offset:offset + int(self.sizes[slot])]
+
+    def get(self, number):
+        """Raw bytes of a document."""
+        slot = int(np.searchsorted(self.number_index, number))
+        if slot == len(self.number_index) or self.number_index[slot] != number:
+            raise KeyError(number)
+        return self.decompressor.decompress(self._frame(slot))
+
+    def text(self, number):
+        return self.get(number).decode('utf-8')
+
+    def scan(self, numbers=None):
+        """(number, raw bytes) of all documents, or of `numbers`, in storage order."""
+        if numbers is None:
+            slots = np.arange(len(self.number_index))
+        else:
+            numbers = np.asarray(numbers, dtype=np.int64)
+            slots = np.searchsorted(self.number_index, numbers)
+            found = slots < len(self.number_index)
+            found[found] = self.number_index[slots[found]] == numbers[found]
+            slots = slots[found]
+        slots = slots[np.lexsort((self.offsets[slots], self.shard_of[slots]))]
+        for slot in slots.tolist():
+            yield int(self.number_index[slot]), self.decompressor.decompress(self._frame(slot))
+
+    def __getstate__(self):
+        # Pickled as its path, the receiving process maps the shards itself
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+# ------------------ Build ------------------
+def init_worker(dictionary_arg, level_arg):
+    global compressor
+    compressor = zstd.ZstdCompressor(level=level_arg, dict_data=compression_dict(dictionary_arg))
+
+
+def compress_chunk(files):
+    # [(number, raw size, frame)] of a chunk of loose files
+    frames = []
+    for number, path in files:
+        with open(path, 'rb') as f:
+            data = f.read()
+        frames.append((number, len(data), compressor.compress(data)))
+    return frames
+
+
+def train_dictionary(files):
+    sample = random.Random(0).sample(files, min(len(files), DICTIONARY_SAMPLES))
+    samples = []
+    for _, path in sample:
+        with open(path, 'rb') as f:
+            samples.append(f.read())
+    try:
+        return zstd.train_dictionary(DICTIONARY_BYTES, samples).as_bytes()
+    except zstd.ZstdError:
+        return b""
+
+
+def build(kind, shard_bytes, level):
+    store_dir = os.path.join(STORE_DIR, kind)
+    os.makedirs(store_dir, exist_ok=True)
+    files = source_files(kind)
+    checkpoint = Checkpoint(os.path.join(store_dir, "checkpoint.jsonl"), inputs=[KINDS[kind]["source"]])
+
+    dictionary_path = os.path.join(store_dir, "dictionary.zstd")
+    if not checkpoint.done(dictionary_path):
+        # A fresh build: the shards of an earlier store go
+        checkpoint.reset()
+        for name in os.listdir(store_dir):
+            if name.startswith("shard_"):
+                os.remove(os.path.join(store_dir, name))
+        with atomic_write(dictionary_path, 'wb') as f:
+            f.write(train_dictionary(files))
+        checkpoint.record(dictionary_path, [dictionary_path])
+    with open(dictionary_path, 'rb') as f:
+        dictionary = f.read()
+
+    # Sealed shards of an earlier run stay, the build continues after their documents
+    shards, stored = [], set()
+    raw_bytes = stored_bytes = 0
+    while checkpoint.done(shard_name(len(shards))):
+        name = shard_name(len(shards))
+        data = checkpoint.data(name)
+        stored.update(np.load(os.path.join(store_dir, name + ".idx"))["number"].tolist())
+        raw_bytes += data["raw_bytes"]
+        stored_bytes += data["stored_bytes"]
+        shards.append(name)
+    if shards:
+        print(f"Resuming after {len(shards)} shards")
+    todo = [(number, path) for number, path in files if number not in stored]
+
+    shard_file, entries, shard_raw = None, [], 0
+
+    def seal():
+        nonlocal shard_file, entries, shard_raw, raw_bytes, stored_bytes
+        name = shard_name(len(shards))
+        shard_file.flush()
+        os.fsync(shard_file.fileno())
+        size = shard_file.tell()
+        shard_file.close()
+        with atomic_write(os.path.join(store_dir, name + ".idx"), 'wb') as f:
+            np.save(f, np.array(entries, dtype=INDEX_DTYPE))
+        checkpoint.record(name, [os.path.join(store_dir, name + ".zst"), os.path.join(store_dir, name + ".idx")],
+                          raw_bytes=shard_raw, stored_bytes=size)
+        raw_bytes += shard_raw
+        stored_bytes += size
+        shards.append(name)
+        shard_file, entries, shard_raw = None, [], 0
+
+    chunks = [todo[i:i + CHUNK_DOCS] for i in range(0, len(todo), CHUNK_DOCS)]
+    with Pool(cpu_count(), initializer=init_worker, initargs=(dictionary, level)) as pool:
+        for frames in tqdm(pool.imap(compress_chunk, chunks), total=len(chunks), desc=f"Packing {kind}", unit="chunks"):
+            for number, size, frame in frames:
+                if shard_file is None:
+                    shard_file = open(os.path.join(store_dir, shard_name(len(shards)) + ".zst"), 'wb')
+                entries.append((number, shard_file.tell(), len(frame)))
+                shard_file.write(frame)
+                shard_raw += size
+                if shard_file.tell() >= shard_bytes:
+                    seal()
+    if shard_file is not None:
+        seal()
+
+    with atomic_write(os.path.join(store_dir, "store.json"), 'w', encoding='utf-8') as f:
+        json.dump({"kind": kind, "shards": shards, "documents": len(files),
+                   "raw_bytes": raw_bytes, "stored_bytes": stored_bytes}, f, indent=4)
+    checkpoint.finish()
+    print(f"Packed {len(files)} documents into {len(shards)} shards in {store_dir}: "
+          f"{raw_bytes / 2**20:.1f} MB -> {stored_bytes / 2**20:.1f} MB")
+
+
+# ------------------ Benchmark ------------------
+def bench(kind, limit):
+    store = DocStore(os.path.join(STORE_DIR, kind))
+
+    started = time.perf_counter()
+    files = source_files(kind)[:limit]
+    loose_bytes = 0
+    for _, path in files:
+        with open(path, 'rb') as f:
+            loose_bytes += len(f.read())
+    loose = time.perf_counter() - started
+
+    numbers = [number for number, _ in files]
+    started = time.perf_counter()
+    store_bytes = sum(len(data) for _, data in store.scan(numbers if limit else None))
+    scan = time.perf_counter() - started
+
+    sample = random.Random(0).sample(numbers, min(len(numbers), 1000))
+    started = time.perf_counter()
+    for number in sample:
+        store.get(number)
+    lookup = time.perf_counter() - started
+
+    count = len(files)
+    print(f"{'':<22}{'docs/s':>12}{'MB/s':>10}")
+    print(f"{'loose files':<22}{count / loose:>12.0f}{loose_bytes / 2**20 / loose:>10.1f}")
+    print(f"{'store scan':<22}{count / scan:>12.0f}{store_bytes / 2**20 / scan:>10.1f}")
+    print(f"{'store random access':<22}{len(sample) / lookup:>12.0f}")
+    print(f"Store: {store.manifest['stored_bytes'] / 2**20:.1f} MB for {store.manifest['raw_bytes'] / 2**20:.1f} MB "
+          f"of documents in {len(store.manifest['shards'])} shards (the loose timing depends on the page cache)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the raw documents into a compressed document store.")
+    parser.add_argument("command", choices=["build", "bench"])
+    parser.add_argument("kind", choices=sorted(KINDS))
+    parser.add_argument("--shard-mb", type=int, default=SHARD_BYTES // 2**20, help="compressed MB per shard")
+    parser.add_argument("--level", type=int, default=LEVEL, help="zstd compression level")
+    parser.add_argument("--limit", type=int, default=0, help="bench: only the first N documents")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build(args.kind, args.shard_mb * 2**20, args.level)
+    else:
+        bench(args.kind, args.limit or None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+HTML Extraction Throughput Benchmark
+====================================
+Measures how fast each html_extractor backend turns raw pages into zones:
+- pages per second and MB per second for every backend
+- text-only extraction (what lexicon_gen.py / forward_index.py need)
+- full zone extraction (what inverted_index.py needs)
+
+Usage: python extraction_benchmark.py [html_folder] [runs]
+"""
+
+import os
+import sys
+import time
+
+from html_extractor import BACKENDS, extract_text, extract_zones
+
+DEFAULT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "Files", "raw", "sample")
+
+
+def load_pages(folder):
+    pages = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.endswith('.html'):
+            with open(os.path.join(folder, filename), 'r', encoding='utf-8') as f:
+                pages.append(f.read())
+    return pages
+
+
+def time_backend(pages, extract, backend, runs):
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        for html in pages:
+            extract(html, backend)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(folder, runs=3):
+    pages = load_pages(folder)
+    if not pages:
+        print(f"No .html files found in {folder}")
+        return {}
+    total_mb = sum(len(html.encode('utf-8')) for html in pages) / (1024 * 1024)
+
+    print("=" * 80)
+    print("HTML EXTRACTION BENCHMARK")
+    print("=" * 80)
+    print(f"Pages: {len(pages)} ({total_mb:.2f} MB), best of {runs} runs")
+    print("-" * 80)
+
+    results = {}
+    for mode, extract in (("text", extract_text), ("zones", extract_zones)):
+        for backend in BACKENDS:
+            seconds = time_backend(pages, extract, backend, runs)
+            results[(mode, backend)] = seconds
+            print(f"{mode:6s} {backend:12s} -> {seconds:7.3f}s | "
+                  f"{len(pages) / seconds:8.1f} pages/s | {total_mb / seconds:6.2f} MB/s")
+
+    print("-" * 80)
+    for mode in ("text", "zones"):
+        for backend in BACKENDS:
+            if backend != "stream":
+                speedup = results[(mode, backend)] / results[(mode, "stream")]
+                print(f"{mode:6s} stream vs {backend:12s}: {speedup:.2f}x faster")
+    return results
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FOLDER
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    run_benchmark(folder, runs)
@@ -0,0 +1,81 @@
+"""
+Extraction Conformance Check
+============================
+Runs every html_extractor backend over a folder of HTML pages and compares the
+token streams of each zone against the BeautifulSoup html.parser backend, which
+is what lexicon_gen.py and forward_index.py used to build the lexicon and the
+forward index.
+
+Usage: python extraction_conformance.py [html_folder] [reference_backend]
+Exits with 1 if the stream backend disagrees with the reference on any page.
+"""
+
+import os
+import sys
+
+from html_extractor import BACKENDS, extract_zones
+from tokenizer import html_tokens
+
+DEFAULT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "Files", "raw", "sample")
+
+
+def normalize_and_tokenize(text):
+    # Same rules the index builders use for page text
+    return list(html_tokens(text))
+
+
+def zone_token_streams(zones):
+    """Token stream of every zone, in the form the index builders consume them."""
+    headings = []
+    for heading in zones.headings:
+        headings.extend(normalize_and_tokenize(heading))
+    return {
+        "text": normalize_and_tokenize(zones.text),
+        "title": normalize_and_tokenize(zones.title),
+        "meta_description": normalize_and_tokenize(zones.meta_description),
+        "headings": headings,
+        "anchor_hrefs": [href for href, _ in zones.anchors],
+        "anchor_texts": [text for _, text in zones.anchors],
+    }
+
+
+def first_difference(expected, actual):
+    for i, (a, b) in enumerate(zip(expected, actual)):
+        if a != b:
+            return f"token {i}: expected {a[:40]!r}, got {b[:40]!r}"
+    return f"length: expected {len(expected)} tokens, got {len(actual)}"
+
+
+def check_folder(folder, reference="html.parser"):
+    files = sorted(f for f in os.listdir(folder) if f.endswith('.html'))
+    backends = [b for b in BACKENDS if b != reference]
+    mismatches = {b: {} for b in backends}
+
+    for filename in files:
+        with open(os.path.join(folder, filename), 'r', encoding='utf-8') as f:
+            html = f.read()
+        expected = zone_token_streams(extract_zones(html, reference))
+        for backend in backends:
+            actual = zone_token_streams(extract_zones(html, backend))
+            for zone, tokens in expected.items():
+                if actual[zone] != tokens:
+                    mismatches[backend].setdefault(zone, []).append(
+                        (filename, first_difference(tokens, actual[zone]))
+                    )
+
+    print(f"Checked {len(files)} pages against the '{reference}' backend")
+    for backend in backends:
+        if not mismatches[backend]:
+            print(f"  {backend:12s} -> all zones match")
+            continue
+        for zone, failures in mismatches[backend].items():
+            print(f"  {backend:12s} -> {zone}: {len(failures)}/{len(files)} pages differ "
+                  f"(e.g. {failures[0][0]}, {failures[0][1]})")
+    return mismatches
+
+
+if __name__ == "__main__":
+    folder = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_FOLDER
+    reference = sys.argv[2] if len(sys.argv) > 2 else "html.parser"
+    results = check_folder(folder, reference)
+    sys.exit(1 if results.get("stream") else 0)
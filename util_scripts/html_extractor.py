@@ -0,0 +1,212 @@
+"""
+Pluggable HTML text / zone extraction shared by the lexicon, forward index and
+inverted index scripts, so every stage tokenizes a page from the same text.
+
+Every backend returns the same Zones record:
+    text             -> visible text of the page (what soup.get_text() returns)
+    title            -> text of the first <title> tag ("" if there is none)
+    meta_description -> content of the first <meta name="description"> ("" if there is none)
+    headings         -> texts of all h1 tags, then all h2 tags, ... down to h6
+    anchors          -> (href, anchor_text) for every <a> tag, anchor text stripped like get_text(strip=True)
+
+Backends:
+    "stream"      -> single pass over html.parser events, no DOM is built (default)
+    "html.parser" -> BeautifulSoup with the builtin parser (old lexicon_gen.py / forward_index.py behaviour)
+    "lxml"        -> BeautifulSoup with lxml (old inverted_index.py behaviour)
+
+The stream backend follows the html.parser tree builder rules that matter for
+text: strings inside script/style/template/rt/rp, comments and doctypes are
+not visible text, CDATA sections are (html.parser soups keep them as CData
+strings), void tags are never opened, and an end tag closes the most
+recent open tag with the same name (or is ignored if there is none). Use
+util_scripts/extraction_conformance.py to compare the backends on real pages.
+"""
+
+from collections import namedtuple
+from html.parser import HTMLParser
+
+Zones = namedtuple("Zones", ["text", "title", "meta_description", "headings", "anchors"])
+
+DEFAULT_BACKEND = "stream"
+
+# Tags html.parser based soups never push on the tag stack (HTMLTreeBuilder.empty_element_tags)
+VOID_TAGS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link",
+    "menuitem", "meta", "param", "source", "track", "wbr",
+    "basefont", "bgsound", "command", "frame", "image", "isindex", "nextid", "spacer",
+])
+
+# Tags whose strings BeautifulSoup stores as Script/Stylesheet/... and get_text() skips
+HIDDEN_TEXT_TAGS = frozenset(["script", "style", "template", "rt", "rp"])
+
+HEADING_TAGS = {"h1": 0, "h2": 1, "h3": 2, "h4": 3, "h5": 4, "h6": 5}
+
+
+class ZoneParser(HTMLParser):
+    """Collects the zones of one page straight from the parser events."""
+
+    def __init__(self, zones=True):
+        super().__init__(convert_charrefs=True)
+        self.want_zones = zones
+        self.text = []
+        self.title = None
+        self.meta_description = None
+        self.headings = [[] for _ in range(6)]
+        self.anchors = []
+
+        self._stack = []          # names of the open (non void) tags
+        self._hidden = 0          # number of open script/style/template/rt/rp tags
+        self._captures = []       # [stack_depth, target_list, index, pieces] for every open title/heading/a
+        self._title_seen = False
+        self._meta_seen = False
+
+    # ---------- tag events ----------
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS:
+            if tag == "meta" and self.want_zones and not self._meta_seen:
+                attrs = dict(attrs)
+                if attrs.get("name") == "description":
+                    self._meta_seen = True
+                    self.meta_description = attrs.get("content") or ""
+            return
+
+        depth = len(self._stack)
+        self._stack.append(tag)
+        if tag in HIDDEN_TEXT_TAGS:
+            self._hidden += 1
+
+        if not self.want_zones:
+            return
+        # Results are slotted in at the start tag so they keep document order (like find_all)
+        if tag in HEADING_TAGS:
+            level = self.headings[HEADING_TAGS[tag]]
+            level.append("")
+            self._captures.append([depth, level, len(level) - 1, []])
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            self.anchors.append(("" if href is None else href, ""))
+            self._captures.append([depth, self.anchors, len(self.anchors) - 1, []])
+        elif tag == "title" and not self._title_seen:
+            self._title_seen = True
+            self._captures.append([depth, None, None, []])
+
+    def handle_startendtag(self, tag, attrs):
+        # <tag/> is opened and closed straight away, just like html.parser soups do
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+        stack = self._stack
+        for i in range(len(stack) - 1, -1, -1):
+            if stack[i] == tag:
+                self._close_from(i)
+                return
+
+    def _close_from(self, depth):
+        for name in self._stack[depth:]:
+            if name in HIDDEN_TEXT_TAGS:
+                self._hidden -= 1
+        del self._stack[depth:]
+
+        captures = self._captures
+        while captures and captures[-1][0] >= depth:
+            _, target, index, pieces = captures.pop()
+            if target is self.anchors:
+                target[index] = (target[index][0], "".join(p.strip() for p in pieces))
+            elif target is not None:
+                target[index] = "".join(pieces)
+            else:
+                self.title = "".join(pieces)
+
+    # ---------- text events ----------
+    def handle_data(self, data):
+        if self._hidden:
+            return
+        self.text.append(data)
+        for capture in self._captures:
+            capture[3].append(data)
+
+    # comments, doctypes, processing instructions and other <![...]> declarations are not visible text
+    def handle_comment(self, data):
+        pass
+
+    def handle_decl(self, decl):
+        pass
+
+    def unknown_decl(self, data):
+        # html.parser soups keep <![CDATA[...]]> as a CData string, which get_text() returns
+        if data.startswith("CDATA["):
+            self.handle_data(data[len("CDATA["):])
+
+    def handle_pi(self, data):
+        pass
+
+    def finish(self):
+        self.close()
+        # Tags still open at the end of the document extend to its end
+        self._close_from(0)
+        headings = []
+        for level in self.headings:
+            headings.extend(level)
+        return Zones(
+            "".join(self.text),
+            self.title or "",
+            self.meta_description or "",
+            headings,
+            self.anchors,
+        )
+
+
+def _stream_zones(html, zones=True):
+    parser = ZoneParser(zones=zones)
+    parser.feed(html)
+    return parser.finish()
+
+
+def _soup_zones(html, parser_name):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, parser_name)
+    title = soup.title.text if soup.title else ""
+
+    meta_description = ""
+    meta_tag = soup.find('meta', attrs={'name': 'description'})
+    if meta_tag and 'content' in meta_tag.attrs:
+        meta_description = meta_tag['content']
+
+    headings = []
+    for i in range(1, 7):
+        for heading in soup.find_all(f'h{i}'):
+            headings.append(heading.text)
+
+    anchors = []
+    for a in soup.find_all('a'):
+        anchors.append((a.get('href', ""), a.get_text(strip=True)))
+
+    return Zones(soup.get_text(), title, meta_description, headings, anchors)
+
+
+BACKENDS = {
+    "stream": _stream_zones,
+    "html.parser": lambda html: _soup_zones(html, 'html.parser'),
+    "lxml": lambda html: _soup_zones(html, 'lxml'),
+}
+
+
+def extract_zones(html, backend=DEFAULT_BACKEND):
+    """Return the Zones record of a page using the given backend."""
+    try:
+        extract = BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown extraction backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    return extract(html)
+
+
+def extract_text(html, backend=DEFAULT_BACKEND):
+    """Return only the visible text of a page (same as soup.get_text() for the soup backends)."""
+    if backend == "stream":
+        return _stream_zones(html, zones=False).text
+    return extract_zones(html, backend).text
@@ -0,0 +1,249 @@
+"""
+Passage store: the text of every document cut into passages of a sentence
+or a few, with the token positions they cover, so a result snippet can be
+made without the raw HTML / paper JSON.
+
+The passages are cut at indexing time (Forward Index Scripts/passage_index.py)
+from the same text and tokenizer the forward index counts positions on, so
+a passage covers the tokens [first_token, last_token) of its document.
+At query time snippet() takes the positions of the query terms from the
+binary forward index (util_scripts/binary_forward_index.py), picks the
+passage with the most distinct query terms (then the most hits, then the
+earliest), and highlights the query words in it. The forward index only
+keeps the first positions of a term, so a document without any of them in
+a passage gets its first passage.
+
+The passage texts of a document are one zstd frame; a snippet is one
+lookup, one small decompression and one tokenization of the passage.
+
+Layout (little endian, every section 8-byte aligned):
+    header          magic, tokenizer (TOKENIZERS index), document slots N,
+                    passages P, text bytes B
+    passage_start   uint64[N]   first passage of document slot i (ABSENT if no document)
+    passage_end     uint64[N]
+    text_offset     uint64[N]   zstd frame with the texts of the document's passages
+    text_size       uint64[N]
+    first_token     uint32[P]   position of the first token of the passage
+    last_token      uint32[P]   position after its last token
+    text_end        uint32[P]   end of the passage's text in its document's texts
+    texts           B bytes
+"""
+
+import mmap
+import os
+import shutil
+import struct
+from array import array
+
+import numpy as np
+import zstandard as zstd
+
+from tokenizer import html_token_spans, html_tokens, paper_token_spans, paper_tokens
+
+MAGIC = b"PSG1"
+HEADER = struct.Struct("<4sIQQQ")
+ABSENT = 0xFFFFFFFFFFFFFFFF
+TOKENIZERS = ("html", "paper")
+
+MIN_PASSAGE_TOKENS = 20     # a passage ends at the first sentence end after this many tokens
+MAX_PASSAGE_TOKENS = 50     # or here, sentence end or not
+SENTENCE_ENDS = ".!?"
+HIGHLIGHT = ("<b>", "</b>")
+
+
+def _padding(size):
+    return b"\0" * (-size % 8)
+
+
+def split_passages(text, spans, first_position):
+    """
+    [(first token position, position after the last token, text)] of the passages of one
+    piece of text whose tokens have the spans `spans` and start at position first_position.
+    """
+    passages = []
+    start = 0
+    for i, (_, end) in enumerate(spans):
+        stop = spans[i + 1][0] if i + 1 < len(spans) else len(text)
+        length = i - start + 1
+        if (length >= MIN_PASSAGE_TOKENS and any(c in text[end:stop] for c in SENTENCE_ENDS)) \
+                or length >= MAX_PASSAGE_TOKENS or i + 1 == len(spans):
+            # The passage runs to the next token, so it keeps its closing punctuation
+            passage_text = " ".join(text[spans[start][0]:stop].split())
+            passages.append((first_position + start, first_position + i + 1, passage_text))
+            start = i + 1
+    return passages
+
+
+class PassageWriter:
+    """
+    Collects the passages of documents in any order and writes the store on
+    close(). The texts are spilled to a temporary file as they come in.
+    """
+
+    def __init__(self, path, tokenizer, level=3):
+        self.path = path
+        self.tokenizer = TOKENIZERS.index(tokenizer)
+        self.tmp_dir = path + ".parts"
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+        os.makedirs(self.tmp_dir)
+        self.texts = open(os.path.join(self.tmp_dir, "texts"), 'wb')
+        self.compressor = zstd.ZstdCompressor(level=level)
+        self.first_token = array('I')
+        self.last_token = array('I')
+        self.text_end = array('I')
+        self.directory = {}     # doc number -> (passage_start, passage_end, text_offset, text_size)
+
+    def add(self, number, passages):
+        """passages: [(first token position, position after the last token, text)] in position order"""
+        if number in self.directory:
+            raise ValueError(f"Document {number} was already added")
+        blob = bytearray()
+        for first, last, text in passages:
+            blob += text.encode('utf-8')
+            self.first_token.append(first)
+            self.last_token.append(last)
+            self.text_end.append(len(blob))
+        frame = self.compressor.compress(bytes(blob))
+        offset = self.texts.tell()
+        self.texts.write(frame)
+        self.directory[number] = (len(self.first_token) - len(passages), len(self.first_token), offset, len(frame))
+
+    def close(self):
+        texts_size = self.texts.tell()
+        self.texts.close()
+
+        slots = max(self.directory, default=-1) + 1
+        columns = [np.full(slots, ABSENT, dtype='<u8') for _ in range(2)] + [np.zeros(slots, dtype='<u8') for _ in range(2)]
+        for number, entry in self.directory.items():
+            for column, value in zip(columns, entry):
+                column[number] = value
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.tokenizer, slots, len(self.first_token), texts_size))
+            f.write(_padding(HEADER.size))
+            for column in columns:
+                f.write(column.tobytes() + _padding(column.nbytes))
+            for column in (self.first_token, self.last_token, self.text_end):
+                data = column.tobytes()
+                f.write(data + _padding(len(data)))
+            with open(os.path.join(self.tmp_dir, "texts"), 'rb') as texts:
+                shutil.copyfileobj(texts, f, 1024 * 1024)
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(self.tmp_dir)
+        return len(self.directory)
+
+
+class PassageStore:
+    """Memory-mapped reader of a file written by PassageWriter."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, tokenizer, slots, passages, texts_size = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a passage store")
+        self.tokenizer = TOKENIZERS[tokenizer]
+        self.slots = slots
+        self.decompressor = zstd.ZstdDecompressor()
+
+        offset = HEADER.size + len(_padding(HEADER.size))
+
+        def section(dtype, count):
+            nonlocal offset
+            view = np.frombuffer(self.mm, dtype=dtype, count=count, offset=offset)
+            offset += view.nbytes + (-view.nbytes % 8)
+            return view
+
+        self.passage_start = section('<u8', slots)
+        self.passage_end = section('<u8', slots)
+        self.text_offset = section('<u8', slots)
+        self.text_size = section('<u8', slots)
+        self.first_token = section('<u4', passages)
+        self.last_token = section('<u4', passages)
+        self.text_end = section('<u4', passages)
+        self.texts_start = offset
+
+    def __contains__(self, number):
+        return 0 <= number < self.slots and self.passage_start[number] != ABSENT
+
+    def __len__(self):
+        return int(np.count_nonzero(self.passage_start != ABSENT))
+
+    def _range(self, number):
+        if number not in self:
+            raise KeyError(number)
+        return int(self.passage_start[number]), int(self.passage_end[number])
+
+    def _texts(self, number):
+        start = self.texts_start + int(self.text_offset[number])
+        return self.decompressor.decompress(self.mm[start:start + int(self.text_size[number])])
+
+    def passages(self, number):
+        """[(first token position, position after the last token, text)] of a document."""
+        start, end = self._range(number)
+        texts = self._texts(number)
+        bounds = [0] + self.text_end[start:end].tolist()
+        return [(int(self.first_token[start + i]), int(self.last_token[start + i]),
+                 texts[bounds[i]:bounds[i + 1]].decode('utf-8')) for i in range(end - start)]
+
+    def best_passage(self, number, term_positions):
+        """Index in passages(number) of the passage with the most of the terms, None for a document without passages."""
+        start, end = self._range(number)
+        if start == end:
+            return None
+        first, last = self.first_token[start:end], self.last_token[start:end]
+        hits = np.zeros(end - start, dtype=np.int64)
+        terms = np.zeros(end - start, dtype=np.int64)
+        for positions in term_positions:
+            positions = np.asarray(positions, dtype=np.int64)
+            slots = np.searchsorted(first, positions, side='right') - 1
+            inside = slots[(slots >= 0) & (positions < last[np.maximum(slots, 0)])]
+            np.add.at(hits, inside, 1)
+            terms[np.unique(inside)] += 1
+        # Most distinct terms, then most hits, then the earliest passage
+        return int(np.lexsort((np.arange(end - start), -hits, -terms))[0])
+
+    def highlight(self, text, words, marks=HIGHLIGHT):
+        """text with every token that is one of `words` wrapped in the marks."""
+        if self.tokenizer == "html":
+            spans, tokens = html_token_spans(text), [token.replace(",", "") for token in html_tokens(text)]
+        else:
+            spans, tokens = paper_token_spans(text), list(paper_tokens(text))
+        pieces, done = [], 0
+        for (start, end), token in zip(spans, tokens):
+            if token in words:
+                pieces.extend((text[done:start], marks[0], text[start:end], marks[1]))
+                done = end
+        pieces.append(text[done:])
+        return "".join(pieces)
+
+    def snippet(self, number, words, forward_index, lexicon, marks=HIGHLIGHT):
+        """
+        The best passage of a document for the query words, highlighted, or "" if it has none.
+        forward_index is the BinaryForwardIndex of the document, lexicon maps words to term ids.
+        """
+        if number not in self:
+            return ""
+        term_positions = []
+        if number in forward_index:
+            for word in set(words):
+                term = lexicon.get(word)
+                if term is not None:
+                    term_positions.append(forward_index.term_positions(number, term))
+        best = self.best_passage(number, term_positions)
+        if best is None:
+            return ""
+        start, _ = self._range(number)
+        texts = self._texts(number)
+        low = int(self.text_end[start + best - 1]) if best else 0
+        text = texts[low:int(self.text_end[start + best])].decode('utf-8')
+        return self.highlight(text, set(words), marks)
+
+    def __getstate__(self):
+        # Pickled as its path, the receiving process maps the file itself
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
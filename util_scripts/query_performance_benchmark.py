@@ -17,10 +17,11 @@ import tracemalloc
 from pathlib import Path
 from statistics import mean, stdev
 from typing import List, Dict, Tuple
-import re
 import math
 from urllib.parse import urlparse
 
+from tokenizer import query_tokens
+
 # Path configuration
 BASE_DIR = Path(__file__).parent.parent
 BARRELS_DIR = BASE_DIR / "Barrels"
@@ -86,16 +87,7 @@ class QueryBenchmark:
     
     def process_query(self, word, rps=True):
         """Process query text"""
-        text = re.sub(r'\n', ' ', word)
-        if rps:
-            text = re.sub(r'(?<!\d)[^\w\s]|[^\w\s](?!\d)', '', text)
-        else:
-            text = re.sub(r'(?<!\d)[^\w\s]|[^\w\s](?!\d)', ' ', text)
-        text = re.sub(r"\s+", " ", text).strip()
-        text = re.sub(r"[,\(\)\[\]\{\}]", "", text)
-        text = text.lower()
-        tokens = text.split(' ')
-        return tokens
+        return query_tokens(word, rps)
     
     def score_html_files(self, hitlist):
         """Simple scoring for HTML files"""
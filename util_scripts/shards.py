@@ -0,0 +1,152 @@
+"""
+Worker-side shard files for the multiprocessing index builders.
+
+Instead of pickling every document's output back to the parent, a worker
+processes a whole chunk of documents, writes the chunk's output to a shard
+file itself and only returns a small manifest entry. The parent coordinates:
+it hands out chunks, keeps the manifest and merges the shards at the end.
+
+A shard (like a SPIMI run) is a msgpack stream of [key, value] records sorted
+by key, written to a temporary name and renamed, so a crashed worker never
+leaves a half shard behind. The merged JSON outputs are written the same way.
+"""
+
+import heapq
+import json
+import os
+
+import msgpack
+import ormsgpack
+from tqdm import tqdm
+
+from checkpoint import atomic_write
+
+REDUCE_FAN_IN = 8       # shards merged by one reduce task of tree_reduce()
+
+
+def chunk_ranges(start, end, chunk_size):
+    """(first_row, end_row) tasks covering rows start .. end - 1."""
+    return [(first, min(first + chunk_size, end)) for first in range(start, end, chunk_size)]
+
+
+def shard_path(shard_dir, first_row):
+    return os.path.join(shard_dir, f"shard_{first_row:09d}.msgpack")
+
+
+def write_shard(path, records):
+    """Write sorted (key, value) records, returns the shard's manifest entry."""
+    count = 0
+    with atomic_write(path, 'wb') as f:
+        for key, value in records:
+            f.write(ormsgpack.packb([key, value]))
+            count += 1
+    return {"path": path, "records": count, "bytes": os.path.getsize(path)}
+
+
+def write_manifest(path, entries):
+    with atomic_write(path, 'w', encoding='utf-8') as f:
+        json.dump({"shards": entries}, f, indent=2)
+
+
+def iter_run(run_path):
+    with open(run_path, 'rb') as f:
+        for key, value in msgpack.Unpacker(f, raw=False, max_buffer_size=0, strict_map_key=False):
+            yield key, value
+
+
+def merge_runs(run_paths):
+    """Yield (key, values) in key order, the value lists concatenated in run order."""
+    return merge_streams([iter_run(path) for path in run_paths])
+
+
+def merge_streams(streams):
+    """merge_runs for any (key, values) iterables sorted by key, e.g. runs that are not files."""
+    streams = [
+        ((key, stream_number, values) for key, values in stream)
+        for stream_number, stream in enumerate(streams)
+    ]
+    current_key, current_values = None, []
+    for key, _, values in heapq.merge(*streams, key=lambda record: record[:2]):
+        if key != current_key:
+            if current_values:
+                yield current_key, current_values
+            current_key, current_values = key, []
+        current_values.extend(values)
+    if current_values:
+        yield current_key, current_values
+
+
+def sum_runs(run_paths):
+    """Yield (key, value) in key order, the values (lists of numbers) of equal keys added up."""
+    current_key, current_value = None, None
+    for key, value in heapq.merge(*(iter_run(path) for path in run_paths), key=lambda record: record[0]):
+        if key != current_key:
+            if current_value is not None:
+                yield current_key, current_value
+            current_key, current_value = key, list(value)
+        else:
+            for i, number in enumerate(value):
+                current_value[i] += number
+    if current_value is not None:
+        yield current_key, current_value
+
+
+def reduce_shards(task):
+    # Reduce: add up the counts of a group of shards into one shard
+    out_path, in_paths = task
+    entry = write_shard(out_path, sum_runs(in_paths))
+    for path in in_paths:
+        os.remove(path)
+    return entry
+
+
+def tree_reduce(pool, shards, shard_dir, next_number, fan_in=REDUCE_FAN_IN):
+    """
+    Add up the shards (see sum_runs) fan_in at a time in the pool until at
+    most one is left, returns the remaining shards. New shards are numbered
+    from next_number on.
+    """
+    level = 0
+    while len(shards) > 1:
+        level += 1
+        tasks = []
+        for start in range(0, len(shards), fan_in):
+            tasks.append((shard_path(shard_dir, next_number), sorted(shards[start:start + fan_in])))
+            next_number += 1
+        shards = [entry["path"] for entry in
+                  tqdm(pool.imap_unordered(reduce_shards, tasks), total=len(tasks), desc=f"Reducing, level {level}")]
+    return shards
+
+
+def write_dense_json(output_path, shard_paths, key_count):
+    """
+    Merge shards keyed by word id into one JSON object with every id from 0 to
+    key_count - 1 (empty list when no shard has it), written one key at a time.
+    """
+    merged = merge_runs(shard_paths)
+    pending = next(merged, None)
+    with atomic_write(output_path, 'w', encoding='utf-8') as out:
+        out.write("{")
+        for key in range(key_count):
+            values = []
+            if pending is not None and pending[0] == key:
+                values = pending[1]
+                pending = next(merged, None)
+            if key:
+                out.write(", ")
+            out.write(f'"{key}": ')
+            json.dump(values, out)
+        out.write("}")
+
+
+def write_json_object(output_path, shard_paths):
+    """Concatenate the records of the shards, in shard order, into one JSON object."""
+    with atomic_write(output_path, 'w', encoding='utf-8') as out:
+        out.write("{")
+        first = True
+        for path in shard_paths:
+            for key, value in iter_run(path):
+                out.write("\n  " if first else ",\n  ")
+                out.write(f"{json.dumps(key, ensure_ascii=False)}: {json.dumps(value, ensure_ascii=False)}")
+                first = False
+        out.write("\n}")
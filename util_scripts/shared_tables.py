@@ -0,0 +1,276 @@
+"""
+Read-only lookup tables that worker processes share instead of copying.
+
+Passing the lexicon, ind_to_url.json or the forward index to a Pool through
+initargs/tasks pickles them into every process, which on a 64 core machine
+means 64 copies of the same dicts. These tables are written once to a file
+and opened with mmap: all processes map the same pages of the OS page cache,
+opening one costs a few syscalls, and nothing is unpickled.
+
+- StringTable: str -> int (e.g. the lexicon), open addressing hash table.
+               A probe costs several times a dict lookup, so every process
+               keeps the MEMO_SIZE most recently found keys in an LRU cache.
+               Keys that are not in the table are never cached, and no
+               process holds a copy of the whole table.
+- StringList:  int -> str (e.g. ind_to_url.json, the inverse lexicon).
+- IntLists:    int -> list of non-negative ints (e.g. forward index rows).
+
+cached_table() builds the table next to its source JSON the first time (or
+when the JSON is newer) and returns its path, workers then open the path.
+The tables pickle as their path, so they can go straight into initargs.
+"""
+
+import json
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from collections import OrderedDict
+
+import ijson
+
+STRING_TABLE_MAGIC = b"STB1"
+STRING_LIST_MAGIC = b"SLS1"
+INT_LISTS_MAGIC = b"ILS1"
+HEADER = struct.Struct("<4sIQ")           # magic, unused, item count
+SLOT = struct.Struct("<IIIq")             # key hash, key offset, key length, value
+EMPTY = 0xFFFFFFFF
+MAX_LOAD = 0.7
+MEMO_SIZE = 1 << 16                       # found keys cached per StringTable per process
+
+
+def _atomic_write(path, chunks):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, path)
+
+
+def _open_mmap(path, magic):
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    found, _, count = HEADER.unpack_from(mm, 0)
+    if found != magic:
+        raise ValueError(f"{path} is not a {magic.decode()} table")
+    return mm, count
+
+
+def _offsets(mm, count):
+    """Native uint64 view of the count + 1 offsets that follow the header."""
+    return memoryview(mm)[HEADER.size:HEADER.size + 8 * (count + 1)].cast('Q')
+
+
+# ------------------ str -> int ------------------
+def build_string_table(path, mapping):
+    count = len(mapping)
+    capacity = 8
+    while capacity * MAX_LOAD < count:
+        capacity *= 2
+    mask = capacity - 1
+
+    slots = bytearray(SLOT.pack(0, 0, EMPTY, 0) * capacity)
+    blob = bytearray()
+    for key, value in mapping.items():
+        key_bytes = key.encode('utf-8')
+        key_hash = zlib.crc32(key_bytes)
+        slot = key_hash & mask
+        while SLOT.unpack_from(slots, slot * SLOT.size)[2] != EMPTY:
+            slot = (slot + 1) & mask
+        SLOT.pack_into(slots, slot * SLOT.size, key_hash, len(blob), len(key_bytes), value)
+        blob += key_bytes
+    _atomic_write(path, [HEADER.pack(STRING_TABLE_MAGIC, 0, count), struct.pack("<Q", capacity), slots, blob])
+
+
+class StringTable:
+    """Memory-mapped str -> int table with the read methods of a dict."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mm, self.count = _open_mmap(path, STRING_TABLE_MAGIC)
+        capacity = struct.unpack_from("<Q", self.mm, HEADER.size)[0]
+        self.mask = capacity - 1
+        self.slots_start = HEADER.size + 8
+        self.blob_start = self.slots_start + capacity * SLOT.size
+        self.memo = OrderedDict()       # LRU cache of found keys in this process, oldest first
+
+    def get(self, key, default=None):
+        value = self.memo.get(key)
+        if value is not None:
+            self.memo.move_to_end(key)
+            return value
+        value = self._probe(key)
+        if value is None:
+            return default
+        self.memo[key] = value
+        if len(self.memo) > MEMO_SIZE:
+            self.memo.popitem(last=False)
+        return value
+
+    def _probe(self, key):
+        key_bytes = key.encode('utf-8')
+        key_hash = zlib.crc32(key_bytes)
+        slot = key_hash & self.mask
+        while True:
+            slot_hash, offset, length, value = SLOT.unpack_from(self.mm, self.slots_start + slot * SLOT.size)
+            if length == EMPTY:
+                return None
+            if slot_hash == key_hash and length == len(key_bytes):
+                start = self.blob_start + offset
+                if self.mm[start:start + length] == key_bytes:
+                    return value
+            slot = (slot + 1) & self.mask
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        # Pickled as its path, the receiving process maps the file itself
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+# ------------------ int -> str ------------------
+def build_string_list(path, strings):
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for text in strings:
+        blob += (text or "").encode('utf-8')
+        offsets.append(len(blob))
+    _atomic_write(path, [HEADER.pack(STRING_LIST_MAGIC, 0, len(offsets) - 1), offsets.tobytes(), blob])
+
+
+class StringList:
+    """Memory-mapped list of strings; also takes digit strings as keys like ind_to_url.json."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mm, self.count = _open_mmap(path, STRING_LIST_MAGIC)
+        self.offsets = _offsets(self.mm, self.count)
+        self.blob_start = HEADER.size + 8 * (self.count + 1)
+
+    def __getitem__(self, index):
+        index = int(index)
+        if not 0 <= index < self.count:
+            raise KeyError(index)
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.mm[self.blob_start + start:self.blob_start + end].decode('utf-8')
+
+    def get(self, index, default=None):
+        try:
+            return self[index]
+        except (KeyError, ValueError):
+            return default
+
+    def __contains__(self, index):
+        return self.get(index) is not None
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+# ------------------ int -> [int, ...] ------------------
+def build_int_lists(path, lists):
+    offsets = array('Q', [0])
+    data = array('I')
+    for values in lists:
+        data.extend(values)
+        offsets.append(len(data))
+    _atomic_write(path, [HEADER.pack(INT_LISTS_MAGIC, 0, len(offsets) - 1), offsets.tobytes(), data.tobytes()])
+
+
+class IntLists:
+    """Memory-mapped ragged lists of uint32."""
+
+    def __init__(self, path):
+        self.path = path
+        self.mm, self.count = _open_mmap(path, INT_LISTS_MAGIC)
+        self.offsets = _offsets(self.mm, self.count)
+        self.data = memoryview(self.mm)[HEADER.size + 8 * (self.count + 1):].cast('I')
+
+    def __getitem__(self, index):
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tolist()
+
+    def __len__(self):
+        return self.count
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+# ------------------ Tables built from the JSON files ------------------
+def _is_stale(table_path, source_path):
+    return not os.path.exists(table_path) or os.path.getmtime(table_path) < os.path.getmtime(source_path)
+
+
+def cached_table(source_path, table_path, build):
+    """Run build(table_path, source_data) unless table_path is newer than source_path."""
+    if _is_stale(table_path, source_path):
+        with open(source_path, 'r', encoding='utf-8') as f:
+            build(table_path, json.load(f))
+    return table_path
+
+
+def lexicon_tables(lexicon_path):
+    """Paths of the word -> id table and the id -> word list of a lexicon JSON file."""
+    base = os.path.splitext(lexicon_path)[0]
+
+    def build_inverse(path, lexicon):
+        words = [""] * len(lexicon)
+        for word, word_id in lexicon.items():
+            words[word_id] = word
+        build_string_list(path, words)
+
+    return (cached_table(lexicon_path, base + ".table", build_string_table),
+            cached_table(lexicon_path, base + "_inverse.table", build_inverse))
+
+
+def url_table(ind_to_url_path):
+    """Path of the id -> URL list of ind_to_url.json (ids "0" ... "n-1", gaps map to "")."""
+    def build(path, ind_to_url):
+        count = max(map(int, ind_to_url), default=-1) + 1
+        build_string_list(path, (ind_to_url.get(str(i), "") for i in range(count)))
+
+    return cached_table(ind_to_url_path, os.path.splitext(ind_to_url_path)[0] + ".table", build)
+
+
+def forward_index_tables(forward_index_path):
+    """
+    Paths of the file id list and the word id rows of a forward index JSON file.
+    Row i holds the word ids of file id i of the list, in the order of the JSON.
+    """
+    base = os.path.splitext(forward_index_path)[0]
+    ids_path, rows_path = base + "_ids.table", base + "_rows.table"
+    if _is_stale(ids_path, forward_index_path) or _is_stale(rows_path, forward_index_path):
+        file_ids = []
+
+        def rows():
+            with open(forward_index_path, 'rb') as f:
+                for file_id, word_ids in ijson.kvitems(f, ''):
+                    file_ids.append(file_id)
+                    yield word_ids
+
+        build_int_lists(rows_path, rows())
+        build_string_list(ids_path, file_ids)
+    return ids_path, rows_path
@@ -0,0 +1,164 @@
+"""
+Fixed-memory summaries of a token stream.
+
+- CountMinSketch: approximate counts of every item. An estimate is never
+  below the true count and above it by at most e / width * (total count) with
+  probability 1 - e^-depth. The table has a fixed size however many distinct
+  items the stream has, and two sketches of the same shape merge by adding
+  their tables, so workers can sketch parts of a corpus independently.
+- HeavyHitters: the k most frequent items (Misra-Gries, mergeable). Counts
+  are never above the true count and below it by at most total / (k + 1).
+- MinHash / MinHashLSH: fixed-size signatures of sets of shingles whose
+  agreement estimates the Jaccard similarity of the sets, and a banded index
+  of them that finds the sets similar to a query without comparing it to all
+  of them. With b bands of r rows two sets of similarity s share a band with
+  probability 1 - (1 - s^r)^b.
+
+Items are hashed with blake2b (shingles with crc32), so sketches built in
+different processes (or runs) agree.
+"""
+
+import hashlib
+import zlib
+
+import numpy as np
+
+
+def hash_rows(items, depth, width):
+    """(depth, len(items)) array with the column of every item in every row of a table."""
+    digests = b"".join(hashlib.blake2b(item.encode('utf-8'), digest_size=4 * depth).digest() for item in items)
+    columns = np.frombuffer(digests, dtype='<u4').reshape(-1, depth).T
+    return (columns % width).astype(np.int64)
+
+
+class CountMinSketch:
+    def __init__(self, width=2 ** 21, depth=4, table=None):
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.uint64) if table is None else table
+
+    def add(self, items, counts):
+        """Add counts[i] to items[i] (a batch of items at once)."""
+        if items:
+            self.add_hashed(hash_rows(items, self.depth, self.width), counts)
+
+    def add_hashed(self, columns, counts):
+        """add() with columns already computed by hash_rows(), e.g. in a worker."""
+        counts = np.asarray(counts, dtype=np.uint64)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], counts)
+
+    def estimate(self, items):
+        """Estimated counts of a batch of items."""
+        if not items:
+            return np.zeros(0, dtype=np.uint64)
+        columns = hash_rows(items, self.depth, self.width)
+        return np.min(self.table[np.arange(self.depth)[:, None], columns], axis=0)
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Only sketches of the same shape can be merged")
+        self.table += other.table
+
+    def total(self):
+        return int(self.table[0].sum())
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.save(f, self.table)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a saved sketch; memory-mapped by default so processes share the table."""
+        table = np.load(path, mmap_mode='r' if mmap else None)
+        return cls(width=table.shape[1], depth=table.shape[0], table=table)
+
+
+class HeavyHitters:
+    def __init__(self, k=1000):
+        self.k = k
+        self.counts = {}
+
+    def update(self, counts):
+        """Add a batch of {item: count} (another summary's counts merge the same way)."""
+        for item, count in counts.items():
+            self.counts[item] = self.counts.get(item, 0) + count
+        if len(self.counts) > self.k:
+            # Misra-Gries: take the (k + 1)-th largest count off every counter
+            cut = sorted(self.counts.values(), reverse=True)[self.k]
+            self.counts = {item: count - cut for item, count in self.counts.items() if count > cut}
+
+    def merge(self, other):
+        self.update(other.counts)
+
+    def top(self, n=None):
+        """[(item, count)] most frequent first."""
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+
+def shingles(text, k=3):
+    """Set of the k character shingles of text (the text itself if it is shorter)."""
+    if len(text) <= k:
+        return {text} if text else set()
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+class MinHash:
+    """num_perm hash functions (a * x + b) mod a Mersenne prime over crc32 shingle hashes."""
+
+    PRIME = (1 << 31) - 1     # a * x + b of x, a, b below it fits in 64 bits
+
+    def __init__(self, num_perm=128, seed=1):
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, self.PRIME, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, self.PRIME, size=num_perm).astype(np.uint64)
+        self.num_perm = num_perm
+
+    def signatures(self, shingle_sets):
+        """(len(shingle_sets), num_perm) uint64 signatures, all sets at once. The sets must not be empty."""
+        lengths = np.fromiter((len(shingle_set) for shingle_set in shingle_sets), dtype=np.int64, count=len(shingle_sets))
+        if not len(lengths):
+            return np.zeros((0, self.num_perm), dtype=np.uint64)
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle_set in shingle_sets for shingle in shingle_set),
+                             dtype=np.uint64, count=int(lengths.sum())) % np.uint64(self.PRIME)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % np.uint64(self.PRIME)
+        starts = np.cumsum(lengths) - lengths
+        return np.minimum.reduceat(permuted, starts, axis=1).T
+
+
+class MinHashLSH:
+    """Banded index of MinHash signatures: the candidates of a query share at least one band with it."""
+
+    def __init__(self, signatures, bands=16):
+        num_perm = signatures.shape[1]
+        if num_perm % bands:
+            raise ValueError("The signature length must be a multiple of the bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.RandomState(0)
+        self.mixers = rng.randint(1, 1 << 62, size=self.rows, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+        # One sorted key column per band, with the signature of every key
+        keys = self.band_keys(signatures).T
+        self.order = np.argsort(keys, axis=1, kind='stable')
+        self.keys = np.take_along_axis(keys, self.order, axis=1)
+
+    def band_keys(self, signatures):
+        """(len(signatures), bands) one 64 bit key per band of every signature."""
+        banded = signatures.reshape(len(signatures), self.bands, self.rows)
+        with np.errstate(over='ignore'):
+            return (banded * self.mixers).sum(axis=2, dtype=np.uint64)
+
+    def query(self, signatures):
+        """For every signature the sorted indexes of the indexed signatures sharing a band with it."""
+        keys = self.band_keys(signatures)
+        lows = np.stack([np.searchsorted(self.keys[band], keys[:, band], side='left') for band in range(self.bands)], axis=1)
+        highs = np.stack([np.searchsorted(self.keys[band], keys[:, band], side='right') for band in range(self.bands)], axis=1)
+        candidates = []
+        for query_lows, query_highs in zip(lows.tolist(), highs.tolist()):
+            found = [self.order[band, low:high] for band, (low, high) in enumerate(zip(query_lows, query_highs)) if low < high]
+            candidates.append(np.unique(np.concatenate(found)) if found else np.zeros(0, dtype=np.int64))
+        return candidates
@@ -0,0 +1,85 @@
+"""
+Shared tokenizer for pages, papers and queries.
+
+Each mode keeps the exact output of the code it replaces, but runs on
+precompiled patterns and whole-string str methods instead of several re.sub
+passes or a per-character Python loop:
+
+    html_tokens(text)         -> the page rules of lexicon_gen.py / forward_index.py / inverted_index.py
+                                 (punctuation becomes a space unless it sits between two digits,
+                                 lowercased, split on whitespace; an empty text gives one "" token)
+    paper_tokens(text)        -> the CORD-19 rules of JSONinvertedIndex.py / jsonParser.cpp
+                                 (runs of ASCII letters/digits or any non-ASCII character, lowercased
+                                 one character at a time)
+    query_tokens(text, rps)   -> process_query() of the ranking notebook and query benchmark
+
+html_token_spans / paper_token_spans give the (start, end) of the same tokens
+in the original text, e.g. to cut and highlight passages (util_scripts/passage_store.py).
+
+html_tokens and paper_tokens are generators so callers can stream a document
+section by section. util_scripts/tokenizer_benchmark.py checks them against
+the old implementations and times both.
+"""
+
+import re
+
+# A punctuation character that is not squeezed between two digits ("3.5" and "1,000" survive).
+# Equivalent to (?<!\d)[^\w\s]|[^\w\s](?!\d), but starts with the character class so the
+# engine only runs the lookarounds on punctuation instead of on every position.
+_PUNCT_RE = re.compile(r'[^\w\s](?:(?!\d)|(?<!\d.))', re.S)
+
+# Characters kept by the C++ lexicon logic: isalnum(c) || c >= 128
+_PAPER_TOKEN_RE = re.compile('[0-9A-Za-z\u0080-\U0010ffff]+')
+
+_NON_SPACE_RE = re.compile(r'\S+')
+
+_QUERY_BRACKETS_RE = re.compile(r"[,\(\)\[\]\{\}]")
+
+_CAPITAL_SIGMA = "Σ"
+
+
+def html_tokens(text):
+    """Yield the tokens of page text."""
+    tokens = _PUNCT_RE.sub(' ', text).lower().split()
+    if not tokens:
+        # ''.split(' ') gave [''] in the old code, keep the same doc lengths
+        yield ''
+        return
+    yield from tokens
+
+
+def paper_tokens(text):
+    """Yield the tokens of a paper section; anything that is not a string has none."""
+    if not isinstance(text, str):
+        return
+    if _CAPITAL_SIGMA not in text:
+        yield from _PAPER_TOKEN_RE.findall(text.lower())
+        return
+    # str.lower() turns a word-final capital sigma into a final sigma, while the old
+    # per-character lowering always gave a normal sigma
+    for token in _PAPER_TOKEN_RE.findall(text):
+        if _CAPITAL_SIGMA in token:
+            yield ''.join([c.lower() for c in token])
+        else:
+            yield token.lower()
+
+
+def html_token_spans(text):
+    """(start, end) in text of every token of html_tokens(text), none for a text without tokens."""
+    # The punctuation is replaced one character for one, so the offsets stay those of text
+    return [match.span() for match in _NON_SPACE_RE.finditer(_PUNCT_RE.sub(' ', text))]
+
+
+def paper_token_spans(text):
+    """(start, end) in text of every token of paper_tokens(text)."""
+    if not isinstance(text, str):
+        return []
+    # Lowering never moves a token boundary, both cases of a letter are in the pattern
+    return [match.span() for match in _PAPER_TOKEN_RE.finditer(text)]
+
+
+def query_tokens(text, rps=True):
+    """Tokenize a search query. rps=True drops punctuation instead of splitting on it."""
+    text = _PUNCT_RE.sub('' if rps else ' ', text)
+    tokens = _QUERY_BRACKETS_RE.sub('', text).lower().split()
+    return tokens if tokens else ['']
@@ -0,0 +1,127 @@
+"""
+Tokenizer Benchmark
+===================
+Compares the shared tokenizer with the implementations it replaced:
+- html mode  vs the three re.sub passes of the HTML index scripts
+- paper mode vs the per-character loop of JSONinvertedIndex.py
+- query mode vs process_query() of the ranking notebook
+Every mode is first checked for identical output on the sample data.
+
+Usage: python tokenizer_benchmark.py [runs]
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+from html_extractor import extract_text
+from tokenizer import html_tokens, paper_tokens, query_tokens
+
+BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HTML_DIR = os.path.join(BASE_DIR, "Data", "Files", "raw", "sample")
+PAPERS_DIR = os.path.join(BASE_DIR, "Data", "Cord 19", "document_parses", "pdf_json", "sample")
+
+
+# ------------------ Old implementations ------------------
+def legacy_html_tokens(text):
+    text = re.sub(r'\n', ' ', text)
+    text = re.sub(r'(?<!\d)[^\w\s]|[^\w\s](?!\d)', ' ', text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.lower().split(' ')
+
+
+def legacy_paper_tokens(text):
+    if not isinstance(text, str):
+        return []
+    tokens = []
+    word = []
+    for c in text:
+        if c.isalnum() or ord(c) >= 128:
+            word.append(c.lower())
+        else:
+            if word:
+                tokens.append(''.join(word))
+                word = []
+    if word:
+        tokens.append(''.join(word))
+    return tokens
+
+
+def legacy_query_tokens(word, rps=True):
+    text = re.sub(r'\n', ' ', word)
+    if rps:
+        text = re.sub(r'(?<!\d)[^\w\s]|[^\w\s](?!\d)', '', text)
+    else:
+        text = re.sub(r'(?<!\d)[^\w\s]|[^\w\s](?!\d)', ' ', text)
+    text = re.sub(r"\s+", " ", text).strip()
+    text = re.sub(r"[,\(\)\[\]\{\}]", "", text)
+    text = text.lower()
+    return text.split(' ')
+
+
+# ------------------ Sample data ------------------
+def load_page_texts():
+    texts = []
+    for filename in sorted(os.listdir(HTML_DIR)):
+        if filename.endswith('.html'):
+            with open(os.path.join(HTML_DIR, filename), 'r', encoding='utf-8') as f:
+                texts.append(extract_text(f.read()))
+    return texts
+
+
+def load_paper_sections():
+    sections = []
+    for filename in sorted(os.listdir(PAPERS_DIR)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(PAPERS_DIR, filename), 'r', encoding='utf-8') as f:
+            doc = json.load(f)
+        sections.append(doc.get("metadata", {}).get("title", ""))
+        for key in ("abstract", "body_text", "back_matter"):
+            sections.extend(item.get("text", "") for item in doc.get(key, []))
+        sections.extend(ref.get("title", "") for ref in doc.get("bib_entries", {}).values())
+    return sections
+
+
+def time_mode(name, texts, old, new, runs):
+    for text in texts:
+        if list(new(text)) != list(old(text)):
+            raise AssertionError(f"{name}: output differs for {text[:60]!r}")
+
+    total_mb = sum(len(text.encode('utf-8')) for text in texts) / (1024 * 1024)
+    timings = {}
+    for label, fn in (("old", old), ("new", new)):
+        best = float('inf')
+        for _ in range(runs):
+            start = time.perf_counter()
+            for text in texts:
+                for _ in fn(text):
+                    pass
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best
+        print(f"{name:6s} {label}: {best:7.3f}s | {total_mb / best:7.2f} MB/s")
+    print(f"{name:6s} speedup: {timings['old'] / timings['new']:.2f}x (identical output on {len(texts)} texts)")
+    return timings
+
+
+def run_benchmark(runs=3):
+    print("=" * 80)
+    print("TOKENIZER BENCHMARK")
+    print("=" * 80)
+    pages = load_page_texts()
+    sections = load_paper_sections()
+    queries = [line for text in pages for line in text.splitlines() if line.strip()][:20000]
+
+    results = {
+        "html": time_mode("html", pages, legacy_html_tokens, html_tokens, runs),
+        "paper": time_mode("paper", sections, legacy_paper_tokens, paper_tokens, runs),
+        "query": time_mode("query", queries, legacy_query_tokens, query_tokens, runs),
+    }
+    print("=" * 80)
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 3)
@@ -0,0 +1,87 @@
+"""
+Tombstone bitmaps for deleted documents.
+
+One bit per internal document number (see doc_ids.py). A set bit means the
+document was deleted or replaced by a newer version, so its postings must be
+skipped. Looking a number up is one byte index and a shift. Postings carry
+string ids, so live_postings tests them against the set of deleted ids
+instead of parsing every id, and returns the list untouched when nothing is
+deleted. Files are the raw bytes of the bitmap and are written atomically.
+"""
+
+import os
+
+from doc_ids import doc_id
+
+
+def posting_doc_id(posting):
+    """Document id of a posting: [document_id, ...] list or, for the full build's pages, a dict."""
+    return posting["document_id"] if isinstance(posting, dict) else posting[0]
+
+
+class TombstoneBitmap:
+    def __init__(self, data=b""):
+        self.bits = bytearray(data)
+        self._deleted_ids = None    # string ids of the set bits, built on the first live_postings
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls(f.read())
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.bits)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def add(self, number):
+        byte = number >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << (number & 7)
+        self._deleted_ids = None
+
+    def __contains__(self, number):
+        byte = number >> 3
+        return byte < len(self.bits) and (self.bits[byte] >> (number & 7)) & 1 == 1
+
+    def __len__(self):
+        return bin(int.from_bytes(self.bits, 'little')).count('1')
+
+    def __bool__(self):
+        return any(self.bits)
+
+    def update(self, other):
+        """Set every bit that is set in `other`."""
+        if len(other.bits) > len(self.bits):
+            self.bits.extend(bytes(len(other.bits) - len(self.bits)))
+        for i, byte in enumerate(other.bits):
+            self.bits[i] |= byte
+        self._deleted_ids = None
+
+    def difference(self, other):
+        """Bits set here but not in `other`, as a new bitmap."""
+        result = TombstoneBitmap(self.bits)
+        for i in range(min(len(self.bits), len(other.bits))):
+            result.bits[i] &= ~other.bits[i] & 0xFF
+        return result
+
+    def numbers(self):
+        """Set bits, ascending."""
+        for i, byte in enumerate(self.bits):
+            if byte:
+                for bit in range(8):
+                    if (byte >> bit) & 1:
+                        yield (i << 3) | bit
+
+    def live_postings(self, postings):
+        """Postings of documents that are not deleted."""
+        if self._deleted_ids is None:
+            self._deleted_ids = frozenset(doc_id(number) for number in self.numbers())
+        deleted = self._deleted_ids
+        if not deleted:
+            return postings
+        return [posting for posting in postings if posting_doc_id(posting) not in deleted]